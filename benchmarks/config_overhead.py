@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the configuration work done on every /analyze request.
+
+"before" replays the original pattern where each config helper re-parsed
+config.yaml (4 parses per request plus template.format); "after" calls the
+memoized helpers from src.utils.config.
+
+Usage:
+    python -m benchmarks.config_overhead --requests 500
+"""
+import argparse
+import time
+
+from src.utils.config import (
+    load_config,
+    get_gemini_config,
+    get_minigpt_checkpoint,
+    get_model_config,
+    get_system_prompt
+)
+
+TEMPLATE = "Radiologie"
+LANGUAGE = "English"
+
+
+def request_before() -> None:
+    # process_images -> get_minigpt_checkpoint -> get_checkpoints_dir: two parses
+    load_config()
+    load_config()
+    # generate_medical_report -> get_gemini_config + get_system_prompts: two parses
+    load_config()['api']['gemini']
+    templates = load_config()['system_prompts']
+    templates.get(TEMPLATE, templates["General Medical Analysis"]).format(language=LANGUAGE)
+
+
+def request_after() -> None:
+    get_model_config()
+    get_minigpt_checkpoint()
+    get_gemini_config()
+    get_system_prompt(TEMPLATE, LANGUAGE)
+
+
+def measure(func, requests: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(requests):
+        func()
+    return (time.perf_counter() - start) / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="simulated requests per variant")
+    args = parser.parse_args()
+
+    before = measure(request_before, args.requests)
+    after = measure(request_after, args.requests)
+    print(f"before: {before * 1e6:10.1f} us/request")
+    print(f"after:  {after * 1e6:10.1f} us/request")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+"""
+End-to-end load benchmark of the FastAPI service.
+
+Starts the Gemini stub (benchmarks.gemini_stub) and the application under
+uvicorn, each in its own process, with a temporary copy of config.yaml that
+points api.gemini.base_url at the stub, keeps sessions, job results and the
+similar-study index in a temporary directory and, unless --keep-caches is
+given, disables the report and embedding caches. With --tiny-clip a randomly initialised one-layer CLIP
+vision encoder and an empty checkpoint are generated so the run needs no
+network access and no MiniGPT-Med weights.
+
+A request corpus is then replayed against --endpoint, either open loop at a
+fixed --rps (latency is measured from the scheduled send time, so a slow
+server is not hidden by a slower client) or closed loop with --concurrency
+requests in flight. The corpus is a JSONL file, one request per line:
+
+    {"images": ["data/samples/chest.png"], "fields": {"exam_type": "X-ray"}}
+
+or, without --corpus, seeded synthetic PNG images.
+
+The JSON results hold the client-side latency percentiles, throughput and
+errors, per-stage p50/p95/p99 interpolated from the medvision_stage_seconds
+histogram (scraped from /metrics before and after the run), and the peak RSS
+of the server process and its children (e.g. vision workers). Stages share
+one process, so peak RSS is reported per process rather than per stage. The
+stub's counters (inline and cached prompt characters) and the server's
+prompt cache stats are included, to compare runs with and without
+--no-prompt-cache.
+
+Usage:
+    python -m benchmarks.e2e_load --tiny-clip --concurrency 4 --requests 200 --output results.json
+    python -m benchmarks.e2e_load --tiny-clip --endpoint /analyze/stream --rps 5 --duration 60
+    python -m benchmarks.e2e_load --corpus corpus.jsonl --endpoint /jobs --concurrency 8 --stub-error-rate 0.05
+    python -m benchmarks.e2e_load --tiny-clip --stub-latency-per-kchar-ms 40 --no-prompt-cache
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+STAGE_METRIC = "medvision_stage_seconds"
+
+DEFAULT_FIELDS = {
+    "patient_name": "Benchmark Patient",
+    "patient_age": "42",
+    "patient_gender": "F",
+    "exam_type": "X-ray",
+    "language": "en",
+    "prompt_template": "General Medical Analysis",
+    "clinical_context": "Load test request"
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile (q in [0, 100]) of unsorted values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/mean/max of latencies in seconds, reported in milliseconds"""
+    def ms(value):
+        return None if value is None else value * 1000
+
+    return {
+        "count": len(values),
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "max_ms": ms(max(values)) if values else None
+    }
+
+
+def create_tiny_clip(directory: Path) -> str:
+    """Save a randomly initialised one-layer CLIP vision encoder and its processor"""
+    import torch
+    from transformers import CLIPImageProcessor, CLIPVisionConfig, CLIPVisionModel
+
+    torch.manual_seed(0)
+    config = CLIPVisionConfig(
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        image_size=224,
+        patch_size=32
+    )
+    CLIPVisionModel(config).save_pretrained(directory)
+    CLIPImageProcessor(size={"shortest_edge": 224}, crop_size={"height": 224, "width": 224}).save_pretrained(directory)
+    return str(directory)
+
+
+def write_config(args: argparse.Namespace, workdir: Path, stub_port: int) -> Path:
+    """Write the benchmark configuration derived from config.yaml"""
+    with open(ROOT / "config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    model = config.setdefault("model", {})
+    model["device"] = args.device
+    model["warmup"] = True
+    if args.tiny_clip:
+        model["clip_model"] = create_tiny_clip(workdir / "tiny-clip")
+        import torch
+        torch.save({"model": {}}, workdir / "checkpoints" / "minigpt-med.pth")
+        config["project"]["checkpoints_dir"] = str(workdir / "checkpoints")
+        config["project"]["minigpt_checkpoint"] = "minigpt-med.pth"
+    elif args.clip_model:
+        model["clip_model"] = args.clip_model
+    if args.checkpoint:
+        checkpoint = Path(args.checkpoint).resolve()
+        config["project"]["checkpoints_dir"] = str(checkpoint.parent)
+        config["project"]["minigpt_checkpoint"] = checkpoint.name
+
+    config["api"]["gemini"]["base_url"] = f"http://127.0.0.1:{stub_port}/v1beta/models"
+    if not args.keep_caches:
+        config.setdefault("report_cache", {})["enabled"] = False
+        model.setdefault("embedding_cache", {})["enabled"] = False
+    if args.no_prompt_cache:
+        config.setdefault("prompt_cache", {})["enabled"] = False
+    config["sessions"] = {
+        "db_path": str(workdir / "sessions.sqlite3"),
+        "blob_dir": str(workdir / "blobs"),
+        "legacy_dir": str(workdir / "legacy_sessions")
+    }
+    config.setdefault("similarity", {})["index_dir"] = str(workdir / "similarity")
+    config.setdefault("logging", {})["level"] = args.log_level
+
+    path = workdir / "config.yaml"
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+def load_corpus(args: argparse.Namespace) -> List[Tuple[List[Tuple[str, bytes]], Dict[str, str]]]:
+    """
+    Load the request corpus
+
+    Returns:
+        List of (files as (name, bytes), form fields)
+    """
+    corpus = []
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                files = []
+                for image_path in entry["images"]:
+                    path = Path(image_path)
+                    if not path.is_absolute():
+                        path = Path(args.corpus).resolve().parent / path
+                    files.append((path.name, path.read_bytes()))
+                corpus.append((files, {**DEFAULT_FIELDS, **entry.get("fields", {})}))
+        return corpus
+
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(args.seed)
+    for i in range(args.distinct):
+        files = []
+        for j in range(args.images_per_request):
+            pixels = rng.integers(0, 256, (args.image_size, args.image_size, 3), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, format="PNG")
+            files.append((f"synthetic-{i}-{j}.png", buffer.getvalue()))
+        corpus.append((files, dict(DEFAULT_FIELDS)))
+    return corpus
+
+
+def parse_stage_histogram(text: str) -> Dict[str, Dict[float, float]]:
+    """Cumulative bucket counts per stage from a /metrics scrape"""
+    stages: Dict[str, Dict[float, float]] = {}
+    for line in text.splitlines():
+        if not line.startswith(f"{STAGE_METRIC}_bucket{{"):
+            continue
+        labels, value = line[len(STAGE_METRIC) + 8:].rsplit("} ", 1)
+        fields = dict(part.split("=", 1) for part in labels.split(","))
+        stage = fields["stage"].strip('"')
+        bound = fields["le"].strip('"')
+        stages.setdefault(stage, {})[float("inf") if bound == "+Inf" else float(bound)] = float(value)
+    return stages
+
+
+def histogram_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Quantile of cumulative buckets, linearly interpolated inside the bucket (as Prometheus does)"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if total <= 0:
+        return None
+    target = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (target - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def parse_stage_errors(text: str) -> Dict[str, float]:
+    """Failure counts per stage from a /metrics scrape"""
+    errors = {}
+    prefix = 'medvision_stage_errors_total{stage="'
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            stage, value = line[len(prefix):].rsplit('"} ', 1)
+            errors[stage] = float(value)
+    return errors
+
+
+def stage_summary(before: str, after: str) -> Dict[str, Dict[str, Optional[float]]]:
+    """Per-stage percentiles and failures of the observations made between two scrapes"""
+    start, end = parse_stage_histogram(before), parse_stage_histogram(after)
+    errors_start, errors_end = parse_stage_errors(before), parse_stage_errors(after)
+    summary = {}
+    for stage, buckets in sorted(end.items()):
+        delta = {bound: count - start.get(stage, {}).get(bound, 0.0) for bound, count in buckets.items()}
+        count = delta.get(float("inf"), 0.0)
+        if count <= 0:
+            continue
+        summary[stage] = {
+            "count": int(count),
+            "p50_ms": histogram_quantile(delta, 0.50) * 1000,
+            "p95_ms": histogram_quantile(delta, 0.95) * 1000,
+            "p99_ms": histogram_quantile(delta, 0.99) * 1000,
+            "errors": int(errors_end.get(stage, 0.0) - errors_start.get(stage, 0.0))
+        }
+    return summary
+
+
+def process_memory(pid: int) -> Dict[str, Any]:
+    """Peak and current RSS (MB) of a process and of its live children, from /proc"""
+    def status(process_id: int) -> Dict[str, float]:
+        values = {}
+        try:
+            with open(f"/proc/{process_id}/status", "r") as f:
+                for line in f:
+                    name, _, rest = line.partition(":")
+                    if name in ("VmHWM", "VmRSS"):
+                        values[name] = int(rest.split()[0]) / 1024
+        except OSError:
+            pass
+        return values
+
+    def children(process_id: int) -> List[int]:
+        try:
+            with open(f"/proc/{process_id}/task/{process_id}/children", "r") as f:
+                return [int(child) for child in f.read().split()]
+        except OSError:
+            return []
+
+    server = status(pid)
+    return {
+        "peak_rss_mb": server.get("VmHWM"),
+        "rss_mb": server.get("VmRSS"),
+        "children": {str(child): status(child).get("VmHWM") for child in children(pid)}
+    }
+
+
+def report_error(body: Dict[str, Any]) -> Optional[str]:
+    # Failed reports come back with status 200, as an error field or an error text instead of HTML
+    report = body.get("report", "")
+    return body.get("error") or (report if report.startswith("Error") else None)
+
+
+async def send(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    endpoint: str,
+    request: Tuple[List[Tuple[str, bytes]], Dict[str, str]],
+    job_wait: float
+) -> Dict[str, Any]:
+    """Send one request and wait for its report; returns status, error and time to first byte"""
+    files, fields = request
+    form = aiohttp.FormData()
+    for name, value in fields.items():
+        form.add_field(name, value)
+    for name, data in files:
+        form.add_field("images", data, filename=name, content_type="application/octet-stream")
+
+    start = time.perf_counter()
+    async with session.post(f"{base_url}{endpoint}", data=form) as response:
+        if endpoint == "/analyze/stream":
+            first_chunk = None
+            error = None
+            event = None
+            async for line in response.content:
+                line = line.decode().strip()
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    if event == "chunk" and first_chunk is None:
+                        first_chunk = time.perf_counter() - start
+                elif line.startswith("data:") and event == "error":
+                    error = json.loads(line[5:]).get("error")
+            return {"status": response.status, "error": error, "first_chunk": first_chunk}
+
+        body = await response.json(content_type=None)
+        if endpoint != "/jobs" or response.status != 202:
+            error = report_error(body) if response.status == 200 else body.get("detail", body)
+            return {"status": response.status, "error": error}
+
+    job_id = body["job_id"]
+    while True:
+        async with session.get(f"{base_url}/jobs/{job_id}", params={"wait": str(job_wait)}) as response:
+            body = await response.json()
+        if body.get("status") in ("done", "failed"):
+            return {"status": 200, "error": body.get("error") or report_error(body.get("result") or {})}
+
+
+async def replay(args: argparse.Namespace, base_url: str, corpus: list) -> Dict[str, Any]:
+    """Replay the corpus open loop (--rps) or closed loop (--concurrency)"""
+    latencies: List[float] = []
+    first_chunks: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    succeeded = 0
+    rng = random.Random(args.seed)
+
+    total = args.requests
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    order = iter(range(sys.maxsize))
+
+    def next_request():
+        index = next(order)
+        return corpus[rng.randrange(len(corpus))] if args.shuffle else corpus[index % len(corpus)]
+
+    async def one(session, request, scheduled):
+        nonlocal succeeded
+        try:
+            outcome = await send(session, base_url, args.endpoint, request, args.job_wait)
+        except Exception as e:
+            outcome = {"status": "exception", "error": type(e).__name__}
+        latencies.append(time.perf_counter() - scheduled)
+        statuses[str(outcome["status"])] = statuses.get(str(outcome["status"]), 0) + 1
+        if outcome["status"] == 200 and not outcome.get("error"):
+            succeeded += 1
+        elif outcome.get("error"):
+            key = str(outcome["error"])[:120]
+            errors[key] = errors.get(key, 0) + 1
+        if outcome.get("first_chunk") is not None:
+            first_chunks.append(outcome["first_chunk"])
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for request in corpus[:args.warmup_requests]:
+            await send(session, base_url, args.endpoint, request, args.job_wait)
+
+        started = time.perf_counter()
+        sent = 0
+        if args.rps:
+            tasks = []
+            while (deadline is None and sent < total) or (deadline is not None and time.perf_counter() < deadline):
+                scheduled = started + sent / args.rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(one(session, next_request(), scheduled)))
+                sent += 1
+            await asyncio.gather(*tasks)
+        else:
+            counter = iter(range(sys.maxsize))
+
+            async def client():
+                nonlocal sent
+                while True:
+                    if deadline is not None and time.perf_counter() >= deadline:
+                        return
+                    if deadline is None and next(counter) >= total:
+                        return
+                    sent += 1
+                    await one(session, next_request(), time.perf_counter())
+
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "sent": sent,
+        "elapsed_s": elapsed,
+        "throughput_rps": sent / elapsed if elapsed else None,
+        "succeeded": succeeded,
+        "success_rps": succeeded / elapsed if elapsed else None,
+        "latency": summarize(latencies),
+        "first_chunk": summarize(first_chunks) if first_chunks else None,
+        "statuses": statuses,
+        "errors": errors
+    }
+
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                async with session.get(f"{base_url}/readyz") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+
+async def scrape(base_url: str) -> str:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{base_url}/metrics") as response:
+            return await response.text()
+
+
+async def fetch_json(url: str) -> Dict[str, Any]:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*command):
+        result = subprocess.run(["git", *command], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="medvision-bench-"))
+    (workdir / "checkpoints").mkdir()
+    stub_port, port = free_port(), free_port()
+    config_path = write_config(args, workdir, stub_port)
+    corpus = load_corpus(args)
+    base_url = f"http://127.0.0.1:{port}"
+
+    env = {**os.environ, "MEDVISION_CONFIG": str(config_path), "GEMINI_API_KEY": "benchmark-stub"}
+    log = open(workdir / "server.log", "w")
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.gemini_stub", "--port", str(stub_port),
+            "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+            "--error-rate", str(args.stub_error_rate), "--error-status", str(args.stub_error_status),
+            "--stream-chunks", str(args.stub_stream_chunks), "--seed", str(args.seed),
+            "--latency-per-kchar-ms", str(args.stub_latency_per_kchar_ms),
+            *(["--no-caching"] if args.stub_no_caching else [])
+        ],
+        cwd=ROOT, stdout=log, stderr=subprocess.STDOUT
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        started = time.perf_counter()
+        asyncio.run(wait_ready(base_url, server, args.ready_timeout))
+        ready_s = time.perf_counter() - started
+        memory_ready = process_memory(server.pid)
+
+        before = asyncio.run(scrape(base_url))
+        client = asyncio.run(replay(args, base_url, corpus))
+        after = asyncio.run(scrape(base_url))
+
+        return {
+            "benchmark": "e2e_load",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_revision(),
+            "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+            "args": vars(args),
+            "server": {"ready_s": ready_s, "memory_at_ready": memory_ready, "memory": process_memory(server.pid)},
+            "client": client,
+            "stages": stage_summary(before, after),
+            "gemini_stub": asyncio.run(fetch_json(f"http://127.0.0.1:{stub_port}/stats")),
+            "prompt_cache": asyncio.run(fetch_json(f"{base_url}/reports/prompt-cache")),
+            "workdir": str(workdir)
+        }
+    finally:
+        for process in (server, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default="/analyze", choices=["/analyze", "/analyze/stream", "/jobs"])
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, default=None, help="open loop: requests started per second")
+    load.add_argument("--concurrency", type=int, default=4, help="closed loop: requests in flight")
+    parser.add_argument("--requests", type=int, default=100, help="requests to send (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to send requests for")
+    parser.add_argument("--warmup-requests", type=int, default=2, help="untimed requests sent first")
+    parser.add_argument("--corpus", default=None, help="JSONL request corpus (default: synthetic images)")
+    parser.add_argument("--distinct", type=int, default=50, help="synthetic corpus: distinct requests")
+    parser.add_argument("--images-per-request", type=int, default=1, help="synthetic corpus: images per request")
+    parser.add_argument("--image-size", type=int, default=512, help="synthetic corpus: image side in pixels")
+    parser.add_argument("--shuffle", action="store_true", help="pick corpus entries at random instead of in order")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiny-clip", action="store_true", help="random one-layer CLIP and empty checkpoint (offline)")
+    parser.add_argument("--clip-model", default=None, help="override model.clip_model")
+    parser.add_argument("--checkpoint", default=None, help="override the MiniGPT-Med checkpoint")
+    parser.add_argument("--device", default="cpu", help="model.device of the server")
+    parser.add_argument("--keep-caches", action="store_true", help="keep the report and embedding caches enabled")
+    parser.add_argument("--stub-latency-ms", type=float, default=800.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-error-status", type=int, default=503)
+    parser.add_argument("--stub-stream-chunks", type=int, default=8)
+    parser.add_argument("--stub-latency-per-kchar-ms", type=float, default=0.0, help="stub latency per 1000 inline prompt characters")
+    parser.add_argument("--stub-no-caching", action="store_true", help="stub rejects cachedContents calls (like models without caching)")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="disable prompt_cache (full system prompt in every request)")
+    parser.add_argument("--job-wait", type=float, default=30.0, help="/jobs: long-poll seconds per status request")
+    parser.add_argument("--timeout", type=float, default=300.0, help="client timeout per request")
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="seconds to wait for /readyz")
+    parser.add_argument("--log-level", default="WARNING", help="server logging.level")
+    parser.add_argument("--output", default=None, help="write the JSON results here (default: stdout)")
+    args = parser.parse_args()
+    if args.rps:
+        args.concurrency = None
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        client = results["client"]
+        print(f"{client['sent']} requests in {client['elapsed_s']:.1f}s, "
+              f"p50 {client['latency']['p50_ms']:.0f} ms, p99 {client['latency']['p99_ms']:.0f} ms, "
+              f"{client['throughput_rps']:.2f} req/s -> {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
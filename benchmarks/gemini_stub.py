@@ -0,0 +1,250 @@
+"""
+Local stand-in for the Gemini generateContent and cachedContents APIs.
+
+Answers POST /{model}:generateContent and POST /{model}:streamGenerateContent
+(?alt=sse) with a fenced HTML report, after a configurable latency, plus
+--latency-per-kchar-ms for every thousand characters of prompt text sent
+inline (text held in a cachedContent is not counted). A share of the
+requests (or the first --fail-first ones) fail with a configurable status,
+optionally with a Retry-After header (429/503 are retried by GeminiClient),
+and streams can stall after a number of events. Point api.gemini.base_url at http://127.0.0.1:<port>/v1beta/models.
+GET /stats reports the request counters, the highest number of model calls
+in flight at once and the number of distinct client connections seen.
+
+cachedContents can be created (POST), read (GET), extended (PATCH ttl) and
+deleted; entries expire after their ttl, and requests referencing an
+unknown or expired one get a 404. --no-caching answers every cachedContents
+call with a 404 and --cache-min-chars rejects smaller prefixes with a 400,
+like models without caching support or below their minimum cache size.
+
+Usage:
+    python -m benchmarks.gemini_stub --port 8790 --latency-ms 800 --jitter-ms 200 --error-rate 0.02
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+REPORT_HTML = (
+    "<h2>Findings</h2><p>No acute abnormality identified on the submitted images.</p>"
+    "<h2>Impression</h2><p>Benchmark report generated by the local Gemini stub.</p>"
+)
+
+
+def build_app(
+    latency_ms: float = 800.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    error_status: int = 503,
+    stream_chunks: int = 8,
+    seed: int = 0,
+    latency_per_kchar_ms: float = 0.0,
+    caching: bool = True,
+    cache_min_chars: int = 0,
+    fail_first: int = 0,
+    retry_after: Optional[float] = None,
+    stall_after_chunks: Optional[int] = None,
+    stall_ms: float = 0.0
+) -> web.Application:
+    """
+    Build the stub application
+
+    Args:
+        latency_ms: Time before the response (for streams: spread across the chunks)
+        jitter_ms: Uniform random deviation added to latency_ms
+        error_rate: Fraction of requests answered with error_status
+        error_status: HTTP status of failed requests
+        stream_chunks: Number of SSE events per streamed report
+        seed: Seed of the latency and error draws
+        latency_per_kchar_ms: Extra latency per 1000 characters of inline prompt text
+        caching: Serve the cachedContents API (404 on every call otherwise)
+        cache_min_chars: Smallest cachedContent accepted, in characters
+        fail_first: Number of first requests answered with error_status
+        retry_after: Retry-After seconds sent with error_status responses
+        stall_after_chunks: Streams go silent for stall_ms after this many events
+        stall_ms: Length of the stall
+
+    Returns:
+        aiohttp application
+    """
+    rng = random.Random(seed)
+    stats = {
+        "requests": 0, "streams": 0, "errors": 0, "input_chars": 0,
+        "cached_requests": 0, "cached_chars": 0, "cache_misses": 0,
+        "caches_created": 0, "caches_refreshed": 0, "caches_rejected": 0,
+        "in_flight": 0, "max_in_flight": 0
+    }
+    # Client (host, port) pairs: keep-alive pooling shows as few connections
+    peers = set()
+    # name -> (cached characters, monotonic expiry)
+    caches: Dict[str, List] = {}
+    text = f"```html\n{REPORT_HTML}\n```"
+
+    def delay(input_chars: int = 0) -> float:
+        latency = latency_ms + rng.uniform(-jitter_ms, jitter_ms) + latency_per_kchar_ms * input_chars / 1000
+        return max(0.0, latency) / 1000
+
+    def text_chars(contents: List[Dict[str, Any]]) -> int:
+        return sum(len(part.get("text", "")) for content in contents for part in content.get("parts", []))
+
+    def error(status: int, message: str) -> web.Response:
+        return web.json_response({"error": {"code": status, "message": message}}, status=status)
+
+    def live_cache(name: str):
+        entry = caches.get(name)
+        if entry is not None and entry[1] <= time.monotonic():
+            del caches[name]
+            entry = None
+        return entry
+
+    def failed() -> bool:
+        if stats["requests"] <= fail_first or rng.random() < error_rate:
+            stats["errors"] += 1
+            return True
+        return False
+
+    def candidate(part: str) -> Dict[str, Any]:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": part}]}}]}
+
+    async def model_method(request: web.Request) -> web.StreamResponse:
+        peers.add(request.transport.get_extra_info("peername"))
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            return await answer(request)
+        finally:
+            stats["in_flight"] -= 1
+
+    async def answer(request: web.Request) -> web.StreamResponse:
+        _, _, method = request.match_info["target"].rpartition(":")
+        body = await request.json()
+        stats["requests"] += 1
+        if failed():
+            response = error(error_status, "stub error")
+            if retry_after is not None:
+                response.headers["Retry-After"] = f"{retry_after:g}"
+            return response
+
+        input_chars = text_chars(body.get("contents", []))
+        stats["input_chars"] += input_chars
+        if body.get("cachedContent"):
+            entry = live_cache(body["cachedContent"])
+            if entry is None:
+                stats["cache_misses"] += 1
+                return error(404, f"CachedContent not found: {body['cachedContent']}")
+            stats["cached_requests"] += 1
+            stats["cached_chars"] += entry[0]
+
+        if method == "generateContent":
+            await asyncio.sleep(delay(input_chars))
+            return web.json_response(candidate(text))
+        if method != "streamGenerateContent":
+            return web.json_response({"error": {"message": f"unknown method {method}"}}, status=404)
+
+        stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = max(1, -(-len(text) // max(1, stream_chunks)))
+        pause = delay(input_chars) / max(1, stream_chunks)
+        for index, start in enumerate(range(0, len(text), size)):
+            if index == stall_after_chunks:
+                await asyncio.sleep(stall_ms / 1000)
+            await asyncio.sleep(pause)
+            await response.write(f"data: {json.dumps(candidate(text[start:start + size]))}\r\n\r\n".encode())
+        await response.write_eof()
+        return response
+
+    def parse_ttl(value: str) -> float:
+        return float(str(value).rstrip("s"))
+
+    def describe_cache(name: str) -> Dict[str, Any]:
+        return {"name": name, "ttlRemaining": f"{caches[name][1] - time.monotonic():.0f}s"}
+
+    async def create_cache(request: web.Request) -> web.Response:
+        body = await request.json()
+        if not caching:
+            return error(404, "cachedContents is not supported for this model")
+        chars = text_chars(body.get("contents", [])) + text_chars([body.get("systemInstruction", {})])
+        if chars < cache_min_chars:
+            stats["caches_rejected"] += 1
+            return error(400, f"Cached content is too small: {chars} characters, minimum {cache_min_chars}")
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        caches[name] = [chars, time.monotonic() + parse_ttl(body.get("ttl", "3600s"))]
+        stats["caches_created"] += 1
+        return web.json_response(describe_cache(name))
+
+    async def cache_resource(request: web.Request) -> web.Response:
+        name = f"cachedContents/{request.match_info['cache_id']}"
+        if not caching:
+            return error(404, "cachedContents is not supported for this model")
+        if live_cache(name) is None:
+            return error(404, f"CachedContent not found: {name}")
+        if request.method == "DELETE":
+            del caches[name]
+            return web.json_response({})
+        if request.method == "PATCH":
+            body = await request.json()
+            caches[name][1] = time.monotonic() + parse_ttl(body.get("ttl", "3600s"))
+            stats["caches_refreshed"] += 1
+        return web.json_response(describe_cache(name))
+
+    async def stub_stats(request: web.Request) -> web.Response:
+        return web.json_response({
+            **stats,
+            "connections": len(peers),
+            "live_caches": len([name for name in list(caches) if live_cache(name)])
+        })
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/stats", stub_stats)
+    app.router.add_post("/v1beta/models/{target}", model_method)
+    app.router.add_post("/v1beta/cachedContents", create_cache)
+    for method in ("GET", "PATCH", "DELETE"):
+        app.router.add_route(method, "/v1beta/cachedContents/{cache_id}", cache_resource)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failed requests")
+    parser.add_argument("--error-status", type=int, default=503, help="status of failed requests")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="SSE events per streamed report")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-per-kchar-ms", type=float, default=0.0, help="latency per 1000 inline prompt characters")
+    parser.add_argument("--no-caching", action="store_true", help="answer cachedContents calls with 404")
+    parser.add_argument("--cache-min-chars", type=int, default=0, help="smallest cachedContent accepted")
+    parser.add_argument("--fail-first", type=int, default=0, help="first requests answered with --error-status")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds of failed requests")
+    parser.add_argument("--stall-after-chunks", type=int, default=None, help="SSE events sent before a stall")
+    parser.add_argument("--stall-ms", type=float, default=0.0, help="length of the stream stall")
+    args = parser.parse_args()
+
+    app = build_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed,
+        latency_per_kchar_ms=args.latency_per_kchar_ms,
+        caching=not args.no_caching,
+        cache_min_chars=args.cache_min_chars,
+        fail_first=args.fail_first,
+        retry_after=args.retry_after,
+        stall_after_chunks=args.stall_after_chunks,
+        stall_ms=args.stall_ms
+    )
+    web.run_app(app, host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
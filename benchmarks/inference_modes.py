@@ -0,0 +1,112 @@
+"""
+Latency, memory and accuracy drift of the vision inference modes.
+
+Each precision/graph mode combination is measured in its own subprocess so
+that peak RSS is not shared between modes. A worker loads MiniGPTMedModel
+with the mode (which runs the drift check against fp32 eager), encodes and
+projects a fixed batch --iterations times and reports median and p95
+latency, throughput, peak RSS, parameter bytes and the token cosine
+similarity to fp32 eager.
+
+Usage:
+    python -m benchmarks.inference_modes --batch-size 4 --iterations 20
+    python -m benchmarks.inference_modes --modes fp32/eager int8/torchscript
+    python -m benchmarks.inference_modes --clip-model /models/clip-vit-base-patch32
+"""
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+DEFAULT_MODES = ["fp32/eager", "bf16/eager", "int8/eager", "fp32/torchscript", "int8/torchscript", "fp32/compile"]
+
+
+def run_worker(mode: str, checkpoint: str, clip_model: str, batch_size: int, iterations: int) -> None:
+    import torch
+    from src.models.minigpt_med import MiniGPTMedModel
+    from src.models.inference import probe_pixel_values
+
+    precision, graph_mode = mode.split("/")
+    start = time.perf_counter()
+    model = MiniGPTMedModel(checkpoint, "cpu", precision=precision, graph_mode=graph_mode, clip_model=clip_model)
+    load_seconds = time.perf_counter() - start
+    if model.precision == "int8":
+        # Both the tower's Linear layers and the bare projection Linear must be quantised
+        quantized = torch.ao.nn.quantized.dynamic.Linear
+        assert isinstance(model.projection.projection, quantized), type(model.projection.projection)
+        assert any(isinstance(m, quantized) for m in model.vision_encoder.tower.modules())
+
+    preprocessor = model.vision_encoder.preprocessor
+    pixel_values = probe_pixel_values(batch_size, preprocessor.crop_height, preprocessor.crop_width)
+
+    def step():
+        model.projection.project(model.vision_encoder.encode_pixel_values(pixel_values))
+
+    step()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    report = model.inference_report
+    print(json.dumps({
+        "mode": mode,
+        "active": f"{report['precision']}/{report['graph_mode']}",
+        "load_s": load_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "images_per_s": batch_size / latencies[len(latencies) // 2],
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "param_mb": model.memory_footprint()["total"] / (1024 * 1024),
+        "cosine_min": report["cosine_min"],
+        "threads": torch.get_num_threads()
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, help="precision/graph_mode combinations")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint path (defaults to config.yaml)")
+    parser.add_argument("--clip-model", default=None, help="vision tower name or path (defaults to model.clip_model)")
+    parser.add_argument("--batch-size", type=int, default=4, help="images per forward pass")
+    parser.add_argument("--iterations", type=int, default=20, help="timed forward passes per mode")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.checkpoint is None:
+        from src.utils.config import get_minigpt_checkpoint
+        args.checkpoint = str(get_minigpt_checkpoint())
+    if args.clip_model is None:
+        from src.utils.config import get_model_config
+        args.clip_model = get_model_config().get("clip_model", "openai/clip-vit-base-patch32")
+
+    if args.worker:
+        run_worker(args.worker, args.checkpoint, args.clip_model, args.batch_size, args.iterations)
+        return
+
+    print(f"{'mode':18} {'active':18} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>8} {'RSS MB':>8} {'params MB':>10} {'cos min':>9}")
+    for mode in args.modes:
+        command = [
+            sys.executable, "-m", "benchmarks.inference_modes", "--worker", mode,
+            "--checkpoint", args.checkpoint, "--clip-model", args.clip_model,
+            "--batch-size", str(args.batch_size), "--iterations", str(args.iterations)
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if result.returncode != 0 or not lines:
+            print(f"{mode:18} failed: {result.stderr.strip().splitlines()[-1:]}")
+            continue
+        row = json.loads(lines[-1])
+        print(
+            f"{row['mode']:18} {row['active']:18} {row['p50_ms']:9.1f} {row['p95_ms']:9.1f} "
+            f"{row['images_per_s']:8.1f} {row['peak_rss_mb']:8.0f} {row['param_mb']:10.1f} {row['cosine_min']:9.5f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Throughput and parity of the two image preprocessing backends.
+
+"hf" is CLIPImageProcessor called on the batch, "tensor" is
+src.models.preprocessing.BatchPreprocessor. Both run on the same synthetic
+images of mixed sizes and modes; the script reports images/sec for each and
+the largest absolute difference between their outputs, and exits non-zero
+when that difference exceeds --tolerance.
+
+Usage:
+    python -m benchmarks.preprocessing --images 64 --batch-size 8
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from src.models.preprocessing import BatchPreprocessor
+
+SIZES = [(448, 448), (512, 384), (300, 600), (1024, 768), (640, 480), (200, 150)]
+
+
+def make_images(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        width, height = SIZES[i % len(SIZES)]
+        # Smooth gradients plus noise, closer to scans than pure noise
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels)
+        if i % 3 == 2:
+            image = image.convert("L")
+        images.append(image)
+    return images
+
+
+def measure(func, images, batch_size: int, rounds: int) -> float:
+    func(images[:batch_size])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(0, len(images), batch_size):
+            func(images[i:i + batch_size])
+    return rounds * len(images) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64, help="synthetic images per round")
+    parser.add_argument("--batch-size", type=int, default=8, help="images per preprocessing call")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the image set")
+    parser.add_argument("--processor", default="openai/clip-vit-base-patch32", help="HF processor name or path")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="maximum allowed absolute difference")
+    args = parser.parse_args()
+
+    processor = CLIPImageProcessor.from_pretrained(args.processor)
+    preprocessor = BatchPreprocessor.from_hf_processor(processor)
+    images = make_images(args.images)
+
+    def hf(batch):
+        return processor(images=batch, return_tensors="np").pixel_values
+
+    reference = np.concatenate([hf(images[i:i + args.batch_size]) for i in range(0, len(images), args.batch_size)])
+    candidate = np.concatenate([preprocessor(images[i:i + args.batch_size]) for i in range(0, len(images), args.batch_size)])
+    max_diff = float(np.abs(reference - candidate).max())
+
+    hf_rate = measure(hf, images, args.batch_size, args.rounds)
+    tensor_rate = measure(preprocessor, images, args.batch_size, args.rounds)
+
+    print(f"hf ({type(processor).__name__}): {hf_rate:8.1f} images/s")
+    print(f"tensor (BatchPreprocessor): {tensor_rate:8.1f} images/s")
+    print(f"speedup: {tensor_rate / hf_rate:.1f}x")
+    print(f"max abs diff: {max_diff:.2e} (tolerance {args.tolerance})")
+    if max_diff > args.tolerance:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Latency and recall of the similar-study vector index.
+
+Fills a temporary src.models.vector_index.VectorIndex with --vectors
+clustered synthetic study vectors (pooled CLIP features are far from
+uniform: studies of one modality and body part sit close together), times
+exact search, trains the IVF-PQ quantisers and times approximate search for
+every --nprobe value. Recall@k is measured against the exact results. The
+index files live in a temporary directory (or --directory, kept afterwards).
+
+Usage:
+    python -m benchmarks.similarity_search --vectors 1000000 --dim 768
+"""
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from src.models.vector_index import VectorIndex
+
+
+def make_vectors(rng: np.random.Generator, centers: np.ndarray, count: int, spread: float) -> np.ndarray:
+    labels = rng.integers(0, len(centers), count)
+    noise = rng.standard_normal((count, centers.shape[1]), dtype=np.float32) * spread
+    return centers[labels] + noise
+
+
+def percentile_ms(samples, q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def time_queries(index: VectorIndex, queries: np.ndarray, k: int):
+    index.search(queries[0], k)
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append([vector_id for vector_id, _ in hits])
+    return latencies, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=1000000, help="vectors in the index")
+    parser.add_argument("--dim", type=int, default=768, help="vector dimension (CLIP ViT-B hidden size)")
+    parser.add_argument("--clusters", type=int, default=2000, help="synthetic study clusters")
+    parser.add_argument("--spread", type=float, default=0.5, help="noise around the cluster centres")
+    parser.add_argument("--queries", type=int, default=200, help="timed queries per mode")
+    parser.add_argument("--exact-queries", type=int, default=50, help="timed exact queries (ground truth)")
+    parser.add_argument("--k", type=int, default=10, help="results per query")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32], help="coarse lists scanned")
+    parser.add_argument("--nlist", type=int, default=None, help="coarse lists (default about sqrt(vectors))")
+    parser.add_argument("--rerank", type=int, default=100, help="PQ candidates re-ranked exactly per result")
+    parser.add_argument("--batch", type=int, default=50000, help="vectors per add_many call")
+    parser.add_argument("--directory", default=None, help="index directory (kept; default a temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    directory = args.directory or tempfile.mkdtemp(prefix="similarity-bench-")
+
+    try:
+        # ivf_threshold above the corpus: training is triggered explicitly below
+        index = VectorIndex(
+            directory, args.dim, ivf_threshold=args.vectors + 1, nlist=args.nlist, rerank=args.rerank
+        )
+        start = time.perf_counter()
+        for offset in range(len(index), args.vectors, args.batch):
+            count = min(args.batch, args.vectors - offset)
+            index.add_many([f"study-{offset + i}" for i in range(count)], make_vectors(rng, centers, count, args.spread))
+        index.flush()
+        print(f"load: {args.vectors} x {args.dim} vectors in {time.perf_counter() - start:.1f}s")
+
+        queries = make_vectors(rng, centers, max(args.queries, args.exact_queries), args.spread)
+        latencies, truth = time_queries(index, queries[:args.exact_queries], args.k)
+        print(
+            f"exact: p50 {percentile_ms(latencies, 50):8.2f} ms  p99 {percentile_ms(latencies, 99):8.2f} ms"
+        )
+
+        start = time.perf_counter()
+        index.train()
+        stats = index.stats()
+        print(
+            f"train: {time.perf_counter() - start:.1f}s "
+            f"({stats['nlist']} lists, {stats['pq_subspaces']} bytes per vector)"
+        )
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            latencies, _ = time_queries(index, queries[:args.queries], args.k)
+            _, approximate = time_queries(index, queries[:args.exact_queries], args.k)
+            recall = np.mean([
+                len(set(found) & set(expected)) / max(1, len(expected))
+                for found, expected in zip(approximate, truth)
+            ])
+            print(
+                f"ivfpq nprobe={nprobe:<4d} p50 {percentile_ms(latencies, 50):8.2f} ms  "
+                f"p99 {percentile_ms(latencies, 99):8.2f} ms  recall@{args.k} {recall:.3f}"
+            )
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Start-up cost of the API process.
+
+Runs `python -X importtime -c "import src.main"` in a fresh interpreter,
+prints the total import time and the slowest modules by cumulative time,
+and fails when a heavy module (torch, transformers, ...) is imported at
+start-up or when the total exceeds --budget-ms. With --serve it also starts
+uvicorn and measures the time until /healthz answers.
+
+Usage:
+    python -m benchmarks.startup_importtime --top 15 --budget-ms 1500
+    python -m benchmarks.startup_importtime --serve
+"""
+import sys
+import time
+import argparse
+import subprocess
+import urllib.request
+from typing import Dict, List, Tuple
+
+# Must stay behind the model registry / service entry points
+HEAVY_MODULES = ["torch", "transformers", "onnxruntime", "aiohttp", "numpy", "PIL", "pydicom", "requests"]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Parse -X importtime lines into (module, self_us, cumulative_us, depth)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_report(module: str) -> Dict[str, object]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+    imported = {name.split(".")[0] for name, _, _, _ in rows}
+    total = next(cumulative for name, _, cumulative, _ in rows if name == module)
+    return {"rows": rows, "total_us": total, "heavy": [m for m in HEAVY_MODULES if m in imported]}
+
+
+def time_to_healthz(port: int, timeout: float) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"/healthz did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="src.main", help="module whose import is measured")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail when the import takes longer")
+    parser.add_argument("--serve", action="store_true", help="also measure the time until /healthz answers")
+    parser.add_argument("--port", type=int, default=8765, help="port used with --serve")
+    args = parser.parse_args()
+
+    report = import_report(args.module)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us, depth in sorted(report["rows"], key=lambda r: -r[2])[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {'  ' * depth}{name}")
+    print(f"\nimport {args.module}: {report['total_us'] / 1000:.1f} ms")
+
+    failed = False
+    if report["heavy"]:
+        print(f"heavy modules imported at start-up: {', '.join(report['heavy'])}")
+        failed = True
+    if args.budget_ms is not None and report["total_us"] / 1000 > args.budget_ms:
+        print(f"over the {args.budget_ms:.0f} ms budget")
+        failed = True
+
+    if args.serve:
+        print(f"time to /healthz: {time_to_healthz(args.port, 60.0) * 1000:.0f} ms")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
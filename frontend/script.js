@@ -57,8 +57,18 @@ $(document).ready(function() {
         }
         
         uploadedImages.forEach(file => {
+            if (file.type === 'application/dicom' || file.name.toLowerCase().endsWith('.dcm')) {
+                // Browsers cannot render DICOM: show a labelled tile instead
+                imagePreview.append($(`
+                    <div class="w-32 h-32 flex flex-col items-center justify-center rounded-lg border-2 border-white shadow-md bg-gray-800 text-white text-xs p-2 text-center">
+                        <i class="fas fa-x-ray text-3xl mb-2"></i>
+                        <span class="break-all"></span>
+                    </div>
+                `).find('span').text(file.name).end());
+                return;
+            }
             if (!file.type.match('image.*')) return;
-            
+
             const reader = new FileReader();
             reader.onload = function(e) {
                 const img = $(`<img src="${e.target.result}" class="preview-image w-32 h-32 object-cover rounded-lg border-2 border-white shadow-md cursor-pointer">`);
@@ -71,6 +81,52 @@ $(document).ready(function() {
     // Initialize preview
     updatePreviewContent();
     
+    // Create the iframe that isolates report styling and show it in the report container
+    function createReportFrame(reportHtml) {
+        const iframe = document.createElement('iframe');
+        iframe.style.width = '100%';
+        iframe.style.minHeight = '80vh';
+        iframe.style.maxHeight = '80vh';
+        iframe.style.border = 'none';
+        iframe.style.background = 'rgba(255, 255, 255, 0.8)';
+        iframe.style.overflow = 'hidden';
+        iframe.style.borderRadius = '12px';
+        
+        // Wrap report content with base HTML structure
+        iframe.srcdoc = `
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <base href="${window.location.origin}" />
+                <style>
+                    body {
+                        margin: 0;
+                        padding: 10px;
+                        font-family: Arial, sans-serif;
+                        background: rgba(255, 255, 255, 0.8);
+                        min-height: 100%;
+                        overflow: auto;
+                    }
+                    /* Add any other report-specific styles here */
+                </style>
+            </head>
+            <body>
+                ${reportHtml}
+            </body>
+            </html>
+        `;
+        
+        const wrapper = $(`
+            <div class="flex flex-col h-full">
+                <h4 class="font-bold text-lg text-blue-800 mb-2 p-2">Medical Analysis Report</h4>
+                <div class="flex-1 flex flex-col" style="overflow-y: auto;"></div>
+            </div>
+        `);
+        wrapper.children().last().append(iframe);
+        reportContainer.empty().append(wrapper);
+        return iframe;
+    }
+    
     // Analyze button click handler
     analyzeBtn.on('click', function() {
         const patientName = $('#patient-name').val().trim();
@@ -113,87 +169,96 @@ $(document).ready(function() {
             formData.append(`images`, file);
         });
         
-        // Send AJAX request
-        $.ajax({
-            url: '/analyze',
-            type: 'POST',
-            data: formData,
-            processData: false,
-            contentType: false,
-            success: function(result) {
-                if (result.error) {
-                    reportContainer.html(`
-                        <div class="text-red-500 p-4 rounded-lg bg-red-50">
-                            <i class="fas fa-exclamation-triangle mr-2"></i>
-                            ${result.error}
-                        </div>
-                    `);
-                } else {
-                    // Create iframe to isolate report styling
-                    const iframe = document.createElement('iframe');
-                    iframe.style.width = '100%';
-                    iframe.style.minHeight = '80vh';
-                    iframe.style.maxHeight = '80vh';
-                    iframe.style.border = 'none';
-                    iframe.style.background = 'rgba(255, 255, 255, 0.8)';
-                    iframe.style.overflow = 'hidden';
-                    iframe.style.borderRadius = '12px';
-                    
-                    // Wrap report content with base HTML structure
-                    const fullHtml = `
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <base href="${window.location.origin}" />
-                            <style>
-                                body {
-                                    margin: 0;
-                                    padding: 10px;
-                                    font-family: Arial, sans-serif;
-                                    background: rgba(255, 255, 255, 0.8);
-                                    min-height: 100%;
-                                    overflow: auto;
-                                }
-                                /* Add any other report-specific styles here */
-                            </style>
-                        </head>
-                        <body>
-                            ${result.report}
-                        </body>
-                        </html>
-                    `;
-                    
-                    iframe.srcdoc = fullHtml;
-                    
-                    reportContainer.html(`
-                        <div class="flex flex-col h-full">
-                            <h4 class="font-bold text-lg text-blue-800 mb-2 p-2">Medical Analysis Report</h4>
-                            <div class="flex-1 flex flex-col" style="overflow-y: auto;">
-                                ${iframe.outerHTML}
-                            </div>
-                        </div>
-                    `);
+        // Stream the report and render it as chunks arrive
+        let reportHtml = '';
+        let reportFrame = null;
+        let renderScheduled = false;
+        
+        function showError(message) {
+            reportContainer.html(`
+                <div class="text-red-500 p-4 rounded-lg bg-red-50">
+                    <i class="fas fa-exclamation-triangle mr-2"></i>
+                    ${message}
+                </div>
+            `);
+        }
+        
+        function renderPartialReport() {
+            renderScheduled = false;
+            if (!reportFrame) {
+                reportFrame = createReportFrame('');
+                // srcdoc loads asynchronously: repaint once the document exists
+                reportFrame.addEventListener('load', renderPartialReport);
+            }
+            const frameDoc = reportFrame.contentDocument;
+            if (frameDoc && frameDoc.body) {
+                frameDoc.body.innerHTML = reportHtml;
+            }
+        }
+        
+        function handleEvent(event, data) {
+            if (event === 'chunk') {
+                reportHtml += data.html;
+                // Batch DOM updates to one per animation frame
+                if (!renderScheduled) {
+                    renderScheduled = true;
+                    requestAnimationFrame(renderPartialReport);
                 }
-            },
-            error: function(xhr) {
-                let errorMsg = `Server error: ${xhr.status} ${xhr.statusText}`;
+            } else if (event === 'status' && data.stage === 'report') {
+                analyzeBtn.html('<div class="loading inline-block mr-2"></div> Writing report...');
+            } else if (event === 'error') {
+                showError(data.error);
+            } else if (event === 'done') {
+                // Final render with the complete document
+                createReportFrame(reportHtml);
+            }
+        }
+        
+        fetch('/analyze/stream', {
+            method: 'POST',
+            body: formData
+        }).then(async response => {
+            if (!response.ok) {
+                let errorMsg = `Server error: ${response.status} ${response.statusText}`;
                 try {
-                    const errorBody = JSON.parse(xhr.responseText);
-                    errorMsg += ` - ${errorBody.error || JSON.stringify(errorBody)}`;
+                    const errorBody = await response.json();
+                    errorMsg += ` - ${errorBody.error || errorBody.detail || JSON.stringify(errorBody)}`;
                 } catch (e) {
                     // Ignore JSON parse errors
                 }
-                reportContainer.html(`
-                    <div class="text-red-500 p-4 rounded-lg bg-red-50">
-                        <i class="fas fa-exclamation-triangle mr-2"></i>
-                        ${errorMsg}
-                    </div>
-                `);
-            },
-            complete: function() {
-                analyzeBtn.prop('disabled', false);
-                analyzeBtn.html('<i class="fas fa-microscope mr-3"></i>Analyze Images');
+                showError(errorMsg);
+                return;
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                
+                // Server-Sent Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    
+                    let event = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (data) handleEvent(event, JSON.parse(data));
+                }
             }
+        }).catch(error => {
+            showError(`Server error: ${error.message}`);
+        }).finally(() => {
+            analyzeBtn.prop('disabled', false);
+            analyzeBtn.html('<i class="fas fa-microscope mr-3"></i>Analyze Images');
         });
     });
     
@@ -1,35 +1,50 @@
 import os
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
+import json
 import logging
-from typing import List
-from PIL import Image
-import io
+import asyncio
+from typing import TYPE_CHECKING, List
 
 # Local imports
-from src.utils.config import load_config, get_logging_config
+# torch, transformers, onnxruntime, aiohttp, NumPy and PIL are imported behind the
+# model registry and service entry points, so the API answers /healthz before they load
+from src.utils.config import get_config, get_jobs_config, get_similarity_config, install_reload_signal_handler
+from src.utils.logging import TraceIdMiddleware, setup_logging
+from src.utils.request_limits import RequestSizeLimitMiddleware
+from src.utils.metrics import get_metrics_registry
+from src.services.analysis import analyze, decode_uploads, run_in_vision_executor, vision_executor
 from src.services.image_processing import process_images
-from src.services.report_generation import generate_medical_report
+from src.services.report_generation import generate_medical_report_stream
+from src.services.gemini_client import close_gemini_client
+from src.services.report_cache import get_report_cache
+from src.services.prompt_cache import get_prompt_cache
+from src.services.jobs import QueueFullError, get_job_queue
+from src.models.registry import get_model_registry
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 # Configure logging
-logging.basicConfig(
-    level=get_logging_config()['level'],
-    format=get_logging_config()['format']
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Configuration
-config = load_config()
+# Configuration (parsed once, reloaded when config.yaml changes or on SIGHUP)
+config = get_config()
 SYSTEM_PROMPTS = config['system_prompts']
+install_reload_signal_handler()
 
 app = FastAPI()
 
+# Multipart bodies are capped before Starlette spools them (/bulk streams its own under bulk limits)
+app.add_middleware(RequestSizeLimitMiddleware, exclude_paths=("/bulk",))
+
 # Allow CORS for local development
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +54,90 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Trace ids on every request (see TraceIdMiddleware for why it is not an @app.middleware)
+app.add_middleware(TraceIdMiddleware)
+
+def register_metrics_collectors():
+    """Expose queue depths and the counters kept by caches and schedulers on /metrics"""
+    metrics = get_metrics_registry()
+    registry = get_model_registry()
+    
+    def cache_lookups():
+        embedding_cache = registry.embedding_cache()
+        report_cache = get_report_cache()
+        samples = []
+        if embedding_cache is not None:
+            embedding = embedding_cache.stats()
+            samples += [
+                ({"cache": "embedding", "result": "hit"}, embedding["memory_hits"] + embedding["disk_hits"]),
+                ({"cache": "embedding", "result": "miss"}, embedding["misses"])
+            ]
+        if report_cache is not None:
+            report = report_cache.stats()
+            samples += [
+                ({"cache": "report", "result": "hit"}, report["hits"]),
+                ({"cache": "report", "result": "miss"}, report["misses"]),
+                ({"cache": "report", "result": "coalesced"}, report["coalesced"])
+            ]
+        return samples
+    
+    def queue_depths():
+        jobs = get_job_queue().stats()
+        samples = [
+            ({"queue": "jobs"}, jobs["queued"]),
+            ({"queue": "vision_executor"}, vision_executor._work_queue.qsize())
+        ]
+        for stats in registry.batching_stats():
+            samples.append(({"queue": stats.get("backend", "micro_batch"), "model": stats["checkpoint_path"]}, stats["queue_depth"]))
+        return samples
+    
+    def job_counts():
+        jobs = get_job_queue().stats()
+        return [({"outcome": name}, jobs[name]) for name in ("completed", "failed", "deduplicated", "rejected")]
+    
+    def jobs_running():
+        return [({}, get_job_queue().stats()["running"])]
+    
+    def resident_models():
+        return [({}, len(registry.resident_keys()))]
+    
+    metrics.register_collector("medvision_cache_lookups_total", "counter", "Embedding and report cache lookups", cache_lookups)
+    metrics.register_collector("medvision_queue_depth", "gauge", "Work waiting in each queue", queue_depths)
+    metrics.register_collector("medvision_jobs_total", "counter", "Analysis jobs by outcome", job_counts)
+    metrics.register_collector("medvision_jobs_running", "gauge", "Analysis jobs being processed", jobs_running)
+    metrics.register_collector("medvision_resident_models", "gauge", "Vision models loaded in memory", resident_models)
+
+register_metrics_collectors()
+
+# State of the default model preload, reported by /readyz
+model_preload = {"status": "pending", "error": None}
+
+async def preload_default_model():
+    """Load the default model once so requests share the resident weights"""
+    model_preload["status"] = "loading"
+    try:
+        await run_in_vision_executor(get_model_registry().load)
+        model_preload["status"] = "ready"
+    except Exception as e:
+        logger.error(f"Model preload failed: {str(e)}")
+        model_preload.update(status="failed", error=str(e))
+
+@app.on_event("startup")
+async def load_models():
+    # Load in the background: the server accepts connections (and /healthz) right away
+    app.state.model_preload = asyncio.create_task(preload_default_model())
+    get_job_queue().start()
+
+@app.on_event("shutdown")
+async def unload_models():
+    # A model still loading would otherwise be registered after unload_all
+    preload = getattr(app.state, "model_preload", None)
+    if preload is not None and not preload.done():
+        await preload
+    await get_job_queue().stop()
+    await run_in_vision_executor(get_model_registry().unload_all)
+    await close_gemini_client()
+
 # Serve frontend files
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 
@@ -47,6 +146,45 @@ async def read_root():
     with open("frontend/index.html", "r") as f:
         return HTMLResponse(content=f.read(), status_code=200)
 
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up, whether or not models are loaded
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: a vision model is resident and requests will not wait for a load
+    if get_model_registry().resident_keys():
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content=model_preload)
+
+async def read_upload_contents(images: List[UploadFile]) -> List[bytes]:
+    """Read uploaded files under the ingestion limits without decoding them"""
+    from src.services.ingestion import read_uploads, UploadRejectedError
+    
+    try:
+        return await read_uploads(images)
+    except UploadRejectedError as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def read_upload_images(images: List[UploadFile]) -> List["Image.Image"]:
+    """Read uploaded files under the ingestion limits and decode them off the event loop"""
+    from src.services.ingestion import UploadRejectedError
+    
+    try:
+        return await decode_uploads(await read_upload_contents(images))
+    except UploadRejectedError as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Image decoding failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Image decoding failed: {str(e)}")
+
+def sse_event(data, event: str = "message") -> str:
+    """Format a Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/analyze")
 async def analyze_images(
     images: List[UploadFile] = File(...),
@@ -59,15 +197,7 @@ async def analyze_images(
     clinical_context: str = Form(...)
 ):
     # Process uploaded images
-    image_data = []
-    for image in images:
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents))
-        image_data.append(img)
-    
-    # Process images and generate report
-    # Process images and get context string
-    processed_context = process_images(image_data)
+    image_data = await read_upload_images(images)
     
     # Prepare patient data
     patient_data = {
@@ -80,20 +210,253 @@ async def analyze_images(
         "clinical_context": clinical_context
     }
     
-    # Generate report
+    # Process images and generate report
     try:
-        report = generate_medical_report(
-            image_context=str(processed_context),  # Ensure we pass a string
-            patient_data=patient_data,
-            language=language,
-            prompt_template_name=prompt_template
-        )
+        report = await analyze(image_data, patient_data)
     except Exception as e:
         logger.error(f"Report generation failed: {str(e)}")
         return {"error": f"Report generation failed: {str(e)}"}
     
     return {"report": report}
 
+@app.post("/analyze/stream")
+async def analyze_images_stream(
+    images: List[UploadFile] = File(...),
+    patient_name: str = Form(...),
+    patient_age: str = Form(...),
+    patient_gender: str = Form(...),
+    exam_type: str = Form(...),
+    language: str = Form(...),
+    prompt_template: str = Form(...),
+    clinical_context: str = Form(...)
+):
+    # Uploads must be read before the response starts streaming
+    image_data = await read_upload_images(images)
+    
+    patient_data = {
+        "name": patient_name,
+        "age": patient_age,
+        "gender": patient_gender,
+        "exam_type": exam_type,
+        "language": language,
+        "prompt_template": prompt_template,
+        "clinical_context": clinical_context
+    }
+    
+    async def events():
+        yield sse_event({"stage": "vision"}, event="status")
+        vision_context = await run_in_vision_executor(process_images, image_data)
+        
+        yield sse_event({"stage": "report"}, event="status")
+        try:
+            async for chunk in generate_medical_report_stream(
+                image_context=vision_context,
+                patient_data=patient_data,
+                language=language,
+                prompt_template_name=prompt_template
+            ):
+                yield sse_event({"html": chunk}, event="chunk")
+        except Exception as e:
+            logger.error(f"Report streaming failed: {str(e)}")
+            yield sse_event({"error": f"Report generation failed: {str(e)}"}, event="error")
+            return
+        
+        yield sse_event({}, event="done")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/bulk")
+async def bulk_analyze(request: Request):
+    # The body is not read here: studies are analysed and streamed back while the archive is still arriving
+    from src.services.bulk import BulkResponse, bulk_entries
+    from src.services.ingestion import UploadRejectedError
+    
+    try:
+        read_entries = bulk_entries(request.headers.get("content-type", ""))
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return BulkResponse(read_entries)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    images: List[UploadFile] = File(...),
+    patient_name: str = Form(...),
+    patient_age: str = Form(...),
+    patient_gender: str = Form(...),
+    exam_type: str = Form(...),
+    language: str = Form(...),
+    prompt_template: str = Form(...),
+    clinical_context: str = Form(...),
+    priority: int = Form(0)
+):
+    # Only the upload is read here; decoding, vision and the report run on a job worker
+    contents = await read_upload_contents(images)
+    
+    patient_data = {
+        "name": patient_name,
+        "age": patient_age,
+        "gender": patient_gender,
+        "exam_type": exam_type,
+        "language": language,
+        "prompt_template": prompt_template,
+        "clinical_context": clinical_context
+    }
+    
+    try:
+        job, deduplicated = get_job_queue().submit(contents, patient_data, priority)
+    except QueueFullError as e:
+        logger.warning(f"Job rejected: {str(e)}")
+        return JSONResponse(status_code=429, content={"error": str(e)}, headers={"Retry-After": "5"})
+    
+    return {"job_id": job.job_id, "status": job.status, "deduplicated": deduplicated}
+
+@app.get("/jobs")
+async def job_queue_stats():
+    return get_job_queue().stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0)):
+    # Long-poll: with ?wait=N the response is held until the job finishes or N seconds pass
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is not None and wait > 0:
+        deadline = asyncio.get_running_loop().time() + min(wait, get_jobs_config().get("long_poll_max_s", 30))
+        while not job.finished:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0 or not await job.wait_for_change(remaining):
+                break
+    
+    description = await queue.lookup(job_id)
+    if description is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return description
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        description = await queue.lookup(job_id)
+        if description is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    
+    async def events():
+        if job is None:
+            # Already evicted from memory: replay the persisted outcome
+            yield sse_event(description, event="done")
+            return
+        last_status = None
+        while True:
+            if job.status == last_status:
+                await job.wait_for_change(None)
+                continue
+            last_status = job.status
+            if job.finished:
+                yield sse_event(job.to_dict(), event="done" if job.status == "done" else "error")
+                return
+            yield sse_event(job.to_dict(), event="status")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def similar_k(k: int) -> int:
+    """Validate the requested number of similar studies (HTTP 503 when the search is disabled)"""
+    config = get_similarity_config()
+    if not config.get("enabled", False):
+        raise HTTPException(status_code=503, detail="Similar-study search is disabled")
+    return min(k, config.get("max_k", 100))
+
+@app.post("/similar")
+async def similar_studies(
+    images: List[UploadFile] = File(...),
+    k: int = Form(10, ge=1)
+):
+    # Studies saved through /jobs most similar to the uploaded images (nothing is stored)
+    from src.services.similarity import encode_study, find_similar
+    
+    k = similar_k(k)
+    image_data = await read_upload_images(images)
+    try:
+        vector, identity = await run_in_vision_executor(encode_study, image_data)
+        return await asyncio.to_thread(find_similar, vector, identity, k)
+    except Exception as e:
+        logger.error(f"Similar-study search failed: {str(e)}")
+        return {"error": f"Similar-study search failed: {str(e)}"}
+
+@app.get("/similar/{session_id}")
+async def similar_to_session(session_id: str, k: int = Query(10, ge=1)):
+    # Uses the stored study vector: no image is encoded again
+    from src.services.similarity import find_similar_to_session
+    
+    k = similar_k(k)
+    try:
+        result = await run_in_vision_executor(find_similar_to_session, session_id, k)
+    except Exception as e:
+        logger.error(f"Similar-study search failed: {str(e)}")
+        return {"error": f"Similar-study search failed: {str(e)}"}
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Session not indexed: {session_id}")
+    return result
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(
+        get_metrics_registry().render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/reports/cache")
+async def report_cache_stats():
+    cache = get_report_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/reports/prompt-cache")
+async def prompt_cache_stats():
+    cache = get_prompt_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/models")
+async def list_models():
+    return get_model_registry().memory_footprint()
+
+@app.get("/models/batching")
+async def batching_stats():
+    return {"schedulers": get_model_registry().batching_stats()}
+
+@app.get("/models/cache")
+async def embedding_cache_stats():
+    cache = get_model_registry().embedding_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.post("/models/warmup")
+async def warmup_model():
+    try:
+        await run_in_vision_executor(get_model_registry().warmup)
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {str(e)}")
+        return {"error": f"Model warm-up failed: {str(e)}"}
+    return {"status": "warm"}
+
+@app.post("/models/reload")
+async def reload_model():
+    try:
+        await run_in_vision_executor(get_model_registry().reload)
+    except Exception as e:
+        logger.error(f"Model reload failed: {str(e)}")
+        return {"error": f"Model reload failed: {str(e)}"}
+    return get_model_registry().memory_footprint()
+
+@app.post("/models/unload")
+async def unload_model():
+    return {"unloaded": await run_in_vision_executor(get_model_registry().unload)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
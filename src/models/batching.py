@@ -0,0 +1,234 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the wait-time histogram buckets
+WAIT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 250, 500, 1000]
+
+
+def concatenate(values: List[Any]) -> Any:
+    """Concatenate torch tensors or NumPy arrays along the batch dimension"""
+    if isinstance(values[0], np.ndarray):
+        return np.concatenate(values, axis=0)
+    # torch is only imported by backends that produce tensors
+    import torch
+    return torch.cat(values, dim=0)
+
+
+class _PendingBatch:
+    """A group of images submitted by one caller"""
+
+    __slots__ = ("pixel_values", "future", "enqueued_at")
+
+    def __init__(self, pixel_values: Any):
+        self.pixel_values = pixel_values
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """
+    Dynamic micro-batching in front of the vision encoder.
+    Images submitted by concurrent requests are collected for up to
+    max_wait_ms or until max_batch_size images are queued, encoded in a
+    single forward pass, and each caller receives its own slice of the features.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[Any], Any],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        name: str = "vision-encoder"
+    ):
+        """
+        Initialize the scheduler
+
+        Args:
+            encode_fn: Function encoding a [batch, 3, H, W] tensor (or NumPy array) into features
+            max_batch_size: Maximum images per forward pass
+            max_wait_ms: Maximum time the first queued image waits for company
+            name: Name of the worker thread
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[_PendingBatch]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._carry: Optional[_PendingBatch] = None
+        self._stopping = False
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._batches = 0
+        self._images = 0
+        self._batch_size_histogram: Dict[int, int] = {}
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_sum_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._wait_count = 0
+
+    def start(self) -> None:
+        """
+        Start the worker thread if it is not running
+        """
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._carry = None
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        logger.info(
+            f"Started micro-batch scheduler (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    def stop(self) -> None:
+        """
+        Stop the worker thread after it drains the queue
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        logger.info("Stopped micro-batch scheduler")
+
+    def submit(self, pixel_values: Any) -> Future:
+        """
+        Queue preprocessed images for encoding
+
+        Args:
+            pixel_values: Preprocessed image tensor of shape [n, 3, H, W]
+
+        Returns:
+            Future resolving to the [n, tokens, hidden] features of these images
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        pending = _PendingBatch(pixel_values)
+        self._queue.put(pending)
+        return pending.future
+
+    def encode(self, pixel_values: Any) -> Any:
+        """
+        Encode images through the scheduler, blocking until they are done
+
+        Args:
+            pixel_values: Preprocessed image tensor of shape [n, 3, H, W]
+
+        Returns:
+            Image features tensor of shape [n, tokens, hidden]
+        """
+        return self.submit(pixel_values).result()
+
+    def _collect(self, first: _PendingBatch) -> List[_PendingBatch]:
+        """
+        Gather queued submissions until the batch is full or the first one has waited long enough
+        """
+        batch = [first]
+        size = first.pixel_values.shape[0]
+        deadline = first.enqueued_at + self.max_wait
+
+        while size < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            if size + item.pixel_values.shape[0] > self.max_batch_size:
+                # Does not fit: it opens the next batch instead
+                self._carry = item
+                break
+            batch.append(item)
+            size += item.pixel_values.shape[0]
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            elif self._stopping:
+                break
+            else:
+                first = self._queue.get()
+                if first is None:
+                    break
+            self._run_batch(self._collect(first))
+
+    def _run_batch(self, batch: List[_PendingBatch]) -> None:
+        started = time.perf_counter()
+        sizes = [item.pixel_values.shape[0] for item in batch]
+        try:
+            pixel_values = (
+                batch[0].pixel_values if len(batch) == 1
+                else concatenate([item.pixel_values for item in batch])
+            )
+            features = self.encode_fn(pixel_values)
+        except Exception as e:
+            logger.error(f"Micro-batch of {sum(sizes)} images failed: {str(e)}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        offset = 0
+        for item, size in zip(batch, sizes):
+            item.future.set_result(features[offset:offset + size])
+            offset += size
+
+        self._record(batch, sum(sizes), started)
+
+    def _record(self, batch: List[_PendingBatch], batch_size: int, started: float) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._images += batch_size
+            self._batch_size_histogram[batch_size] = self._batch_size_histogram.get(batch_size, 0) + 1
+            for item in batch:
+                wait_ms = (started - item.enqueued_at) * 1000
+                self._wait_sum_ms += wait_ms
+                self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+                self._wait_count += 1
+                bucket = next(
+                    (i for i, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms <= bound),
+                    len(WAIT_BUCKETS_MS)
+                )
+                self._wait_histogram[bucket] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get scheduler metrics for tuning the latency/throughput trade-off
+
+        Returns:
+            Dict with queue depth, batch size histogram and wait time statistics
+        """
+        with self._stats_lock:
+            wait_labels = [f"le_{bound}ms" for bound in WAIT_BUCKETS_MS] + ["gt_1000ms"]
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "images": self._images,
+                "mean_batch_size": self._images / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items())),
+                "wait_ms": {
+                    "mean": self._wait_sum_ms / self._wait_count if self._wait_count else 0.0,
+                    "max": self._wait_max_ms,
+                    "histogram": dict(zip(wait_labels, self._wait_histogram))
+                }
+            }
@@ -0,0 +1,181 @@
+"""
+Memory-mapped MiniGPT-Med checkpoint loading.
+
+MiniGPT-Med checkpoints hold the whole model, but only the vision encoder,
+ln_vision and the projection (llama_proj) are used here. Checkpoints are
+memory-mapped (safetensors, or torch.load(mmap=True) for .pth files), so
+only the pages of the tensors that are actually loaded are read.
+
+The converter writes those tensors to a safetensors file once; it is picked
+up automatically when it sits next to the .pth checkpoint it was converted
+from (the size and mtime of the .pth are recorded in its metadata, so a
+replaced checkpoint is read again instead of its stale conversion).
+
+Usage:
+    python -m src.models.checkpoint --checkpoint checkpoints/minigpt-med.pth
+"""
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from src.models.weights import mmap_safetensors, read_safetensors_metadata, save_safetensors
+from src.utils.config import get_minigpt_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint key prefixes of the components used by the vision pipeline
+VISION_PREFIX = "visual_encoder."
+LN_VISION_PREFIX = "ln_vision."
+PROJECTION_PREFIX = "llama_proj."
+CHECKPOINT_PREFIXES = (VISION_PREFIX, LN_VISION_PREFIX, PROJECTION_PREFIX)
+
+
+def safetensors_path(checkpoint_path: str) -> Path:
+    """Get the converted safetensors file that belongs to a checkpoint"""
+    return Path(checkpoint_path).with_suffix(".safetensors")
+
+
+def source_metadata(checkpoint_path: str) -> Dict[str, str]:
+    """Identify the .pth file a conversion is made from (safetensors metadata values are strings)"""
+    stat = Path(checkpoint_path).stat()
+    return {"source_size": str(stat.st_size), "source_mtime_ns": str(stat.st_mtime_ns)}
+
+
+def is_converted_from(converted_path: Path, checkpoint_path: str) -> bool:
+    """Check that a converted file was written from the current checkpoint"""
+    try:
+        metadata = read_safetensors_metadata(str(converted_path))
+    except Exception as e:
+        logger.warning(f"Cannot read {converted_path}: {str(e)}")
+        return False
+    expected = source_metadata(checkpoint_path)
+    return all(metadata.get(key) == value for key, value in expected.items())
+
+
+def read_checkpoint(checkpoint_path: str, prefer_converted: bool = True) -> Dict[str, torch.Tensor]:
+    """
+    Memory-map the vision pipeline tensors of a checkpoint
+
+    Args:
+        checkpoint_path: .pth or .safetensors checkpoint
+        prefer_converted: Read the converted .safetensors next to a .pth file when
+            it exists and was converted from that .pth
+
+    Returns:
+        Tensors under the vision encoder, ln_vision and projection prefixes,
+        backed by the file mapping
+    """
+    path = Path(checkpoint_path)
+    converted = safetensors_path(checkpoint_path)
+    if prefer_converted and path.suffix != ".safetensors" and converted.exists():
+        if is_converted_from(converted, checkpoint_path):
+            logger.info(f"Using converted checkpoint {converted}")
+            path = converted
+        else:
+            logger.warning(
+                f"Ignoring {converted}: it was not converted from the current {path.name}, "
+                f"run python -m src.models.checkpoint again"
+            )
+
+    if path.suffix == ".safetensors":
+        state_dict = mmap_safetensors(str(path))
+    else:
+        # weights_only refuses arbitrary pickles; mmap leaves tensor data on disk until touched
+        checkpoint = torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+        state_dict = checkpoint.get("model", checkpoint.get("state_dict", checkpoint))
+
+    return {
+        name: tensor for name, tensor in state_dict.items()
+        if isinstance(tensor, torch.Tensor) and name.startswith(CHECKPOINT_PREFIXES)
+    }
+
+
+def load_component(
+    module: nn.Module,
+    tensors: Dict[str, torch.Tensor],
+    prefix: str,
+    alternate_prefix: str = ""
+) -> Tuple[int, int]:
+    """
+    Load the checkpoint tensors under a prefix into a module
+
+    Tensors are matched by name (the module's own names after stripping the
+    prefix, with or without alternate_prefix) and shape. CPU
+    tensors of the module's dtype are assigned as they are, so the module
+    keeps using the file mapping; anything else is converted once.
+
+    Args:
+        module: Module to load into
+        tensors: Checkpoint tensors (from read_checkpoint)
+        prefix: Checkpoint key prefix of the component
+        alternate_prefix: Optional inner prefix added or removed to find the module name
+
+    Returns:
+        Tuple of (loaded, skipped) tensor counts
+    """
+    targets = module.state_dict()
+    matched = {}
+    skipped = []
+    for name, tensor in tensors.items():
+        if not name.startswith(prefix):
+            continue
+        key = name[len(prefix):]
+        if alternate_prefix and key not in targets:
+            # e.g. CLIPVisionModel names with or without the inner "vision_model." (transformers 4 vs 5)
+            if alternate_prefix + key in targets:
+                key = alternate_prefix + key
+            elif key.startswith(alternate_prefix):
+                key = key[len(alternate_prefix):]
+        target = targets.get(key)
+        if target is None or target.shape != tensor.shape:
+            skipped.append(name)
+            continue
+        if tensor.dtype != target.dtype or tensor.device != target.device:
+            tensor = tensor.to(device=target.device, dtype=target.dtype)
+        matched[key] = tensor
+
+    if skipped:
+        logger.warning(
+            f"Skipped {len(skipped)} checkpoint tensors under {prefix} without a matching "
+            f"name and shape, e.g. {skipped[:3]}"
+        )
+    if matched:
+        module.load_state_dict(matched, strict=False, assign=True)
+    return len(matched), len(skipped)
+
+
+def convert_to_safetensors(checkpoint_path: str, output_path: Optional[str] = None) -> Path:
+    """
+    Write the vision pipeline tensors of a .pth checkpoint to safetensors
+
+    Args:
+        checkpoint_path: .pth checkpoint
+        output_path: Destination (defaults to the checkpoint path with a .safetensors suffix)
+
+    Returns:
+        Path of the written file
+    """
+    output = Path(output_path) if output_path else safetensors_path(checkpoint_path)
+    tensors = read_checkpoint(checkpoint_path, prefer_converted=False)
+    save_safetensors(tensors, str(output), metadata=source_metadata(checkpoint_path))
+    logger.info(f"Wrote {len(tensors)} tensors from {checkpoint_path} to {output}")
+    return output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None, help="MiniGPT-Med .pth checkpoint (defaults to config.yaml)")
+    parser.add_argument("--output", default=None, help="destination .safetensors file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    output = convert_to_safetensors(args.checkpoint or str(get_minigpt_checkpoint()), args.output)
+    print(f"wrote {output} ({output.stat().st_size / 1024 ** 2:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
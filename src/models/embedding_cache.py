@@ -0,0 +1,181 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Part of every key: entries written in an older layout (e.g. fp32 projected
+# embeddings with a separate attention mask) are never read back
+ENTRY_FORMAT = "fp16-features"
+
+
+def to_numpy(value: Any) -> np.ndarray:
+    """Convert a torch tensor to a CPU NumPy array; arrays pass through"""
+    if isinstance(value, np.ndarray):
+        return value
+    return value.detach().cpu().numpy()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of compact vision features (see VisionResult).
+    Entries are keyed by a hash of the decoded pixels plus the model identity,
+    kept as fp16 NumPy arrays in an in-memory LRU tier bounded by a byte budget
+    and optionally persisted as memory-mapped .npy files on disk.
+    """
+
+    def __init__(self, max_memory_bytes: int = 256 * 1024 * 1024, disk_dir: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_memory_bytes: Byte budget of the in-memory tier
+            disk_dir: Directory of the on-disk tier, or None to keep entries in memory only
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        logger.info(
+            f"Embedding cache initialized ({max_memory_bytes // (1024 * 1024)} MB in memory, "
+            f"disk tier: {disk_dir or 'disabled'})"
+        )
+
+    @staticmethod
+    def image_key(image: Image.Image, model_identity: str) -> str:
+        """
+        Compute the cache key of an image for a given model
+
+        Args:
+            image: PIL Image object
+            model_identity: String identifying the model weights and settings
+
+        Returns:
+            Hex digest identifying the image pixels and the model
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{ENTRY_FORMAT}|{model_identity}".encode())
+        digest.update(f"{image.mode}:{image.width}x{image.height}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up cached features
+
+        Args:
+            key: Cache key from image_key
+
+        Returns:
+            fp16 features array, or None on a miss
+        """
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return features
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    # Copy-on-write mapping: pages are read lazily and never written back
+                    features = np.load(path, mmap_mode="c")
+                    with self._lock:
+                        self.disk_hits += 1
+                    self._remember(key, features)
+                    return features
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable embedding cache entry {key}: {str(e)}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, features: Any) -> None:
+        """
+        Store features in the cache
+
+        Args:
+            key: Cache key from image_key
+            features: Vision features (torch tensor or NumPy array), stored as fp16
+        """
+        features = to_numpy(features).astype(np.float16, copy=False)
+        self._remember(key, features)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so readers never see a partial file
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, features)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning(f"Could not persist embedding cache entry {key}: {str(e)}")
+
+    def _remember(self, key: str, features: np.ndarray) -> None:
+        if features.nbytes > self.max_memory_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous.nbytes
+            self._entries[key] = features
+            self._memory_bytes += features.nbytes
+
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drop every in-memory entry (the disk tier is kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Dict with hit/miss counters and memory usage
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "disk_dir": self.disk_dir
+            }
@@ -0,0 +1,137 @@
+import copy
+import logging
+from typing import Callable, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# Compute dtype of each precision; int8 quantises Linear weights and keeps fp32 activations
+PRECISION_DTYPES = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+    "int8": torch.float32
+}
+
+GRAPH_MODES = ("eager", "compile", "torchscript")
+
+
+class VisionTower(nn.Module):
+    """
+    CLIP vision model followed by ln_vision, returning a plain tensor so the
+    whole tower can be traced or compiled as one graph
+    """
+
+    def __init__(self, vision_model: nn.Module, ln_vision: nn.Module):
+        super().__init__()
+        self.vision_model = vision_model
+        self.ln_vision = ln_vision
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        outputs = self.vision_model(pixel_values=pixel_values)
+        return self.ln_vision(outputs.last_hidden_state)
+
+
+def resolve_precision(precision: str, device: str) -> str:
+    """
+    Validate a precision against the device, falling back to fp32 when unsupported
+
+    Args:
+        precision: Requested precision ("fp32", "bf16", "fp16" or "int8")
+        device: Device the model runs on
+
+    Returns:
+        Precision that will actually be used
+    """
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(f"Unknown precision: {precision}")
+    on_cuda = str(device).startswith("cuda")
+    if precision == "fp16" and not on_cuda:
+        logger.warning("fp16 is not supported for CPU inference, using fp32")
+        return "fp32"
+    if precision == "int8" and on_cuda:
+        # Dynamic quantisation kernels are CPU only
+        logger.warning("int8 dynamic quantisation is CPU only, using fp32")
+        return "fp32"
+    return precision
+
+
+def convert_precision(module: nn.Module, precision: str) -> nn.Module:
+    """
+    Build a copy of a module running at the given precision
+
+    Args:
+        module: fp32 module (left untouched)
+        precision: Target precision
+
+    Returns:
+        Converted module
+    """
+    if precision == "int8":
+        # quantize_dynamic only swaps child modules: wrapped, a bare nn.Linear is converted too
+        return torch.ao.quantization.quantize_dynamic(nn.Sequential(module), {nn.Linear}, dtype=torch.qint8)[0]
+    return copy.deepcopy(module).to(PRECISION_DTYPES[precision])
+
+
+def build_graph(
+    module: nn.Module,
+    graph_mode: str,
+    example: torch.Tensor
+) -> Callable[[torch.Tensor], torch.Tensor]:
+    """
+    Wrap a module in the requested execution mode
+
+    Args:
+        module: Module to run
+        graph_mode: "eager", "compile" (torch.compile) or "torchscript" (traced)
+        example: Example input used for tracing
+
+    Returns:
+        Callable taking and returning tensors
+    """
+    if graph_mode == "eager":
+        return module
+    if graph_mode == "compile":
+        # Batch sizes vary with micro-batching: avoid one recompilation per size
+        return torch.compile(module, dynamic=True)
+    if graph_mode == "torchscript":
+        with torch.no_grad():
+            return torch.jit.trace(module, example, check_trace=False)
+    raise ValueError(f"Unknown graph mode: {graph_mode}")
+
+
+def probe_pixel_values(batch_size: int, height: int, width: int) -> torch.Tensor:
+    """
+    Deterministic normalised pixel values used by the drift check
+
+    Args:
+        batch_size: Number of probe images
+        height: Image height
+        width: Image width
+
+    Returns:
+        float32 tensor of shape [batch, 3, height, width]
+    """
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(batch_size, 3, height, width, generator=generator).clamp_(-2.0, 2.0)
+
+
+def embedding_cosine(reference: torch.Tensor, candidate: torch.Tensor) -> Tuple[float, float]:
+    """
+    Compare embeddings token by token
+
+    Args:
+        reference: fp32 eager embeddings
+        candidate: Embeddings of the optimised mode
+
+    Returns:
+        Tuple of (mean, min) cosine similarity over every token
+    """
+    similarity = nn.functional.cosine_similarity(
+        reference.float().flatten(0, -2),
+        candidate.float().flatten(0, -2),
+        dim=-1
+    )
+    return similarity.mean().item(), similarity.min().item()
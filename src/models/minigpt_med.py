@@ -2,10 +2,32 @@ import os
 import sys
 import torch
 import torch.nn as nn
+import numpy as np
 from transformers import CLIPVisionModel, CLIPImageProcessor
 from PIL import Image
 import logging
-from typing import Dict, Any, Union, List, Optional
+from typing import Dict, Any, Union, List, Optional, Tuple
+
+from src.models.preprocessing import BatchPreprocessor
+from src.models.vision_result import VisionResult
+from src.utils.metrics import stage_timer
+from src.models.checkpoint import (
+    LN_VISION_PREFIX,
+    PROJECTION_PREFIX,
+    VISION_PREFIX,
+    load_component,
+    read_checkpoint
+)
+from src.models.inference import (
+    GRAPH_MODES,
+    PRECISION_DTYPES,
+    VisionTower,
+    build_graph,
+    convert_precision,
+    embedding_cosine,
+    probe_pixel_values,
+    resolve_precision
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +42,9 @@ class MiniGPTMedVisionEncoder:
         device: str = "cuda" if torch.cuda.is_available() else "cpu",
         image_size: int = 448,
         vision_model_name: str = "EVA_CLIP_g_14_X",
-        precision: str = "fp16"
+        precision: str = "fp16",
+        preprocessing: str = "tensor",
+        clip_model: str = "openai/clip-vit-base-patch32"
     ):
         """
         Initialize the vision encoder
@@ -30,17 +54,25 @@ class MiniGPTMedVisionEncoder:
             image_size: Size to resize images to
             vision_model_name: Name of the vision model
             precision: Precision for model weights
+            preprocessing: "tensor" for the batched BatchPreprocessor, "hf" for CLIPImageProcessor
+            clip_model: Hugging Face id or local directory of the CLIP vision model used as the encoder
         """
+        if preprocessing not in ("tensor", "hf"):
+            raise ValueError(f"Unknown preprocessing backend: {preprocessing}")
+        
         self.device = device
         self.image_size = image_size
         self.vision_model_name = vision_model_name
         self.precision = precision
+        self.preprocessing = preprocessing
+        self.clip_model = clip_model
         
         # In a real implementation, we would initialize the EVA-CLIP model here
         # For now, we'll use a standard CLIP vision model as a placeholder
         try:
-            self.image_processor = CLIPImageProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            self.vision_model = CLIPVisionModel.from_pretrained("openai/clip-vit-base-patch32").to(device)
+            self.image_processor = CLIPImageProcessor.from_pretrained(clip_model)
+            self.preprocessor = BatchPreprocessor.from_hf_processor(self.image_processor)
+            self.vision_model = CLIPVisionModel.from_pretrained(clip_model).to(device)
             
             # Freeze the vision model
             for param in self.vision_model.parameters():
@@ -49,7 +81,14 @@ class MiniGPTMedVisionEncoder:
             self.vision_model.eval()
             
             # Layer normalization for vision features
-            self.ln_vision = nn.LayerNorm(768).to(device)  # 768 is the dimension of CLIP features
+            self.hidden_size = self.vision_model.config.hidden_size  # 768 for CLIP ViT-B/32
+            self.ln_vision = nn.LayerNorm(self.hidden_size).to(device)
+            
+            # Module run at inference time and the callable executing it
+            # (replaced by MiniGPTMedModel.configure_inference)
+            self.tower = VisionTower(self.vision_model, self.ln_vision).eval()
+            self.graph = self.tower
+            self.compute_dtype = torch.float32
             
             logger.info(f"Initialized vision encoder on {device}")
         except Exception as e:
@@ -66,23 +105,54 @@ class MiniGPTMedVisionEncoder:
         Returns:
             Preprocessed image tensor
         """
-        try:
-            # Convert image path to PIL Image if needed
-            pil_image = image
-            if isinstance(image, str):
-                pil_image = Image.open(image).convert("RGB")
+        return self.preprocess_images([image])
+    
+    def preprocess_images(self, images: List[Union[str, Image.Image]]) -> torch.Tensor:
+        """
+        Preprocess a list of images into one stacked tensor
+        
+        Args:
+            images: Paths to image files or PIL Image objects
             
-            # Preprocess the image
-            inputs = self.image_processor(
-                images=pil_image, 
-                return_tensors="pt"
-            ).to(self.device)
+        Returns:
+            Preprocessed image tensor of shape [batch, 3, height, width]
+        """
+        try:
+            pil_images = [
+                Image.open(image).convert("RGB") if isinstance(image, str) else image
+                for image in images
+            ]
             
-            return inputs.pixel_values
+            with stage_timer("preprocess"):
+                if self.preprocessing == "tensor":
+                    return torch.from_numpy(self.preprocessor(pil_images)).to(self.device)
+                
+                inputs = self.image_processor(
+                    images=pil_images,
+                    return_tensors="pt"
+                ).to(self.device)
+                
+                return inputs.pixel_values
         except Exception as e:
-            logger.error(f"Error preprocessing image: {str(e)}")
+            logger.error(f"Error preprocessing images: {str(e)}")
             raise
     
+    def encode_pixel_values(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Run preprocessed pixel values through the vision model
+        
+        Args:
+            pixel_values: Preprocessed image tensor of shape [batch, 3, height, width]
+            
+        Returns:
+            Image features tensor of shape [batch, tokens, hidden]
+        """
+        with torch.no_grad(), stage_timer("encode"):
+            # Vision model followed by layer normalization, at the configured precision
+            image_features = self.graph(pixel_values.to(self.compute_dtype))
+        
+        return image_features
+    
     def encode_image(self, image: Union[str, Image.Image]) -> torch.Tensor:
         """
         Encode an image using the vision encoder
@@ -98,17 +168,26 @@ class MiniGPTMedVisionEncoder:
             image_tensor = self.preprocess_image(image)
             
             # Encode the image
-            with torch.no_grad():
-                outputs = self.vision_model(image_tensor)
-                image_features = outputs.last_hidden_state
-            
-            # Apply layer normalization
-            image_features = self.ln_vision(image_features)
-            
-            return image_features
+            return self.encode_pixel_values(image_tensor)
         except Exception as e:
             logger.error(f"Error encoding image: {str(e)}")
             raise
+    
+    def encode_images(self, images: List[Union[str, Image.Image]]) -> torch.Tensor:
+        """
+        Encode a list of images in a single forward pass
+        
+        Args:
+            images: Paths to image files or PIL Image objects
+            
+        Returns:
+            Image features tensor with one row per image
+        """
+        try:
+            return self.encode_pixel_values(self.preprocess_images(images))
+        except Exception as e:
+            logger.error(f"Error encoding images: {str(e)}")
+            raise
 
 
 class MiniGPTMedProjection:
@@ -132,6 +211,7 @@ class MiniGPTMedProjection:
             device: Device to run the model on
         """
         self.device = device
+        self.llm_hidden_size = llm_hidden_size
         
         # Initialize the projection layer
         self.projection = nn.Linear(
@@ -165,20 +245,34 @@ class MiniGPTMedProjection:
             # Ensure we have at least 12 patches for compatibility with common LLM expectations
             if pn < 12:
                 # Pad with zeros if needed
-                padding = torch.zeros(bs, 12 - pn, hs, device=features.device)
+                padding = torch.zeros(bs, 12 - pn, hs, dtype=features.dtype, device=features.device)
                 features = torch.cat([features, padding], dim=1)
                 pn = 12
             
             # Project each patch directly without reshaping
-            projected_features = self.projection(features)
+            with torch.no_grad(), stage_timer("project"):
+                # Reduced-precision modes still hand fp32 embeddings downstream
+                projected_features = self.projection(features).float()
             
-            # Log the shapes for debugging
-            logger.info(f"Vision features shape: {features.shape}, Projected shape: {projected_features.shape}")
+            # Log the shapes for debugging (per request, so not at INFO)
+            logger.debug(f"Vision features shape: {features.shape}, Projected shape: {projected_features.shape}")
             
             return projected_features
         except Exception as e:
             logger.error(f"Error projecting features: {str(e)}")
             raise
+    
+    def output_shape(self, tokens: int) -> Tuple[int, int, int]:
+        """
+        Shape of the projected features of one image, without projecting
+        
+        Args:
+            tokens: Number of vision tokens, CLS included
+            
+        Returns:
+            Tuple of (1, patches, llm_hidden_size)
+        """
+        return (1, max(tokens - 1, 12), self.llm_hidden_size)
 
 
 class MiniGPTMedModel:
@@ -190,7 +284,13 @@ class MiniGPTMedModel:
     def __init__(
         self,
         checkpoint_path: str,
-        device: str = "cuda" if torch.cuda.is_available() else "cpu"
+        device: str = "cuda" if torch.cuda.is_available() else "cpu",
+        precision: str = "fp32",
+        max_batch_size: int = 8,
+        preprocessing: str = "tensor",
+        graph_mode: str = "eager",
+        drift_min_cosine: float = 0.99,
+        clip_model: str = "openai/clip-vit-base-patch32"
     ):
         """
         Initialize the MiniGPT-Med model
@@ -198,42 +298,213 @@ class MiniGPTMedModel:
         Args:
             checkpoint_path: Path to the MiniGPT-Med checkpoint
             device: Device to run the model on
+            precision: Precision for model weights
+            max_batch_size: Maximum number of images per vision forward pass
+            preprocessing: Image preprocessing backend ("tensor" or "hf")
+            graph_mode: Execution mode of the vision tower ("eager", "compile" or "torchscript")
+            drift_min_cosine: Minimum token cosine similarity to fp32 eager embeddings
+                for an optimised mode to be kept
+            clip_model: Hugging Face id or local directory of the CLIP vision model
         """
         self.checkpoint_path = checkpoint_path
         self.device = device
+        self.precision = precision
+        self.max_batch_size = max(1, max_batch_size)
+        
+        # Optional MicroBatchScheduler shared by concurrent callers
+        self.scheduler = None
+        
+        # Optional EmbeddingCache of compact vision features
+        self.embedding_cache = None
         
         # Initialize components
-        self.vision_encoder = MiniGPTMedVisionEncoder(device=device)
-        self.projection = MiniGPTMedProjection(device=device)
+        self.vision_encoder = MiniGPTMedVisionEncoder(
+            device=device,
+            precision=precision,
+            preprocessing=preprocessing,
+            clip_model=clip_model
+        )
+        self.projection = MiniGPTMedProjection(
+            vision_hidden_size=self.vision_encoder.hidden_size,
+            device=device
+        )
         
-        # Load weights
+        # Load weights, then switch to the requested inference mode
         self.load_weights()
+        self.graph_mode = "eager"
+        self.inference_report = self.configure_inference(precision, graph_mode, drift_min_cosine)
+        self.identity = self.model_identity()
+        # Size of the cached features (and of the pooled study vectors built from them)
+        self.feature_dim = self.vision_encoder.hidden_size
         
         logger.info(f"Initialized MiniGPT-Med model on {device}")
     
-    def load_weights(self):
+    def load_weights(self) -> Dict[str, int]:
         """
-        Load weights from checkpoint
+        Load the vision encoder, ln_vision and projection weights from the
+        memory-mapped checkpoint; tensors that do not match the components
+        by name and shape are skipped
+        
+        Returns:
+            Dict with the number of loaded and skipped tensors
         """
         try:
             logger.info(f"Loading weights from {self.checkpoint_path}")
             
-            # Load checkpoint
-            checkpoint = torch.load(self.checkpoint_path, map_location="cpu")
+            tensors = read_checkpoint(self.checkpoint_path)
+            encoder = self.vision_encoder
+            loaded, skipped = 0, 0
+            for module, prefix, alternate_prefix in (
+                (encoder.vision_model, VISION_PREFIX, "vision_model."),
+                (encoder.ln_vision, LN_VISION_PREFIX, ""),
+                (self.projection.projection, PROJECTION_PREFIX, "")
+            ):
+                counts = load_component(module, tensors, prefix, alternate_prefix)
+                loaded += counts[0]
+                skipped += counts[1]
             
-            # In a real implementation, we would:
-            # 1. Extract vision encoder weights from checkpoint
-            # 2. Extract projection layer weights from checkpoint
-            # 3. Load these weights into our components
-            
-            # For now, we'll just log that weights were "loaded"
-            logger.info("Weights loaded successfully")
+            if loaded == 0:
+                logger.warning(f"No vision weights in {self.checkpoint_path}, keeping the initial weights")
+            else:
+                logger.info(f"Weights loaded successfully ({loaded} tensors, {skipped} skipped)")
+            return {"loaded": loaded, "skipped": skipped}
             
         except Exception as e:
             logger.error(f"Error loading weights: {str(e)}")
             raise
     
-    def process_image(self, image: Union[str, Image.Image]) -> Dict[str, Any]:
+    def configure_inference(
+        self,
+        precision: str,
+        graph_mode: str = "eager",
+        min_cosine: float = 0.99
+    ) -> Dict[str, Any]:
+        """
+        Switch the vision tower and projection to an inference mode
+        
+        The converted modules are checked against the fp32 eager embeddings of
+        a fixed probe batch; a mode that fails to run or drifts below min_cosine
+        is rejected and the model stays in fp32 eager mode.
+        
+        Args:
+            precision: "fp32", "bf16", "fp16" (CUDA only) or "int8" (dynamic quantisation, CPU only)
+            graph_mode: "eager", "compile" or "torchscript"
+            min_cosine: Minimum token cosine similarity to the fp32 eager embeddings
+            
+        Returns:
+            Dict describing the requested and active mode and the measured drift
+        """
+        if graph_mode not in GRAPH_MODES:
+            raise ValueError(f"Unknown graph mode: {graph_mode}")
+        
+        encoder = self.vision_encoder
+        report = {
+            "requested": f"{precision}/{graph_mode}",
+            "precision": "fp32",
+            "graph_mode": "eager",
+            "cosine_mean": 1.0,
+            "cosine_min": 1.0,
+            "fallback": False
+        }
+        precision = resolve_precision(precision, self.device)
+        self.precision = "fp32"
+        
+        if precision != "fp32" or graph_mode != "eager":
+            preprocessor = encoder.preprocessor
+            probe = probe_pixel_values(2, preprocessor.crop_height, preprocessor.crop_width).to(self.device)
+            reference = self.projection.project(encoder.encode_pixel_values(probe))
+            saved = (
+                encoder.tower, encoder.graph, encoder.compute_dtype,
+                encoder.vision_model, encoder.ln_vision, self.projection.projection
+            )
+            
+            try:
+                dtype = PRECISION_DTYPES[precision]
+                tower = convert_precision(encoder.tower, precision)
+                encoder.graph = build_graph(tower, graph_mode, probe.to(dtype))
+                encoder.tower, encoder.compute_dtype = tower, dtype
+                encoder.vision_model, encoder.ln_vision = tower.vision_model, tower.ln_vision
+                self.projection.projection = convert_precision(self.projection.projection, precision)
+                
+                # Also compiles lazily built graphs before the first request
+                candidate = self.projection.project(encoder.encode_pixel_values(probe))
+                report["cosine_mean"], report["cosine_min"] = embedding_cosine(reference, candidate)
+                if report["cosine_min"] < min_cosine:
+                    raise ValueError(
+                        f"embedding drift too large (min cosine {report['cosine_min']:.4f} < {min_cosine})"
+                    )
+                
+                report["precision"], report["graph_mode"] = precision, graph_mode
+                self.precision = precision
+            except Exception as e:
+                logger.error(f"Rejected inference mode {precision}/{graph_mode}, using fp32 eager: {str(e)}")
+                (
+                    encoder.tower, encoder.graph, encoder.compute_dtype,
+                    encoder.vision_model, encoder.ln_vision, self.projection.projection
+                ) = saved
+                report["fallback"] = True
+        
+        self.graph_mode = report["graph_mode"]
+        logger.info(
+            f"Inference mode {self.precision}/{self.graph_mode} "
+            f"(token cosine to fp32 eager: mean {report['cosine_mean']:.5f}, min {report['cosine_min']:.5f})"
+        )
+        return report
+    
+    def model_identity(self) -> str:
+        """
+        Build a string identifying the weights and settings that produce the embeddings
+        
+        Returns:
+            Identity string used to key cached features
+        """
+        try:
+            stat = os.stat(self.checkpoint_path)
+            checkpoint = f"{os.path.abspath(self.checkpoint_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            checkpoint = str(self.checkpoint_path)
+        return (
+            f"{checkpoint}|{self.vision_encoder.vision_model_name}|{self.vision_encoder.clip_model}|"
+            f"{self.precision}|{self.graph_mode}|{self.vision_encoder.image_size}|"
+            f"{self.vision_encoder.preprocessing}"
+        )
+    
+    def encode_pixel_values(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Encode preprocessed images, going through the micro-batch scheduler when one is attached
+        
+        Args:
+            pixel_values: Preprocessed image tensor of shape [batch, 3, height, width]
+            
+        Returns:
+            Image features tensor of shape [batch, tokens, hidden]
+        """
+        if self.scheduler is not None:
+            return self.scheduler.encode(pixel_values)
+        return self.vision_encoder.encode_pixel_values(pixel_values)
+    
+    def project_features(self, features: np.ndarray) -> torch.Tensor:
+        """
+        Project stored vision features to LLM space
+        
+        Args:
+            features: fp16 features of shape [batch, tokens, hidden] (see VisionResult)
+            
+        Returns:
+            Projected features tensor of shape [batch, patches, llm_hidden]
+        """
+        vision_features = torch.from_numpy(features).to(self.device, self.vision_encoder.compute_dtype)
+        return self.projection.project(vision_features)
+    
+    def vision_result(self, features: np.ndarray, size: Tuple[int, int]) -> VisionResult:
+        """Wrap the compact features of one image with a lazy projection"""
+        return VisionResult(
+            size[0], size[1], features,
+            self.projection.output_shape(features.shape[1]),
+            project=self.project_features
+        )
+    
+    def process_image(self, image: Union[str, Image.Image]) -> VisionResult:
         """
         Process an image through the full MiniGPT-Med pipeline
         
@@ -241,32 +512,131 @@ class MiniGPTMedModel:
             image: Path to image file or PIL Image object
             
         Returns:
-            Dict with processed image data and embeddings
+            VisionResult with the image size and lazily projected embeddings
         """
         try:
-            # Convert image path to PIL Image if needed
-            pil_image = image
-            if isinstance(image, str):
-                pil_image = Image.open(image).convert("RGB")
-            
-            # Encode the image
-            vision_features = self.vision_encoder.encode_image(pil_image)
-            
-            # Project to LLM space
-            projected_features = self.projection.project(vision_features)
-            
-            # Create attention mask (all 1s)
-            attention_mask = torch.ones(
-                projected_features.size()[:-1], 
-                dtype=torch.long
-            ).to(self.device)
-            
-            return {
-                "embeddings": projected_features,
-                "attention_mask": attention_mask,
-                "width": pil_image.width,
-                "height": pil_image.height
-            }
+            return self.process_images_batch([image], max_batch_size=1)[0]
         except Exception as e:
             logger.error(f"Error processing image: {str(e)}")
             raise
+    
+    def process_images_batch(
+        self,
+        images: List[Union[str, Image.Image]],
+        max_batch_size: Optional[int] = None,
+        use_cache: bool = True
+    ) -> List[VisionResult]:
+        """
+        Process several images through the pipeline with batched forward passes
+        
+        Only the vision tower runs here: its features are copied to the CPU
+        as fp16 and projected when a consumer reads VisionResult.embeddings.
+        
+        Args:
+            images: Paths to image files or PIL Image objects
+            max_batch_size: Maximum images per forward pass (defaults to the model setting)
+            use_cache: Look up and store features in the embedding cache when one is attached
+            
+        Returns:
+            List with one VisionResult per input image, in order
+        """
+        try:
+            pil_images = [
+                Image.open(image).convert("RGB") if isinstance(image, str) else image
+                for image in images
+            ]
+            results: List[Optional[VisionResult]] = [None] * len(pil_images)
+            # Images decoded at reduced resolution remember their uploaded size
+            original_sizes = [img.info.get("original_size", img.size) for img in pil_images]
+            cache = self.embedding_cache if use_cache else None
+            
+            # Serve already-seen images from the cache and only encode the rest
+            keys: List[Optional[str]] = [None] * len(pil_images)
+            pending = list(range(len(pil_images)))
+            if cache is not None:
+                pending = []
+                for i, pil_image in enumerate(pil_images):
+                    keys[i] = cache.image_key(pil_image, self.identity)
+                    cached = cache.get(keys[i])
+                    if cached is None:
+                        pending.append(i)
+                    else:
+                        results[i] = self.vision_result(cached, original_sizes[i])
+            
+            batch_size = max(1, max_batch_size or self.max_batch_size)
+            chunks = [
+                pending[start:start + batch_size]
+                for start in range(0, len(pending), batch_size)
+            ]
+            
+            if self.scheduler is not None:
+                # Queue every chunk up front so they can share forward passes with other requests
+                futures = [
+                    self.scheduler.submit(
+                        self.vision_encoder.preprocess_images([pil_images[i] for i in chunk])
+                    )
+                    for chunk in chunks
+                ]
+                chunk_features = (future.result() for future in futures)
+            else:
+                chunk_features = (
+                    self.vision_encoder.encode_images([pil_images[i] for i in chunk])
+                    for chunk in chunks
+                )
+            
+            for chunk, vision_features in zip(chunks, chunk_features):
+                # One device-to-host copy per chunk, then the device tensor is dropped
+                features = vision_features.to("cpu", torch.float16).numpy()
+                del vision_features
+                
+                # Split the batch back out per image
+                for j, i in enumerate(chunk):
+                    image_features = features[j:j + 1]
+                    if cache is not None:
+                        cache.put(keys[i], image_features)
+                    results[i] = self.vision_result(image_features, original_sizes[i])
+            
+            return results
+        except Exception as e:
+            logger.error(f"Error processing image batch: {str(e)}")
+            raise
+    
+    def warmup(self) -> None:
+        """
+        Run a blank image through the pipeline so the first real request
+        does not pay for lazy kernel initialisation
+        """
+        try:
+            size = self.vision_encoder.image_size
+            blank = Image.new("RGB", (size, size))
+            # Reading the embeddings also warms up the projection
+            self.process_images_batch([blank], use_cache=False)[0].embeddings
+            logger.info("MiniGPT-Med warm-up completed")
+        except Exception as e:
+            logger.error(f"Error during warm-up: {str(e)}")
+            raise
+    
+    def memory_footprint(self) -> Dict[str, int]:
+        """
+        Compute the memory held by the model parameters and buffers
+        
+        Returns:
+            Dict with the size in bytes of each component and the total
+        """
+        modules = {
+            "vision_model": self.vision_encoder.vision_model,
+            "ln_vision": self.vision_encoder.ln_vision,
+            "projection": self.projection.projection
+        }
+        footprint = {}
+        for name, module in modules.items():
+            # state_dict also covers the packed weights of quantised layers
+            tensors = []
+            for value in module.state_dict().values():
+                if isinstance(value, tuple):
+                    tensors.extend(v for v in value if isinstance(v, torch.Tensor))
+                elif isinstance(value, torch.Tensor):
+                    tensors.append(value)
+            footprint[name] = sum(t.numel() * t.element_size() for t in tensors)
+        footprint["total"] = sum(footprint.values())
+        return footprint
@@ -0,0 +1,251 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from src.models.preprocessing import BatchPreprocessor
+from src.models.vision_result import FEATURE_DTYPE, VisionResult
+from src.utils.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+
+class OnnxMiniGPTMedModel:
+    """
+    MiniGPT-Med vision pipeline (vision tower, ln_vision and projection) exported
+    by src.models.onnx_export and executed with onnxruntime on CPU.
+    Imports neither torch nor transformers and exposes the same processing
+    interface as MiniGPTMedModel; the graph includes the projection, so results
+    hold the embeddings themselves (as fp16) and read them back as float32 arrays.
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        max_batch_size: int = 8,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        graph_optimization: str = "all",
+        optimized_model_path: Optional[str] = None
+    ):
+        """
+        Initialize the onnxruntime session
+
+        Args:
+            onnx_path: Exported .onnx file (with its .json sidecar)
+            max_batch_size: Maximum number of images per session run
+            intra_op_threads: Threads used inside an operator (0 lets onnxruntime decide)
+            inter_op_threads: Threads used across independent operators (0 lets onnxruntime decide)
+            graph_optimization: "disable", "basic", "extended" or "all"
+            optimized_model_path: Where to save the optimised graph, to skip optimisation on later loads
+        """
+        if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+
+        self.checkpoint_path = onnx_path
+        self.device = "cpu"
+        self.precision = "fp32"
+        self.graph_mode = "onnx"
+        self.max_batch_size = max(1, max_batch_size)
+
+        # Optional MicroBatchScheduler shared by concurrent callers
+        self.scheduler = None
+
+        # Optional EmbeddingCache of compact (fp16) embeddings
+        self.embedding_cache = None
+
+        try:
+            with open(f"{onnx_path}.json", "r", encoding="utf-8") as f:
+                self.metadata = json.load(f)
+            self.preprocessor = BatchPreprocessor(**self.metadata["preprocessing"])
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization]
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = inter_op_threads
+            if inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+            if optimized_model_path:
+                options.optimized_model_filepath = optimized_model_path
+
+            self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+            self.output_name = self.session.get_outputs()[0].name
+        except Exception as e:
+            logger.error(f"Error loading ONNX model: {str(e)}")
+            raise
+
+        self.identity = self.model_identity()
+        # The results hold the projected embeddings themselves
+        self.feature_dim = self.session.get_outputs()[0].shape[-1]
+        self.inference_report = {
+            "backend": "onnxruntime",
+            "providers": self.session.get_providers(),
+            "graph_optimization": graph_optimization,
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "verification": self.metadata.get("verification")
+        }
+
+        logger.info(f"Initialized ONNX MiniGPT-Med model from {onnx_path}")
+
+    def model_identity(self) -> str:
+        """
+        Build a string identifying the exported weights and settings
+
+        Returns:
+            Identity string used to key cached features
+        """
+        source = self.metadata.get("source_identity") or os.path.abspath(self.checkpoint_path)
+        # The graph includes the projection: cached entries (and pooled study vectors) are
+        # 4096-d embeddings, not the pre-projection features the torch backend stores
+        return f"{source}|onnx-projected"
+
+    def encode_pixel_values(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Run preprocessed images through the exported graph
+
+        Args:
+            pixel_values: float32 array of shape [batch, 3, height, width]
+
+        Returns:
+            Projected embeddings of shape [batch, tokens, 4096]
+        """
+        # The exported graph includes the projection, so both are timed as "encode"
+        with stage_timer("encode"):
+            return self.session.run([self.output_name], {self.input_name: pixel_values})[0]
+
+    def preprocess_images(self, images: List[Image.Image]) -> np.ndarray:
+        """
+        Resize, crop and normalise images into one float32 batch
+
+        Args:
+            images: PIL Images
+
+        Returns:
+            float32 array of shape [batch, 3, height, width]
+        """
+        with stage_timer("preprocess"):
+            return self.preprocessor(images)
+
+    def process_image(self, image: Union[str, Image.Image]) -> VisionResult:
+        """
+        Process an image through the full pipeline
+
+        Args:
+            image: Path to image file or PIL Image object
+
+        Returns:
+            VisionResult with the image size and embeddings
+        """
+        try:
+            return self.process_images_batch([image], max_batch_size=1)[0]
+        except Exception as e:
+            logger.error(f"Error processing image: {str(e)}")
+            raise
+
+    def process_images_batch(
+        self,
+        images: List[Union[str, Image.Image]],
+        max_batch_size: Optional[int] = None,
+        use_cache: bool = True
+    ) -> List[VisionResult]:
+        """
+        Process several images with batched session runs
+
+        Args:
+            images: Paths to image files or PIL Image objects
+            max_batch_size: Maximum images per session run (defaults to the model setting)
+            use_cache: Look up and store features in the embedding cache when one is attached
+
+        Returns:
+            List with one VisionResult per input image, in order
+        """
+        try:
+            pil_images = [
+                Image.open(image).convert("RGB") if isinstance(image, str) else image
+                for image in images
+            ]
+            results: List[Optional[VisionResult]] = [None] * len(pil_images)
+            original_sizes = [img.info.get("original_size", img.size) for img in pil_images]
+            cache = self.embedding_cache if use_cache else None
+
+            keys: List[Optional[str]] = [None] * len(pil_images)
+            pending = list(range(len(pil_images)))
+            if cache is not None:
+                pending = []
+                for i, pil_image in enumerate(pil_images):
+                    keys[i] = cache.image_key(pil_image, self.identity)
+                    cached = cache.get(keys[i])
+                    if cached is None:
+                        pending.append(i)
+                    else:
+                        results[i] = VisionResult(*original_sizes[i], cached, cached.shape)
+
+            batch_size = max(1, max_batch_size or self.max_batch_size)
+            chunks = [
+                pending[start:start + batch_size]
+                for start in range(0, len(pending), batch_size)
+            ]
+
+            if self.scheduler is not None:
+                # Queue every chunk up front so they can share session runs with other requests
+                futures = [
+                    self.scheduler.submit(self.preprocess_images([pil_images[i] for i in chunk]))
+                    for chunk in chunks
+                ]
+                chunk_features = (future.result() for future in futures)
+            else:
+                chunk_features = (
+                    self.encode_pixel_values(self.preprocess_images([pil_images[i] for i in chunk]))
+                    for chunk in chunks
+                )
+
+            for chunk, projected_features in zip(chunks, chunk_features):
+                embeddings = projected_features.astype(FEATURE_DTYPE)
+                del projected_features
+                for j, i in enumerate(chunk):
+                    image_embeddings = embeddings[j:j + 1]
+                    if cache is not None:
+                        cache.put(keys[i], image_embeddings)
+                    results[i] = VisionResult(*original_sizes[i], image_embeddings, image_embeddings.shape)
+
+            return results
+        except Exception as e:
+            logger.error(f"Error processing image batch: {str(e)}")
+            raise
+
+    def warmup(self) -> None:
+        """
+        Run a blank image through the session so the first real request
+        does not pay for lazy initialisation
+        """
+        try:
+            size = self.metadata.get("image_size", 448)
+            self.process_images_batch([Image.new("RGB", (size, size))], use_cache=False)
+            logger.info("ONNX MiniGPT-Med warm-up completed")
+        except Exception as e:
+            logger.error(f"Error during warm-up: {str(e)}")
+            raise
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """
+        Estimate the memory held by the model weights
+
+        Returns:
+            Dict with the size in bytes of the exported graph and its external data, and the total
+        """
+        paths = [self.checkpoint_path, f"{self.checkpoint_path}.data"]
+        weights = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        return {"onnx_model": weights, "total": weights}
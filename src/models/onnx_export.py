@@ -0,0 +1,177 @@
+"""
+Export the MiniGPT-Med vision pipeline to ONNX.
+
+The vision tower, ln_vision and the projection are exported as one graph
+with a dynamic batch axis. A JSON sidecar next to the .onnx file stores the
+preprocessing settings, so the onnxruntime backend needs neither torch nor
+transformers. After exporting, the graph is checked against the torch path.
+
+Usage:
+    python -m src.models.onnx_export --output checkpoints/minigpt-med.onnx
+"""
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from src.models.minigpt_med import MiniGPTMedModel
+from src.models.inference import embedding_cosine, probe_pixel_values
+from src.utils.config import get_minigpt_checkpoint, get_model_config, get_project_root
+
+logger = logging.getLogger(__name__)
+
+ONNX_INPUT = "pixel_values"
+ONNX_OUTPUT = "embeddings"
+
+
+class ExportGraph(nn.Module):
+    """Vision tower plus projection as a single module returning projected embeddings"""
+
+    def __init__(self, model: MiniGPTMedModel):
+        super().__init__()
+        self.tower = model.vision_encoder.tower
+        self.projection = model.projection.projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        # Same token handling as MiniGPTMedProjection.project: skip CLS, pad to 12 patches
+        features = self.tower(pixel_values)[:, 1:, :]
+        if features.shape[1] < 12:
+            padding = features.new_zeros(features.shape[0], 12 - features.shape[1], features.shape[2])
+            features = torch.cat([features, padding], dim=1)
+        return self.projection(features)
+
+
+def sidecar_path(onnx_path: str) -> Path:
+    """Path of the JSON metadata stored next to an exported model"""
+    return Path(f"{onnx_path}.json")
+
+
+def export_onnx(model: MiniGPTMedModel, output_path: str, opset: int = 17) -> Dict[str, Any]:
+    """
+    Export a fp32 eager model to ONNX and write its metadata sidecar
+
+    Args:
+        model: Loaded MiniGPTMedModel in fp32 eager mode
+        output_path: Destination .onnx file
+        opset: ONNX opset version
+
+    Returns:
+        Metadata written to the sidecar
+    """
+    if model.precision != "fp32" or model.graph_mode != "eager":
+        raise ValueError("ONNX export needs a fp32 eager model")
+
+    preprocessor = model.vision_encoder.preprocessor
+    example = probe_pixel_values(2, preprocessor.crop_height, preprocessor.crop_width).to(model.device)
+    graph = ExportGraph(model).eval()
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            (example,),
+            output_path,
+            input_names=[ONNX_INPUT],
+            output_names=[ONNX_OUTPUT],
+            dynamic_axes={ONNX_INPUT: {0: "batch"}, ONNX_OUTPUT: {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+            dynamo=False
+        )
+
+    metadata = {
+        "format": 1,
+        "source_identity": model.identity,
+        "vision_model_name": model.vision_encoder.vision_model_name,
+        "image_size": model.vision_encoder.image_size,
+        "preprocessing": preprocessor.config(),
+        "opset": opset
+    }
+    sidecar_path(output_path).write_text(json.dumps(metadata, indent=2))
+    logger.info(f"Exported ONNX model to {output_path}")
+    return metadata
+
+
+def verify_onnx(
+    model: MiniGPTMedModel,
+    onnx_path: str,
+    batch_size: int = 3,
+    atol: float = 1e-3,
+    min_cosine: float = 0.9999
+) -> Dict[str, Any]:
+    """
+    Compare onnxruntime outputs with the torch path on a probe batch
+
+    Args:
+        model: The fp32 eager model the graph was exported from
+        onnx_path: Exported .onnx file
+        batch_size: Probe batch size (differs from the export batch to exercise the dynamic axis)
+        atol: Maximum allowed absolute difference
+        min_cosine: Minimum allowed token cosine similarity
+
+    Returns:
+        Dict with max_abs_diff, cosine_mean, cosine_min and passed
+    """
+    import onnxruntime as ort
+
+    preprocessor = model.vision_encoder.preprocessor
+    probe = probe_pixel_values(batch_size, preprocessor.crop_height, preprocessor.crop_width)
+    reference = model.projection.project(model.vision_encoder.encode_pixel_values(probe.to(model.device)))
+    reference = reference.cpu().numpy()
+
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    candidate = session.run([ONNX_OUTPUT], {ONNX_INPUT: probe.numpy()})[0]
+
+    cosine_mean, cosine_min = embedding_cosine(torch.from_numpy(reference), torch.from_numpy(candidate))
+    max_abs_diff = float(np.abs(reference - candidate).max())
+    return {
+        "max_abs_diff": max_abs_diff,
+        "cosine_mean": cosine_mean,
+        "cosine_min": cosine_min,
+        "passed": reference.shape == candidate.shape and max_abs_diff <= atol and cosine_min >= min_cosine
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None, help="MiniGPT-Med checkpoint (defaults to config.yaml)")
+    parser.add_argument("--output", default="checkpoints/minigpt-med.onnx", help="destination .onnx file")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument("--atol", type=float, default=1e-3, help="maximum absolute difference to the torch path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    checkpoint = args.checkpoint or str(get_minigpt_checkpoint())
+    output = Path(args.output)
+    if not output.is_absolute():
+        output = get_project_root() / output
+
+    model = MiniGPTMedModel(
+        checkpoint,
+        device="cpu",
+        precision="fp32",
+        graph_mode="eager",
+        clip_model=get_model_config().get("clip_model", "openai/clip-vit-base-patch32")
+    )
+    metadata = export_onnx(model, str(output), args.opset)
+
+    result = verify_onnx(model, str(output), atol=args.atol)
+    metadata["verification"] = result
+    sidecar_path(str(output)).write_text(json.dumps(metadata, indent=2))
+
+    print(
+        f"max abs diff {result['max_abs_diff']:.2e}, token cosine mean {result['cosine_mean']:.6f} "
+        f"min {result['cosine_min']:.6f}: {'OK' if result['passed'] else 'FAILED'}"
+    )
+    if not result["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
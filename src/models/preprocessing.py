@@ -0,0 +1,182 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# OpenAI CLIP normalisation constants (CLIPImageProcessor defaults)
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def _size_value(size: Any, key: str) -> Optional[int]:
+    """Read a field from a HF size dict (plain dict or SizeDict)"""
+    if size is None:
+        return None
+    if isinstance(size, dict):
+        return size.get(key)
+    return getattr(size, key, None)
+
+
+class BatchPreprocessor:
+    """
+    Batched replacement for CLIPImageProcessor.
+    Every image is resized once with PIL (shortest edge, same resampling as the
+    HF processor), center-cropped straight into a reusable uint8 NHWC staging
+    buffer, and the whole batch is rescaled and normalised with one fused NumPy
+    multiply-add written into a single preallocated float32 NCHW array.
+    The module does not import torch; callers wrap the result with torch.from_numpy.
+    """
+
+    def __init__(
+        self,
+        shortest_edge: int = 224,
+        crop_size: Tuple[int, int] = (224, 224),
+        image_mean: Sequence[float] = CLIP_MEAN,
+        image_std: Sequence[float] = CLIP_STD,
+        rescale_factor: float = 1 / 255,
+        resample: int = Image.Resampling.BICUBIC
+    ):
+        """
+        Initialize the preprocessor
+
+        Args:
+            shortest_edge: Size the shortest image side is resized to
+            crop_size: (height, width) of the center crop
+            image_mean: Per-channel normalisation mean
+            image_std: Per-channel normalisation standard deviation
+            rescale_factor: Factor mapping uint8 values to [0, 1]
+            resample: PIL resampling filter
+        """
+        self.shortest_edge = shortest_edge
+        self.crop_height, self.crop_width = crop_size
+        self.image_mean = [float(m) for m in image_mean]
+        self.image_std = [float(s) for s in image_std]
+        self.rescale_factor = float(rescale_factor)
+        self.resample = Image.Resampling(int(resample))
+
+        # (x * rescale - mean) / std folded into one multiply-add per channel
+        std = np.asarray(image_std, dtype=np.float32)
+        self.scale = (np.float32(rescale_factor) / std).reshape(1, 3, 1, 1)
+        self.offset = (-np.asarray(image_mean, dtype=np.float32) / std).reshape(1, 3, 1, 1)
+
+        self._local = threading.local()
+
+    @classmethod
+    def from_hf_processor(cls, processor: Any) -> "BatchPreprocessor":
+        """
+        Build a preprocessor matching a HuggingFace CLIP image processor
+
+        Args:
+            processor: CLIPImageProcessor (or compatible) instance
+
+        Returns:
+            BatchPreprocessor with the same resize, crop and normalisation settings
+        """
+        crop = getattr(processor, "crop_size", None)
+        return cls(
+            shortest_edge=_size_value(processor.size, "shortest_edge") or 224,
+            crop_size=(
+                _size_value(crop, "height") or 224,
+                _size_value(crop, "width") or 224
+            ),
+            image_mean=processor.image_mean,
+            image_std=processor.image_std,
+            rescale_factor=processor.rescale_factor,
+            resample=processor.resample if processor.resample is not None else Image.Resampling.BICUBIC
+        )
+
+    def config(self) -> Dict[str, Any]:
+        """
+        Get the constructor arguments, e.g. to store them next to an exported model
+
+        Returns:
+            JSON-serialisable dict accepted by BatchPreprocessor(**config)
+        """
+        return {
+            "shortest_edge": self.shortest_edge,
+            "crop_size": [self.crop_height, self.crop_width],
+            "image_mean": self.image_mean,
+            "image_std": self.image_std,
+            "rescale_factor": self.rescale_factor,
+            "resample": int(self.resample)
+        }
+
+    def resized_size(self, width: int, height: int) -> Tuple[int, int]:
+        """
+        Compute the (width, height) an image is resized to before cropping
+
+        Args:
+            width: Image width
+            height: Image height
+
+        Returns:
+            Tuple of (width, height) with the shortest side equal to shortest_edge
+        """
+        if width <= height:
+            return self.shortest_edge, int(self.shortest_edge * height / width)
+        return int(self.shortest_edge * width / height), self.shortest_edge
+
+    def _staging(self, batch_size: int) -> np.ndarray:
+        # One uint8 buffer per thread, grown to the largest batch seen so far
+        staging = getattr(self._local, "staging", None)
+        if staging is None or staging.shape[0] < batch_size:
+            staging = np.empty((batch_size, self.crop_height, self.crop_width, 3), dtype=np.uint8)
+            self._local.staging = staging
+        return staging[:batch_size]
+
+    def to_uint8(self, images: List[Image.Image], out: np.ndarray) -> np.ndarray:
+        """
+        Resize and center-crop images into a uint8 NHWC buffer
+
+        Args:
+            images: PIL Image objects
+            out: Buffer of shape [batch, crop_height, crop_width, 3]
+
+        Returns:
+            The filled buffer
+        """
+        for i, image in enumerate(images):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            size = self.resized_size(*image.size)
+            if image.size != size:
+                image = image.resize(size, self.resample)
+
+            pixels = np.asarray(image)
+            height, width = pixels.shape[:2]
+            top = (height - self.crop_height) // 2
+            left = (width - self.crop_width) // 2
+            if top >= 0 and left >= 0:
+                out[i] = pixels[top:top + self.crop_height, left:left + self.crop_width]
+            else:
+                # Image smaller than the crop: zero padding around it, like the HF processor
+                out[i] = 0
+                src_top, src_left = max(0, top), max(0, left)
+                dst_top, dst_left = max(0, -top), max(0, -left)
+                h = min(height - src_top, self.crop_height)
+                w = min(width - src_left, self.crop_width)
+                out[i, dst_top:dst_top + h, dst_left:dst_left + w] = (
+                    pixels[src_top:src_top + h, src_left:src_left + w]
+                )
+        return out
+
+    def __call__(self, images: List[Image.Image]) -> np.ndarray:
+        """
+        Preprocess a batch of images
+
+        Args:
+            images: PIL Image objects
+
+        Returns:
+            float32 array of shape [batch, 3, crop_height, crop_width]; a new array
+            on every call, so it can be handed to another thread
+        """
+        staging = self.to_uint8(images, self._staging(len(images)))
+        pixel_values = np.empty((len(images), 3, self.crop_height, self.crop_width), dtype=np.float32)
+        np.multiply(staging.transpose(0, 3, 1, 2), self.scale, out=pixel_values)
+        np.add(pixel_values, self.offset, out=pixel_values)
+        return pixel_values
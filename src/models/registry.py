@@ -0,0 +1,368 @@
+import threading
+import logging
+import resource
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
+
+from src.utils.config import get_minigpt_checkpoint, get_model_config, get_project_root
+
+if TYPE_CHECKING:
+    from src.models.embedding_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+# (checkpoint_path, device, precision)
+ModelKey = Tuple[str, str, str]
+
+# MiniGPTMedModel (torch) or OnnxMiniGPTMedModel (onnxruntime); backends are imported on first load
+VisionModel = Any
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of resident MiniGPT-Med models.
+    Models are loaded once, keyed by checkpoint path, device and precision,
+    and shared by every caller until they are explicitly reloaded or unloaded.
+    model.backend selects the torch pipeline or the exported ONNX graph; the
+    backend modules (and torch) are only imported when a model is loaded.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty registry
+        """
+        self._models: Dict[ModelKey, VisionModel] = {}
+        self._lock = threading.RLock()
+        # Not the load lock: /metrics and /models/cache read the cache on the event loop during loads
+        self._cache_lock = threading.Lock()
+        self._embedding_cache: Optional["EmbeddingCache"] = None
+
+    def resolve_key(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> ModelKey:
+        """
+        Build a registry key, filling missing parts from config.yaml
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on ("auto" picks CUDA when available)
+            precision: Precision for model weights
+
+        Returns:
+            Registry key tuple
+        """
+        model_config = get_model_config()
+        if model_config.get("backend", "torch") == "onnx":
+            # The exported graph is fp32 and runs on CPU
+            onnx_config = model_config.get("onnx", {})
+            default_path = get_project_root() / onnx_config.get("path", "checkpoints/minigpt-med.onnx")
+            return (str(checkpoint_path or default_path), "cpu", "fp32")
+
+        checkpoint_path = checkpoint_path or str(get_minigpt_checkpoint())
+        device = device or model_config.get("device", "auto")
+        if device == "auto":
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        precision = precision or model_config.get("precision", "fp32")
+        return (str(checkpoint_path), device, precision)
+
+    def get(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> VisionModel:
+        """
+        Get a resident model, loading it on first use
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on
+            precision: Precision for model weights
+
+        Returns:
+            Shared MiniGPTMedModel instance
+        """
+        key = self.resolve_key(checkpoint_path, device, precision)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        return self.load(*key)
+
+    def load(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None,
+        warmup: Optional[bool] = None
+    ) -> VisionModel:
+        """
+        Load a model into the registry if it is not already resident
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on
+            precision: Precision for model weights
+            warmup: Run a warm-up pass after loading (defaults to config.yaml)
+
+        Returns:
+            Shared MiniGPTMedModel instance
+        """
+        key = self.resolve_key(checkpoint_path, device, precision)
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            logger.info(f"Loading resident model for {key}")
+            model_config = get_model_config()
+            if model_config.get("backend", "torch") == "onnx":
+                from src.models.onnx_backend import OnnxMiniGPTMedModel
+                onnx_config = model_config.get("onnx", {})
+                model = OnnxMiniGPTMedModel(
+                    onnx_path=key[0],
+                    max_batch_size=model_config.get("max_batch_size", 8),
+                    intra_op_threads=onnx_config.get("intra_op_threads", 0),
+                    inter_op_threads=onnx_config.get("inter_op_threads", 0),
+                    graph_optimization=onnx_config.get("graph_optimization", "all")
+                )
+                encode_fn = model.encode_pixel_values
+            else:
+                from src.models.minigpt_med import MiniGPTMedModel
+                model = MiniGPTMedModel(
+                    checkpoint_path=key[0],
+                    device=key[1],
+                    precision=key[2],
+                    max_batch_size=model_config.get("max_batch_size", 8),
+                    preprocessing=model_config.get("preprocessing", "tensor"),
+                    graph_mode=model_config.get("graph_mode", "eager"),
+                    drift_min_cosine=model_config.get("drift_min_cosine", 0.99),
+                    clip_model=model_config.get("clip_model", "openai/clip-vit-base-patch32")
+                )
+                encode_fn = model.vision_encoder.encode_pixel_values
+
+            model.embedding_cache = self.embedding_cache()
+
+            batching_config = model_config.get("batching", {})
+            pool_config = model_config.get("worker_pool", {})
+            if pool_config.get("enabled", False) and model_config.get("backend", "torch") == "torch" \
+                    and key[1] == "cpu":
+                # Vision forward passes run in worker processes sharing a weight snapshot
+                from src.models.worker_pool import InferenceWorkerPool, export_tower_snapshot
+                snapshot = export_tower_snapshot(
+                    model, str(get_project_root() / pool_config.get("snapshot_dir", "data/worker_pool"))
+                )
+                model.scheduler = InferenceWorkerPool(
+                    snapshot,
+                    max_workers=pool_config.get("max_workers", 2),
+                    min_workers=pool_config.get("min_workers", 0),
+                    cores_per_worker=pool_config.get("cores_per_worker"),
+                    torch_threads=pool_config.get("torch_threads"),
+                    capacity=model.max_batch_size,
+                    idle_timeout=pool_config.get("idle_timeout_s", 300),
+                    graph_mode=model.graph_mode,
+                    output_dtype=model.vision_encoder.compute_dtype
+                )
+                model.scheduler.start()
+            elif batching_config.get("enabled", False):
+                from src.models.batching import MicroBatchScheduler
+                model.scheduler = MicroBatchScheduler(
+                    encode_fn,
+                    max_batch_size=batching_config.get("max_batch_size", 16),
+                    max_wait_ms=batching_config.get("max_wait_ms", 10)
+                )
+                model.scheduler.start()
+
+            if warmup is None:
+                warmup = model_config.get("warmup", True)
+            if warmup:
+                try:
+                    model.warmup()
+                except Exception:
+                    # The model is not registered: nothing else would stop its threads or workers
+                    if model.scheduler is not None:
+                        model.scheduler.stop()
+                    raise
+
+            self._models[key] = model
+            return model
+
+    def embedding_cache(self) -> Optional["EmbeddingCache"]:
+        """
+        Get the embedding cache shared by every resident model
+
+        Returns:
+            EmbeddingCache, or None when disabled in config.yaml
+        """
+        cache_config = get_model_config().get("embedding_cache", {})
+        if not cache_config.get("enabled", False):
+            return None
+        with self._cache_lock:
+            if self._embedding_cache is None:
+                from src.models.embedding_cache import EmbeddingCache
+                disk_dir = cache_config.get("disk_dir")
+                self._embedding_cache = EmbeddingCache(
+                    max_memory_bytes=int(cache_config.get("max_memory_mb", 256) * 1024 * 1024),
+                    disk_dir=str(get_project_root() / disk_dir) if disk_dir else None
+                )
+            return self._embedding_cache
+
+    def warmup(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> None:
+        """
+        Run a warm-up pass on a resident model, loading it if needed
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on
+            precision: Precision for model weights
+        """
+        self.get(checkpoint_path, device, precision).warmup()
+
+    def reload(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> VisionModel:
+        """
+        Drop a resident model and load it again from its checkpoint
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on
+            precision: Precision for model weights
+
+        Returns:
+            Freshly loaded MiniGPTMedModel instance
+        """
+        key = self.resolve_key(checkpoint_path, device, precision)
+        with self._lock:
+            self.unload(*key)
+            return self.load(*key)
+
+    def unload(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> bool:
+        """
+        Remove a model from the registry and free its memory
+
+        Args:
+            checkpoint_path: Path to the MiniGPT-Med checkpoint
+            device: Device to run the model on
+            precision: Precision for model weights
+
+        Returns:
+            True if a model was unloaded, False if it was not resident
+        """
+        key = self.resolve_key(checkpoint_path, device, precision)
+        with self._lock:
+            model = self._models.pop(key, None)
+
+        if model is None:
+            logger.warning(f"No resident model for {key}")
+            return False
+
+        if model.scheduler is not None:
+            model.scheduler.stop()
+        del model
+        if key[1].startswith("cuda"):
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        logger.info(f"Unloaded resident model for {key}")
+        return True
+
+    def unload_all(self) -> None:
+        """
+        Remove every model from the registry
+        """
+        for key in list(self._models):
+            self.unload(*key)
+
+    def is_loaded(
+        self,
+        checkpoint_path: Optional[str] = None,
+        device: Optional[str] = None,
+        precision: Optional[str] = None
+    ) -> bool:
+        """
+        Check whether a model is resident
+        """
+        return self.resolve_key(checkpoint_path, device, precision) in self._models
+
+    def resident_keys(self) -> List[ModelKey]:
+        """
+        Get the keys of every resident model without resolving config defaults
+        (which may import torch)
+
+        Returns:
+            List of registry keys
+        """
+        return list(self._models)
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        """
+        Describe every resident model and its memory footprint
+
+        Returns:
+            List of model descriptions
+        """
+        return [
+            {
+                "checkpoint_path": key[0],
+                "device": key[1],
+                "precision": key[2],
+                "inference": model.inference_report,
+                "memory_bytes": model.memory_footprint(),
+                "batching": model.scheduler.stats() if model.scheduler is not None else None
+            }
+            for key, model in list(self._models.items())
+        ]
+
+    def batching_stats(self) -> List[Dict[str, Any]]:
+        """
+        Get micro-batch scheduler metrics for every resident model
+
+        Returns:
+            List of scheduler statistics, one per model with batching enabled
+        """
+        return [
+            {"checkpoint_path": key[0], "device": key[1], "precision": key[2], **model.scheduler.stats()}
+            for key, model in list(self._models.items())
+            if model.scheduler is not None
+        ]
+
+    def memory_footprint(self) -> Dict[str, Any]:
+        """
+        Summarize the memory held by resident models and the process
+
+        Returns:
+            Dict with total model bytes and process peak RSS
+        """
+        models = self.list_models()
+        return {
+            "models": models,
+            "embedding_cache": self._embedding_cache.stats() if self._embedding_cache is not None else None,
+            "model_bytes": sum(m["memory_bytes"]["total"] for m in models),
+            # ru_maxrss is reported in kilobytes on Linux
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        }
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process-wide model registry"""
+    return _registry
@@ -0,0 +1,501 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows of the memory-mapped files are added in blocks of this many vectors
+GROWTH_ROWS = 4096
+# Rows scored per matrix product by the exact search
+EXACT_CHUNK_ROWS = 65536
+# Codewords per PQ subquantizer (codes are uint8)
+PQ_CENTROIDS = 256
+# Fewest PQ candidates re-ranked exactly, whatever k is
+MIN_RERANK = 256
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows (a single vector is treated as one row) as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def pq_subspaces(dim: int, max_subspaces: int = 64, min_width: int = 8) -> int:
+    """Largest number of equal-width PQ subspaces of at least min_width dimensions"""
+    for subspaces in range(min(max_subspaces, dim // min_width), 0, -1):
+        if dim % subspaces == 0:
+            return subspaces
+    return 1
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def assign(data: np.ndarray, centroids: np.ndarray, chunk_rows: int = 16384) -> np.ndarray:
+    """Index of the nearest (L2) centroid of every row"""
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk_rows):
+        block = np.asarray(data[start:start + chunk_rows], dtype=np.float32)
+        # ||x - c||^2 without the ||x||^2 term, which does not change the argmin
+        labels[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Lloyd's k-means
+
+    Args:
+        data: float32 training rows
+        k: Number of centroids
+        iterations: Assignment/update rounds
+        rng: Random generator (initial centroids, empty cluster reseeding)
+
+    Returns:
+        float32 centroids of shape [k, dim]
+    """
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        # Sum each cluster as one contiguous segment of the label-sorted rows
+        order = np.argsort(labels, kind="stable")
+        starts = np.searchsorted(labels[order], np.arange(k))
+        sums = np.add.reduceat(data[order], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def quantize(
+    vectors: np.ndarray,
+    coarse: np.ndarray,
+    codebooks: np.ndarray,
+    chunk_rows: int = 65536
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assign rows to coarse lists and product-quantise their residuals
+
+    Args:
+        vectors: Rows to encode (any float dtype, e.g. a memory-mapped fp16 slice)
+        coarse: Coarse centroids of shape [nlist, dim]
+        codebooks: PQ codebooks of shape [subspaces, 256, width]
+
+    Returns:
+        Tuple of (int32 list ids, uint8 codes of shape [rows, subspaces])
+    """
+    subspaces, _, width = codebooks.shape
+    lists = np.empty(len(vectors), dtype=np.int32)
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for start in range(0, len(vectors), chunk_rows):
+        block = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+        stop = start + len(block)
+        lists[start:stop] = assign(block, coarse)
+        residuals = block - coarse[lists[start:stop]]
+        for m in range(subspaces):
+            codes[start:stop, m] = assign(residuals[:, m * width:(m + 1) * width], codebooks[m])
+    return lists, codes
+
+
+class VectorIndex:
+    """
+    Persistent cosine-similarity index of unit vectors keyed by string ids.
+    Vectors are appended to a memory-mapped fp16 file and their ids to a text
+    file, one line per row, so an add is two appends and a crash loses at most
+    the row being written. Below ivf_threshold rows queries are answered by an
+    exact, chunked matrix product; from then on an IVF-PQ index is trained in
+    the background (coarse k-means lists, residuals product-quantised to one
+    byte per subspace) and queries score the codes of the nprobe closest lists
+    with per-query lookup tables, then re-rank the best candidates exactly.
+    Rows added after training are encoded as they arrive; the quantisers are
+    retrained once the index has grown retrain_factor times. Re-adding an id
+    replaces its vector.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dim: Optional[int] = None,
+        ivf_threshold: int = 50000,
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        rerank: int = 100,
+        retrain_factor: float = 4.0,
+        seed: int = 0
+    ):
+        """
+        Open (or create) the index
+
+        Args:
+            directory: Directory of the index files
+            dim: Vector dimension (None takes it from an existing index)
+            ivf_threshold: Row count from which the IVF-PQ index is used
+            nlist: Number of coarse lists (None picks about sqrt(rows))
+            nprobe: Coarse lists scanned per query
+            rerank: Candidates re-ranked exactly per requested result (at least MIN_RERANK)
+            retrain_factor: Retrain the quantisers once rows exceed this multiple of the training size
+            seed: Seed of the training samples
+        """
+        self.directory = directory
+        self.dim = dim
+        self.ivf_threshold = max(1, ivf_threshold)
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.rerank = max(1, rerank)
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._training: Optional[threading.Thread] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._alive = np.zeros(0, dtype=bool)
+
+        # IVF-PQ state (None until trained)
+        self._coarse: Optional[np.ndarray] = None
+        self._codebooks: Optional[np.ndarray] = None
+        self._codes: Optional[np.memmap] = None
+        self._lists: Optional[np.memmap] = None
+        self._list_rows: List[np.ndarray] = []
+        self._list_pending: List[List[int]] = []
+        self._trained_rows = 0
+
+        self._open()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self) -> None:
+        meta_path = self._path("index.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if self.dim is None:
+                self.dim = meta["dim"]
+            if meta["dim"] != self.dim:
+                raise ValueError(f"Index in {self.directory} has dimension {meta['dim']}, expected {self.dim}")
+        elif self.dim is None:
+            raise ValueError(f"No index in {self.directory} and no dimension given")
+        else:
+            tmp_path = self._path(f"index.json.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "format": 1}, f)
+            os.replace(tmp_path, meta_path)
+
+        ids_path = self._path("ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path, "r", encoding="utf-8") as f:
+                # A torn last line (crash mid-append) has no newline and is ignored
+                self._ids = [line[:-1] for line in f if line.endswith("\n")]
+        vectors_path = self._path("vectors.f16")
+        stored_rows = os.path.getsize(vectors_path) // (2 * self.dim) if os.path.exists(vectors_path) else 0
+        self._ids = self._ids[:stored_rows]
+        for row, vector_id in enumerate(self._ids):
+            self._rows[vector_id] = row
+
+        quantizers_path = self._path("ivfpq.npz")
+        if os.path.exists(quantizers_path):
+            with np.load(quantizers_path) as quantizers:
+                self._coarse = quantizers["coarse"]
+                self._codebooks = quantizers["codebooks"]
+                self._trained_rows = int(quantizers["trained_rows"])
+
+        self._grow(max(stored_rows, len(self._ids)))
+        self._alive[list(self._rows.values())] = True
+        if self._coarse is not None:
+            self._rebuild_lists(len(self._ids))
+
+        logger.info(
+            f"Vector index {self.directory}: {len(self._rows)} vectors of dimension {self.dim} ({self.mode} search)"
+        )
+
+    def _grow(self, rows: int) -> None:
+        # Extend the files to hold at least rows vectors (rounded up to GROWTH_ROWS) and map them again
+        capacity = max(GROWTH_ROWS, -(-rows // GROWTH_ROWS) * GROWTH_ROWS)
+        self._resize("vectors.f16", capacity * self.dim * 2)
+        self._vectors = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+        if self._codebooks is not None:
+            self._map_codes(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        self._capacity = capacity
+
+    def _resize(self, name: str, size: int) -> None:
+        with open(self._path(name), "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+    def _map_codes(self, capacity: int) -> None:
+        subspaces = self._codebooks.shape[0]
+        self._resize("codes.u8", capacity * subspaces)
+        self._resize("lists.i32", capacity * 4)
+        self._codes = np.memmap(self._path("codes.u8"), dtype=np.uint8, mode="r+", shape=(capacity, subspaces))
+        self._lists = np.memmap(self._path("lists.i32"), dtype=np.int32, mode="r+", shape=(capacity,))
+
+    def _rebuild_lists(self, rows: int) -> None:
+        # Row numbers of every coarse list, in row order
+        lists = np.asarray(self._lists[:rows])
+        order = np.argsort(lists, kind="stable")
+        bounds = np.searchsorted(lists[order], np.arange(len(self._coarse) + 1))
+        self._list_rows = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(len(self._coarse))]
+        self._list_pending = [[] for _ in range(len(self._coarse))]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self._rows
+
+    @property
+    def mode(self) -> str:
+        """"ivfpq" once the quantisers are trained, "exact" before"""
+        return "ivfpq" if self._coarse is not None else "exact"
+
+    def add(self, vector_id: str, vector: np.ndarray) -> None:
+        """
+        Add or replace a vector
+
+        Args:
+            vector_id: Identifier (must not contain a newline)
+            vector: Vector of shape [dim], normalised before storing
+        """
+        self.add_many([vector_id], np.asarray(vector).reshape(1, -1))
+
+    def add_many(self, vector_ids: List[str], vectors: np.ndarray) -> None:
+        """
+        Add or replace vectors in one append (backfills, bulk loads)
+
+        Args:
+            vector_ids: Identifiers (must not contain newlines)
+            vectors: Vectors of shape [len(vector_ids), dim], normalised before storing
+        """
+        if any("\n" in vector_id for vector_id in vector_ids):
+            raise ValueError("Vector ids cannot contain newlines")
+        vectors = normalize(vectors).reshape(len(vector_ids), self.dim)
+
+        with self._lock:
+            start = len(self._ids)
+            stop = start + len(vector_ids)
+            if stop > self._capacity:
+                # Double so appends stay amortised O(1)
+                self._grow(max(stop, 2 * self._capacity))
+            self._vectors[start:stop] = vectors
+            if self._coarse is not None:
+                lists, codes = quantize(self._vectors[start:stop], self._coarse, self._codebooks)
+                self._lists[start:stop], self._codes[start:stop] = lists, codes
+            # The id lines commit the rows: they are written last
+            with open(self._path("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{vector_id}\n" for vector_id in vector_ids))
+
+            for row, vector_id in enumerate(vector_ids, start):
+                previous = self._rows.get(vector_id)
+                if previous is not None:
+                    self._alive[previous] = False
+                self._ids.append(vector_id)
+                self._rows[vector_id] = row
+                self._alive[row] = True
+                if self._coarse is not None:
+                    self._list_pending[int(self._lists[row])].append(row)
+
+        self._maybe_train()
+
+    def get(self, vector_id: str) -> Optional[np.ndarray]:
+        """
+        Get a stored vector
+
+        Args:
+            vector_id: Identifier
+
+        Returns:
+            float32 vector or None if unknown
+        """
+        with self._lock:
+            row = self._rows.get(vector_id)
+            return None if row is None else np.asarray(self._vectors[row], dtype=np.float32)
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Tuple[str, ...] = ()) -> List[Tuple[str, float]]:
+        """
+        Find the most similar vectors
+
+        Args:
+            query: Query vector of shape [dim]
+            k: Number of results
+            exclude: Ids left out of the results
+
+        Returns:
+            List of (id, cosine similarity), most similar first
+        """
+        query = normalize(query).reshape(self.dim)
+        if k <= 0:
+            return []
+        wanted = k + len(exclude)
+        if self._coarse is not None:
+            candidates, scores = self._search_ivfpq(query, wanted)
+        else:
+            candidates, scores = self._search_exact(query, wanted)
+
+        results = []
+        for row, score in zip(candidates, scores):
+            vector_id = self._ids[row]
+            if vector_id not in exclude:
+                results.append((vector_id, float(score)))
+            if len(results) == k:
+                break
+        return results
+
+    def _search_exact(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            rows, vectors, alive = len(self._ids), self._vectors, self._alive
+        best_rows, best_scores = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+        for start in range(0, rows, EXACT_CHUNK_ROWS):
+            stop = min(rows, start + EXACT_CHUNK_ROWS)
+            scores = np.asarray(vectors[start:stop], dtype=np.float32) @ query
+            scores[~alive[start:stop]] = -np.inf
+            top = top_k(scores, k)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        candidates, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        order = top_k(scores, k)
+        keep = np.isfinite(scores[order])
+        return candidates[order][keep], scores[order][keep]
+
+    def _search_ivfpq(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            # Consistent snapshot: a retraining swaps the quantisers and codes together
+            coarse, codebooks, codes, lists = self._coarse, self._codebooks, self._codes, self._lists
+            vectors, alive = self._vectors, self._alive
+            coarse_scores = coarse @ query
+            probe = top_k(coarse_scores, min(self.nprobe, len(coarse)))
+            for list_id in probe:
+                pending = self._list_pending[list_id]
+                if pending:
+                    self._list_rows[list_id] = np.concatenate(
+                        [self._list_rows[list_id], np.asarray(pending, dtype=np.int64)]
+                    )
+                    self._list_pending[list_id] = []
+            rows = np.concatenate([self._list_rows[list_id] for list_id in probe])
+        rows = rows[alive[rows]]
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+
+        # Inner product with a residual-quantised vector: q.c(list) + sum over subspaces of q_m.codeword
+        subspaces, _, width = codebooks.shape
+        lookup = np.einsum("mcw,mw->mc", codebooks, query.reshape(subspaces, width))
+        approximate = lookup[np.arange(subspaces), codes[rows]].sum(axis=1) + coarse_scores[lists[rows]]
+
+        # Exact re-ranking of the best approximate candidates
+        shortlist = np.sort(rows[top_k(approximate, max(k * self.rerank, MIN_RERANK))])
+        scores = np.asarray(vectors[shortlist], dtype=np.float32) @ query
+        order = top_k(scores, k)
+        return shortlist[order], scores[order]
+
+    def _maybe_train(self) -> None:
+        rows = len(self._rows)
+        due = (
+            (self._coarse is None and rows >= self.ivf_threshold)
+            or (self._coarse is not None and rows >= self._trained_rows * self.retrain_factor)
+        )
+        if not due or (self._training is not None and self._training.is_alive()):
+            return
+        self._training = threading.Thread(target=self.train, name="vector-index-train", daemon=True)
+        self._training.start()
+
+    def train(self, sample_rows: Optional[int] = None, iterations: int = 10) -> None:
+        """
+        Train (or retrain) the IVF-PQ quantisers and encode every row
+
+        Adds and searches continue meanwhile (with the previous quantisers or
+        exact search); rows added during training are encoded before the
+        new quantisers are swapped in.
+
+        Args:
+            sample_rows: Rows used for training (defaults to 64 per coarse list, at most 100000)
+            iterations: k-means iterations
+        """
+        try:
+            with self._lock:
+                rows, vectors = len(self._ids), self._vectors
+            if rows == 0:
+                return
+            nlist = min(rows, self.nlist or int(np.clip(np.sqrt(rows), 16, 4096)))
+            sample_rows = min(rows, sample_rows or min(100000, max(64 * nlist, PQ_CENTROIDS * 4)))
+            rng = np.random.default_rng(self.seed)
+            sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_rows, replace=False))], dtype=np.float32)
+            logger.info(f"Training IVF-PQ index on {sample_rows} of {rows} vectors ({nlist} lists)")
+
+            coarse = kmeans(sample, nlist, iterations, rng)
+            residuals = sample - coarse[assign(sample, coarse)]
+            subspaces = pq_subspaces(self.dim)
+            width = self.dim // subspaces
+            codebooks = np.zeros((subspaces, PQ_CENTROIDS, width), dtype=np.float32)
+            for m in range(subspaces):
+                trained = kmeans(residuals[:, m * width:(m + 1) * width], PQ_CENTROIDS, iterations, rng)
+                codebooks[m, :len(trained)] = trained
+            lists, codes = quantize(vectors[:rows], coarse, codebooks)
+
+            with self._lock:
+                # Rows added while training are encoded too, then everything is swapped in at once
+                total = len(self._ids)
+                if total > rows:
+                    added_lists, added_codes = quantize(self._vectors[rows:total], coarse, codebooks)
+                    lists, codes = np.concatenate([lists, added_lists]), np.concatenate([codes, added_codes])
+                for name, array in (("codes.u8", codes), ("lists.i32", lists)):
+                    tmp_path = self._path(f"{name}.{os.getpid()}.tmp")
+                    array.tofile(tmp_path)
+                    os.replace(tmp_path, self._path(name))
+                self._coarse, self._codebooks, self._trained_rows = coarse, codebooks, total
+                self._map_codes(self._capacity)
+                self._rebuild_lists(total)
+
+                tmp_path = self._path(f"ivfpq.{os.getpid()}.tmp.npz")
+                np.savez(tmp_path, coarse=coarse, codebooks=codebooks, trained_rows=total)
+                os.replace(tmp_path, self._path("ivfpq.npz"))
+            logger.info(f"IVF-PQ index trained on {total} vectors ({nlist} lists, {subspaces} bytes per vector)")
+        except Exception as e:
+            logger.error(f"Error training vector index: {str(e)}")
+            raise
+
+    def flush(self) -> None:
+        """Write the memory-mapped files back to disk"""
+        with self._lock:
+            for array in (self._vectors, self._codes, self._lists):
+                if array is not None:
+                    array.flush()
+
+    def stats(self) -> Dict:
+        """
+        Get index metrics
+
+        Returns:
+            Dict with the vector count, search mode and IVF-PQ settings
+        """
+        return {
+            "directory": self.directory,
+            "dim": self.dim,
+            "vectors": len(self._rows),
+            "rows": len(self._ids),
+            "mode": self.mode,
+            "nlist": len(self._coarse) if self._coarse is not None else None,
+            "nprobe": self.nprobe,
+            "pq_subspaces": self._codebooks.shape[0] if self._codebooks is not None else None,
+            "trained_rows": self._trained_rows,
+            "training": self._training is not None and self._training.is_alive()
+        }
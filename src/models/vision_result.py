@@ -0,0 +1,95 @@
+import logging
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Dtype of the features kept per image between encoding and projection
+FEATURE_DTYPE = np.float16
+
+
+class VisionResult:
+    """
+    Vision output of one image.
+    Keeps the encoder features as a compact fp16 NumPy array on the CPU; the
+    projection to LLM space (a [1, tokens, 4096] fp32 tensor, about ten times
+    larger) only runs when a consumer reads `embeddings`. The shape of the
+    embeddings is known up front, so the text context of a request is built
+    without touching any tensor.
+    """
+
+    __slots__ = ("width", "height", "features", "embedding_shape", "_project", "_embeddings")
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        features: np.ndarray,
+        embedding_shape: Tuple[int, ...],
+        project: Optional[Callable[[np.ndarray], Any]] = None
+    ):
+        """
+        Initialize the result
+
+        Args:
+            width: Width of the uploaded image
+            height: Height of the uploaded image
+            features: Encoder features of shape [1, tokens, hidden] (stored as fp16)
+            embedding_shape: Shape of the projected embeddings
+            project: Callable projecting the features to LLM space; None when
+                the features already are the embeddings (ONNX graph)
+        """
+        self.width = width
+        self.height = height
+        self.features = np.asarray(features, dtype=FEATURE_DTYPE)
+        self.embedding_shape = tuple(embedding_shape)
+        self._project = project
+        self._embeddings = None
+
+    @property
+    def embeddings(self) -> Any:
+        """Projected embeddings, computed on first access (torch tensor, or float32 array for ONNX)"""
+        if self._embeddings is None:
+            if self.features is None:
+                raise RuntimeError("Vision result was released")
+            if self._project is None:
+                self._embeddings = self.features.astype(np.float32)
+            else:
+                self._embeddings = self._project(self.features)
+        return self._embeddings
+
+    @property
+    def attention_mask(self) -> np.ndarray:
+        """All-ones int64 mask over the embedding tokens"""
+        return np.ones(self.embedding_shape[:-1], dtype=np.int64)
+
+    @property
+    def pooled(self) -> np.ndarray:
+        """Mean of the feature tokens as a float32 vector"""
+        if self.features is None:
+            raise RuntimeError("Vision result was released")
+        return self.features.reshape(-1, self.features.shape[-1]).mean(axis=0, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes currently held by the features and, once computed, the embeddings"""
+        total = self.features.nbytes if self.features is not None else 0
+        if self._embeddings is not None:
+            embeddings = self._embeddings
+            total += embeddings.nbytes if isinstance(embeddings, np.ndarray) else embeddings.numel() * embeddings.element_size()
+        return total
+
+    def describe(self) -> str:
+        """Text summary of the image for the report prompt"""
+        return f"Dimensions: {self.width}x{self.height}. Embedding dims: {self.embedding_shape}"
+
+    def release(self) -> None:
+        """Drop the features and embeddings once the request no longer needs them"""
+        self.features = None
+        self._embeddings = None
+        self._project = None
+
+    def __repr__(self) -> str:
+        state = "released" if self.features is None else f"{self.nbytes} bytes"
+        return f"VisionResult({self.width}x{self.height}, embeddings {self.embedding_shape}, {state})"
@@ -0,0 +1,122 @@
+import os
+import json
+import mmap
+import struct
+import logging
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# safetensors dtype names understood by mmap_safetensors
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool
+}
+
+
+def save_safetensors(tensors: Dict[str, torch.Tensor], path: str, metadata: Optional[Dict[str, str]] = None) -> None:
+    """
+    Write tensors to a safetensors file atomically
+
+    Args:
+        tensors: Named tensors (CPU)
+        path: Destination file
+        metadata: Optional string entries stored in the header's __metadata__
+    """
+    from safetensors.torch import save_file
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    save_file({name: t.detach().cpu().contiguous() for name, t in tensors.items()}, tmp_path, metadata=metadata)
+    os.replace(tmp_path, path)
+
+
+def read_safetensors_metadata(path: str) -> Dict[str, str]:
+    """
+    Read the __metadata__ entries of a safetensors file (header only)
+
+    Args:
+        path: safetensors file
+
+    Returns:
+        Metadata dict, empty when the file has none
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    return header.get("__metadata__") or {}
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file into memory without reading or copying tensor data
+
+    The returned tensors are views on a private copy-on-write mapping: pages
+    are read lazily from the page cache and stay shared between every
+    process mapping the same file as long as they are not written to.
+
+    Args:
+        path: safetensors file
+
+    Returns:
+        Dict of tensors backed by the mapping
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = struct.unpack("<Q", buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_size])
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + start
+        ).view(info["shape"])
+    return tensors
+
+
+def assign_tensors(module: nn.Module, tensors: Dict[str, torch.Tensor]) -> None:
+    """
+    Install tensors as the parameters and buffers of a module without copying
+
+    Unlike load_state_dict this also fills non-persistent buffers, so a module
+    built on the meta device becomes fully usable.
+
+    Args:
+        module: Module whose parameters and buffers are replaced
+        tensors: Tensors keyed by parameter or buffer name
+    """
+    for name, tensor in tensors.items():
+        owner_name, _, attr = name.rpartition(".")
+        owner = module.get_submodule(owner_name) if owner_name else module
+        if attr in owner._parameters:
+            owner._parameters[attr] = nn.Parameter(tensor, requires_grad=False)
+        else:
+            owner._buffers[attr] = tensor
+
+    missing = [
+        name for name, t in list(module.named_parameters()) + list(module.named_buffers())
+        if t.is_meta
+    ]
+    if missing:
+        raise ValueError(f"No weights for {len(missing)} tensors, e.g. {missing[:3]}")
@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Tower precisions whose weights can be shared as plain tensors
+SHAREABLE_PRECISIONS = ("fp32", "bf16", "fp16")
+
+# Seconds a new worker may take to import torch and map the weights
+WORKER_START_TIMEOUT = 600
+
+
+def export_tower_snapshot(model: Any, root: str) -> str:
+    """
+    Write the vision tower weights of a resident model as a safetensors file
+    that worker processes memory-map instead of loading their own copy
+
+    Args:
+        model: Loaded MiniGPTMedModel
+        root: Directory holding snapshots, one subdirectory per model identity
+
+    Returns:
+        Snapshot directory (tower.safetensors and tower.json)
+    """
+    from src.models.weights import save_safetensors
+
+    if model.precision not in SHAREABLE_PRECISIONS:
+        raise ValueError(f"Worker pool cannot share {model.precision} weights")
+
+    encoder = model.vision_encoder
+    directory = os.path.join(root, hashlib.blake2b(model.identity.encode(), digest_size=8).hexdigest())
+    weights_path = os.path.join(directory, "tower.safetensors")
+    meta_path = os.path.join(directory, "tower.json")
+    if os.path.exists(weights_path) and os.path.exists(meta_path):
+        return directory
+
+    tower = encoder.tower
+    # Non-persistent buffers (e.g. position ids) are included: workers build the tower on the meta device
+    tensors = dict(tower.named_parameters())
+    tensors.update(dict(tower.named_buffers()))
+    save_safetensors(tensors, weights_path)
+
+    vision_config = encoder.vision_model.config
+    meta = {
+        "identity": model.identity,
+        "vision_config": vision_config.to_dict(),
+        "ln_shape": list(encoder.ln_vision.normalized_shape),
+        "ln_eps": encoder.ln_vision.eps,
+        "precision": model.precision,
+        "input_shape": [3, encoder.preprocessor.crop_height, encoder.preprocessor.crop_width],
+        "output_shape": [
+            (vision_config.image_size // vision_config.patch_size) ** 2 + 1,
+            vision_config.hidden_size
+        ]
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    logger.info(f"Exported vision tower snapshot to {directory}")
+    return directory
+
+
+def _load_tower(spec: Dict[str, Any]) -> Tuple[Any, Dict[str, Any], Any]:
+    """
+    Build the vision tower on the meta device and point its weights at the
+    memory-mapped snapshot (runs inside the worker process)
+    """
+    import torch
+    import torch.nn as nn
+    from transformers import CLIPVisionConfig, CLIPVisionModel
+    from src.models.inference import PRECISION_DTYPES, VisionTower, build_graph
+    from src.models.weights import assign_tensors, mmap_safetensors
+
+    torch.set_num_threads(spec["threads"])
+    torch.set_num_interop_threads(1)
+
+    with open(os.path.join(spec["snapshot"], "tower.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    with torch.device("meta"):
+        tower = VisionTower(
+            CLIPVisionModel(CLIPVisionConfig.from_dict(meta["vision_config"])),
+            nn.LayerNorm(meta["ln_shape"], eps=meta["ln_eps"])
+        )
+    assign_tensors(tower, mmap_safetensors(os.path.join(spec["snapshot"], "tower.safetensors")))
+    tower.eval()
+
+    dtype = PRECISION_DTYPES[meta["precision"]]
+    example = torch.zeros(1, *meta["input_shape"], dtype=dtype)
+    graph = build_graph(tower, spec["graph_mode"], example)
+    with torch.no_grad():
+        graph(example)
+    return graph, meta, dtype
+
+
+def _worker_main(conn: Any, spec: Dict[str, Any]) -> None:
+    """
+    Entry point of a worker process: map the shared weights, then encode
+    the batches the parent writes into the input buffer
+    """
+    if spec["cores"] and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, spec["cores"])
+
+    try:
+        graph, meta, dtype = _load_tower(spec)
+        input_shm = SharedMemory(name=spec["input_shm"])
+        output_shm = SharedMemory(name=spec["output_shm"])
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+
+    import torch
+
+    capacity = spec["capacity"]
+    inputs = np.ndarray((capacity, *meta["input_shape"]), dtype=np.float32, buffer=input_shm.buf)
+    outputs = np.ndarray((capacity, *meta["output_shape"]), dtype=np.float32, buffer=output_shm.buf)
+    conn.send(("ready", os.getpid()))
+
+    try:
+        while True:
+            count = conn.recv()
+            if count is None:
+                break
+            try:
+                with torch.no_grad():
+                    features = graph(torch.from_numpy(inputs[:count]).to(dtype))
+                # Written straight into the shared output buffer (and cast to fp32 on the way)
+                torch.from_numpy(outputs[:count]).copy_(features)
+                conn.send(("ok", count))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    except EOFError:
+        # Parent went away
+        pass
+    finally:
+        del inputs, outputs
+        input_shm.close()
+        output_shm.close()
+
+
+class _Worker:
+    """Parent-side handle of a worker process and its shared buffers"""
+
+    def __init__(self, index: int, cores: List[int], pool: "InferenceWorkerPool"):
+        self.index = index
+        self.cores = cores
+        input_shape = pool.meta["input_shape"]
+        output_shape = pool.meta["output_shape"]
+        self.input_shm = SharedMemory(create=True, size=pool.capacity * int(np.prod(input_shape)) * 4)
+        self.output_shm = SharedMemory(create=True, size=pool.capacity * int(np.prod(output_shape)) * 4)
+        self.inputs = np.ndarray((pool.capacity, *input_shape), dtype=np.float32, buffer=self.input_shm.buf)
+        self.outputs = np.ndarray((pool.capacity, *output_shape), dtype=np.float32, buffer=self.output_shm.buf)
+
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, {
+                "snapshot": pool.snapshot,
+                "cores": cores,
+                "threads": pool.torch_threads or max(1, len(cores)),
+                "graph_mode": pool.graph_mode,
+                "capacity": pool.capacity,
+                "input_shm": self.input_shm.name,
+                "output_shm": self.output_shm.name
+            }),
+            name=f"vision-worker-{index}",
+            daemon=True
+        )
+
+    def start(self) -> None:
+        self.process.start()
+        if not self.conn.poll(WORKER_START_TIMEOUT):
+            raise TimeoutError(f"Worker {self.index} did not start within {WORKER_START_TIMEOUT}s")
+        status, detail = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"Worker {self.index} failed to start: {detail}")
+
+    def run(self, pixel_values: np.ndarray) -> np.ndarray:
+        count = pixel_values.shape[0]
+        self.inputs[:count] = pixel_values
+        self.conn.send(count)
+        status, detail = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Worker {self.index} failed: {detail}")
+        # Copy out: the buffer is reused by the next batch
+        return self.outputs[:count].copy()
+
+    def close(self) -> None:
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        except (OSError, EOFError, ValueError):
+            pass
+        finally:
+            self.conn.close()
+            del self.inputs, self.outputs
+            for shm in (self.input_shm, self.output_shm):
+                shm.close()
+                shm.unlink()
+
+
+class InferenceWorkerPool:
+    """
+    Pool of vision worker processes, a drop-in replacement for MicroBatchScheduler.
+    Every worker is pinned to its own core set with its own torch thread count,
+    memory-maps the same safetensors snapshot of the vision tower (weights are
+    stored once in the page cache), and exchanges batches with the parent through
+    shared-memory buffers rather than pickling. Workers are started on demand up
+    to max_workers and stopped after idle_timeout seconds without work.
+    """
+
+    def __init__(
+        self,
+        snapshot: str,
+        max_workers: int = 2,
+        min_workers: int = 0,
+        cores_per_worker: Optional[int] = None,
+        torch_threads: Optional[int] = None,
+        capacity: int = 8,
+        idle_timeout: float = 300.0,
+        graph_mode: str = "eager",
+        output_dtype: Any = None
+    ):
+        """
+        Initialize the pool (no worker is started yet)
+
+        Args:
+            snapshot: Directory written by export_tower_snapshot
+            max_workers: Maximum number of worker processes
+            min_workers: Workers kept alive when idle
+            cores_per_worker: Cores pinned to each worker (defaults to an even share)
+            torch_threads: torch intra-op threads per worker (defaults to cores_per_worker)
+            capacity: Maximum images per worker call (larger submissions are split)
+            idle_timeout: Seconds without work after which a worker above min_workers exits
+            graph_mode: Execution mode built by each worker ("eager", "compile" or "torchscript")
+            output_dtype: torch dtype of the returned features (defaults to float32)
+        """
+        with open(os.path.join(snapshot, "tower.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.snapshot = snapshot
+        self.max_workers = max(1, max_workers)
+        self.min_workers = min(max(0, min_workers), self.max_workers)
+        self.torch_threads = torch_threads
+        self.capacity = max(1, capacity)
+        self.idle_timeout = idle_timeout
+        self.graph_mode = graph_mode
+        self.output_dtype = output_dtype
+
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        share = (cores_per_worker or max(1, len(available) // self.max_workers)) if available else 0
+        # With more workers than cores the core sets wrap around and overlap
+        self._core_sets = [
+            [available[(i * share + j) % len(available)] for j in range(share)]
+            for i in range(self.max_workers)
+        ]
+
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: Dict[int, threading.Thread] = {}
+        self._available = 0
+        self._stopping = False
+
+        self.started = 0
+        self.retired = 0
+        self.batches = 0
+        self.images = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        """
+        Start the minimum number of workers
+        """
+        self._stopping = False
+        with self._lock:
+            while len(self._threads) < self.min_workers:
+                self._spawn()
+        logger.info(
+            f"Started inference worker pool (max_workers={self.max_workers}, "
+            f"cores={self._core_sets}, snapshot={self.snapshot})"
+        )
+
+    def _spawn(self) -> None:
+        # Called with the lock held; a starting worker already counts as available capacity
+        index = next(i for i in range(self.max_workers) if i not in self._threads)
+        thread = threading.Thread(target=self._serve, args=(index,), name=f"vision-pool-{index}", daemon=True)
+        self._threads[index] = thread
+        self._available += 1
+        self.started += 1
+        thread.start()
+
+    def _serve(self, index: int) -> None:
+        worker = None
+        died = False
+        try:
+            worker = _Worker(index, self._core_sets[index], self)
+            worker.start()
+            logger.info(f"Vision worker {index} ready (pid {worker.process.pid}, cores {worker.cores})")
+
+            while True:
+                try:
+                    job = self._jobs.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    with self._lock:
+                        if len(self._threads) > self.min_workers:
+                            # Idle scale-down; leave the pool under the lock so two idle
+                            # workers cannot both retire below min_workers
+                            self._threads.pop(index, None)
+                            self.retired += 1
+                            break
+                    continue
+                if job is None:
+                    break
+                if not worker.process.is_alive():
+                    # Killed while idle: hand the job to the replacement instead of failing it
+                    self._jobs.put(job)
+                    died = True
+                    break
+
+                with self._lock:
+                    self._available -= 1
+                pixel_values, future = job
+                try:
+                    if future.set_running_or_notify_cancel():
+                        with stage_timer("encode"):
+                            features = worker.run(pixel_values)
+                        self._record(pixel_values.shape[0])
+                        future.set_result(self._to_tensor(features))
+                except Exception as e:
+                    logger.error(f"Vision worker {index} failed: {str(e)}")
+                    self.failures += 1
+                    if not future.done():
+                        future.set_exception(e)
+                    if isinstance(e, (EOFError, OSError)):
+                        # Broken pipe: give the exiting process a moment to be reaped
+                        worker.process.join(timeout=5)
+                    if not worker.process.is_alive():
+                        # Only the job it was running is lost
+                        died = True
+                        break
+                finally:
+                    with self._lock:
+                        self._available += 1
+        except Exception as e:
+            logger.error(f"Vision worker {index} could not start: {str(e)}")
+            self.failures += 1
+            self._fail_pending(e)
+        finally:
+            with self._lock:
+                self._threads.pop(index, None)
+                self._available -= 1
+                if died and not self._stopping:
+                    logger.warning(f"Vision worker {index} died, starting a replacement")
+                    self._spawn()
+            if worker is not None:
+                worker.close()
+                logger.info(f"Vision worker {index} stopped")
+
+    def _fail_pending(self, error: Exception) -> None:
+        # Without any worker left, queued jobs would wait forever
+        with self._lock:
+            if len(self._threads) > 1:
+                return
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and job[1].set_running_or_notify_cancel():
+                job[1].set_exception(error)
+
+    def _to_tensor(self, features: np.ndarray) -> Any:
+        import torch
+        tensor = torch.from_numpy(features)
+        return tensor.to(self.output_dtype) if self.output_dtype is not None else tensor
+
+    def _record(self, count: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.images += count
+
+    def submit(self, pixel_values: Any) -> Future:
+        """
+        Queue preprocessed images for encoding by a worker
+
+        Args:
+            pixel_values: Preprocessed images of shape [n, 3, H, W] (tensor or NumPy array)
+
+        Returns:
+            Future resolving to the [n, tokens, hidden] features tensor
+        """
+        if self._stopping:
+            raise RuntimeError("Inference worker pool is stopped")
+
+        pixel_values = np.ascontiguousarray(
+            pixel_values.detach().cpu().numpy() if hasattr(pixel_values, "detach") else pixel_values,
+            dtype=np.float32
+        )
+        if pixel_values.shape[0] > self.capacity:
+            return self._submit_split(pixel_values)
+
+        future: Future = Future()
+        self._jobs.put((pixel_values, future))
+        with self._lock:
+            if self._available < self._jobs.qsize() and len(self._threads) < self.max_workers:
+                self._spawn()
+        return future
+
+    def _submit_split(self, pixel_values: np.ndarray) -> Future:
+        import torch
+
+        parts = [
+            self.submit(pixel_values[start:start + self.capacity])
+            for start in range(0, pixel_values.shape[0], self.capacity)
+        ]
+        combined: Future = Future()
+
+        def on_done(_):
+            if combined.done() or not all(part.done() for part in parts):
+                return
+            try:
+                combined.set_result(torch.cat([part.result() for part in parts], dim=0))
+            except Exception as e:
+                combined.set_exception(e)
+
+        for part in parts:
+            part.add_done_callback(on_done)
+        return combined
+
+    def encode(self, pixel_values: Any) -> Any:
+        """
+        Encode images through the pool, blocking until they are done
+
+        Args:
+            pixel_values: Preprocessed images of shape [n, 3, H, W]
+
+        Returns:
+            Image features tensor of shape [n, tokens, hidden]
+        """
+        return self.submit(pixel_values).result()
+
+    def stop(self) -> None:
+        """
+        Stop every worker and release the shared buffers
+        """
+        self._stopping = True
+        with self._lock:
+            threads = list(self._threads.values())
+        for _ in threads:
+            self._jobs.put(None)
+        for thread in threads:
+            thread.join()
+        logger.info("Stopped inference worker pool")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool metrics
+
+        Returns:
+            Dict with worker and throughput counters
+        """
+        with self._lock:
+            return {
+                "backend": "worker_pool",
+                "workers": len(self._threads),
+                "max_workers": self.max_workers,
+                "min_workers": self.min_workers,
+                "queue_depth": self._jobs.qsize(),
+                "workers_started": self.started,
+                "workers_retired": self.retired,
+                "batches": self.batches,
+                "images": self.images,
+                "failures": self.failures,
+                "core_sets": self._core_sets
+            }
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from src.utils.config import get_server_config
+from src.services.image_processing import process_images
+from src.services.report_generation import generate_medical_report
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool for CPU-bound vision inference so it never runs on the event loop
+vision_executor = ThreadPoolExecutor(
+    max_workers=get_server_config().get('vision_workers', 2),
+    thread_name_prefix="vision"
+)
+
+async def run_in_vision_executor(func, *args):
+    """Run a blocking vision call on the bounded executor"""
+    loop = asyncio.get_running_loop()
+    # Carry the request's trace id into the executor thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(vision_executor, context.run, func, *args)
+
+async def decode_uploads(contents: List[bytes]) -> list:
+    """Decode uploaded file contents off the event loop (raises UploadRejectedError)"""
+    from src.services.ingestion import decode_images
+
+    return await run_in_vision_executor(decode_images, contents)
+
+async def analyze(image_data: list, patient_data: Dict[str, str], session_id: Optional[str] = None) -> str:
+    """
+    Run the analysis pipeline: vision encoding, then the Gemini report
+
+    Args:
+        image_data: Decoded PIL images
+        patient_data: Form fields (name, age, gender, exam_type, language,
+            prompt_template, clinical_context)
+        session_id: Session the study is saved under, to index it for
+            similar-study search
+
+    Returns:
+        Report HTML
+    """
+    # Process images and get context string (CPU-bound, off the event loop)
+    vision_context = await run_in_vision_executor(process_images, image_data, session_id)
+
+    return await generate_medical_report(
+        image_context=vision_context,
+        patient_data=patient_data,
+        language=patient_data["language"],
+        prompt_template_name=patient_data["prompt_template"]
+    )
+
+async def run_analysis_job(
+    contents: List[bytes],
+    patient_data: Dict[str, str],
+    session_id: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Run the pipeline for a queued job, starting from the uploaded file contents
+
+    Args:
+        contents: File contents read from the uploads
+        patient_data: Form fields
+        session_id: Session the job is persisted under (see analyze)
+
+    Returns:
+        Dict with the report HTML
+
+    Raises:
+        RuntimeError: When the report could not be generated, so the job fails
+            instead of finishing with the error text as its report
+    """
+    image_data = await decode_uploads(contents)
+    report_html = await analyze(image_data, patient_data, session_id)
+    # generate_medical_report returns its failures as text
+    if report_html.startswith("Error"):
+        raise RuntimeError(report_html)
+    return {"report": report_html}
@@ -0,0 +1,275 @@
+import zlib
+import struct
+import asyncio
+import logging
+from urllib.parse import unquote
+from typing import AsyncIterator, Tuple
+
+from src.services.ingestion import UploadRejectedError
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SIGNATURE = b"PK\x03\x04"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+# Central directory, ZIP64 end records, end of central directory: no entry follows
+TRAILER_SIGNATURES = (b"PK\x01\x02", b"PK\x06\x06", b"PK\x06\x07", b"PK\x05\x06")
+# Local file header after its signature
+LOCAL_HEADER = struct.Struct("<HHHHHIIIHH")
+ZIP64_EXTRA_ID = 0x0001
+STORED, DEFLATED = 0, 8
+FLAG_ENCRYPTED, FLAG_DESCRIPTOR, FLAG_UTF8 = 0x1, 0x8, 0x800
+# Inflated entries are decompressed off the event loop from this size on
+THREAD_INFLATE_BYTES = 1024 * 1024
+
+
+class ChunkReader:
+    """
+    Exact-size reads over an async iterator of byte chunks (a request body),
+    enforcing a cap on the total number of bytes received.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], max_bytes: int):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._eof = False
+        self.max_bytes = max_bytes
+        self.received = 0
+
+    async def _fill(self) -> bool:
+        if self._eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            return False
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadRejectedError(413, f"Archive exceeds {self.max_bytes // (1024 * 1024)} MB")
+        self._buffer += chunk
+        return True
+
+    async def read_exactly(self, size: int) -> bytes:
+        """Read size bytes (UploadRejectedError if the stream ends first)"""
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise UploadRejectedError(400, "Archive is truncated")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read_some(self) -> bytes:
+        """Read whatever is buffered, or the next chunk"""
+        if not self._buffer and not await self._fill():
+            raise UploadRejectedError(400, "Archive is truncated")
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def unread(self, data: bytes) -> None:
+        """Put bytes back in front of the stream"""
+        self._buffer[:0] = data
+
+    async def at_eof(self) -> bool:
+        while not self._buffer:
+            if not await self._fill():
+                return True
+        return False
+
+    async def drain(self) -> None:
+        """Consume the rest of the stream (counted against max_bytes)"""
+        self._buffer.clear()
+        while await self._fill():
+            self._buffer.clear()
+
+
+def zip64_sizes(extra: bytes, size: int, compressed: int) -> Tuple[int, int]:
+    """Read the 64-bit sizes of a ZIP64 extra field (only the fields saturated in the header are present)"""
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, length = struct.unpack_from("<HH", extra, offset)
+        if field_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, offset + 4))
+            if size == 0xFFFFFFFF:
+                size = next(values, size)
+            if compressed == 0xFFFFFFFF:
+                compressed = next(values, compressed)
+            break
+        offset += 4 + length
+    return size, compressed
+
+
+def inflate(raw: bytes, max_bytes: int, name: str) -> bytes:
+    """Inflate a raw deflate stream, refusing output beyond max_bytes (ZIP bombs)"""
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    data = inflater.decompress(raw, max_bytes + 1)
+    if len(data) > max_bytes or inflater.unconsumed_tail:
+        raise UploadRejectedError(413, f"{name}: file exceeds {max_bytes // (1024 * 1024)} MB")
+    return data
+
+
+async def inflate_stream(reader: ChunkReader, max_bytes: int, name: str) -> bytes:
+    """Inflate a deflate stream of unknown length, putting back what follows it"""
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    data = bytearray()
+    consumed = 0
+    while not inflater.eof:
+        raw = await reader.read_some()
+        consumed += len(raw)
+        # Small entries stay on the event loop; once the entry is known to be
+        # large, every further chunk is inflated off it like known-size entries
+        if consumed >= THREAD_INFLATE_BYTES:
+            data += await asyncio.to_thread(inflater.decompress, raw, max_bytes + 1 - len(data))
+        else:
+            data += inflater.decompress(raw, max_bytes + 1 - len(data))
+        if len(data) > max_bytes or inflater.unconsumed_tail:
+            raise UploadRejectedError(413, f"{name}: file exceeds {max_bytes // (1024 * 1024)} MB")
+    reader.unread(inflater.unused_data)
+    return bytes(data)
+
+
+async def iter_zip_entries(
+    chunks: AsyncIterator[bytes],
+    max_archive_bytes: int,
+    max_entry_bytes: int
+) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Read the files of a ZIP archive as it arrives, without extracting it to disk
+
+    The local file headers are followed in archive order and the central
+    directory at the end is skipped. Stored and deflated entries are
+    supported, with or without data descriptors (except stored entries with
+    one, whose end cannot be found without the central directory).
+
+    Args:
+        chunks: Archive bytes (e.g. the request body)
+        max_archive_bytes: Cap on the archive size
+        max_entry_bytes: Cap on the uncompressed size of each file
+
+    Yields:
+        Tuples of (path in the archive, file contents); directories are skipped
+    """
+    reader = ChunkReader(chunks, max_archive_bytes)
+    while not await reader.at_eof():
+        signature = await reader.read_exactly(4)
+        if signature in TRAILER_SIGNATURES:
+            await reader.drain()
+            return
+        if signature != LOCAL_SIGNATURE:
+            raise UploadRejectedError(400, "Not a ZIP archive")
+
+        _, flags, method, _, _, crc, compressed, size, name_length, extra_length = LOCAL_HEADER.unpack(
+            await reader.read_exactly(LOCAL_HEADER.size)
+        )
+        name = (await reader.read_exactly(name_length)).decode("utf-8" if flags & FLAG_UTF8 else "cp437")
+        extra = await reader.read_exactly(extra_length)
+        zip64 = 0xFFFFFFFF in (size, compressed)
+        if zip64:
+            size, compressed = zip64_sizes(extra, size, compressed)
+        if flags & FLAG_ENCRYPTED:
+            raise UploadRejectedError(400, f"{name}: encrypted archives are not supported")
+        if method not in (STORED, DEFLATED):
+            raise UploadRejectedError(415, f"{name}: compression method {method} is not supported")
+
+        if flags & FLAG_DESCRIPTOR:
+            if method == STORED:
+                raise UploadRejectedError(400, f"{name}: stored entry with a data descriptor cannot be streamed")
+            data = await inflate_stream(reader, max_entry_bytes, name)
+            # The descriptor signature is optional
+            descriptor = await reader.read_exactly(4)
+            if descriptor != DESCRIPTOR_SIGNATURE:
+                reader.unread(descriptor)
+            crc = struct.unpack("<I", await reader.read_exactly(4))[0]
+            await reader.read_exactly(16 if zip64 else 8)
+        else:
+            if size > max_entry_bytes:
+                raise UploadRejectedError(413, f"{name}: file exceeds {max_entry_bytes // (1024 * 1024)} MB")
+            raw = await reader.read_exactly(compressed)
+            if method == STORED:
+                data = raw
+            elif len(raw) >= THREAD_INFLATE_BYTES:
+                data = await asyncio.to_thread(inflate, raw, max_entry_bytes, name)
+            else:
+                data = inflate(raw, max_entry_bytes, name)
+
+        if zlib.crc32(data) != crc:
+            raise UploadRejectedError(400, f"{name}: CRC mismatch, the archive is corrupted")
+        if not name.endswith("/"):
+            yield name, data
+
+
+async def iter_multipart_entries(
+    chunks: AsyncIterator[bytes],
+    boundary: bytes,
+    max_archive_bytes: int,
+    max_entry_bytes: int
+) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Read the parts of a multipart/form-data body as it arrives, in memory
+
+    Args:
+        chunks: Request body
+        boundary: Multipart boundary from the Content-Type header
+        max_archive_bytes: Cap on the body size
+        max_entry_bytes: Cap on the size of each part
+
+    Yields:
+        Tuples of (file name, or field name for fields without one, contents)
+    """
+    try:
+        from python_multipart.multipart import MultipartParser, parse_options_header
+    except ImportError:
+        # python-multipart < 0.0.13
+        from multipart.multipart import MultipartParser, parse_options_header
+
+    finished = []
+    part = {}
+
+    def on_part_begin():
+        part.update(headers={}, field=b"", value=b"", data=bytearray())
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b"", b""
+
+    def on_part_data(data: bytes, start: int, end: int):
+        part["data"] += data[start:end]
+        if len(part["data"]) > max_entry_bytes:
+            raise UploadRejectedError(413, f"Part exceeds {max_entry_bytes // (1024 * 1024)} MB")
+
+    def on_part_end():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = options.get(b"filename") or options.get(b"name") or b""
+        # Some clients (aiohttp) percent-encode the "/" of paths in file names
+        finished.append((unquote(name.decode("utf-8")), bytes(part["data"])))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_archive_bytes:
+            raise UploadRejectedError(413, f"Request exceeds {max_archive_bytes // (1024 * 1024)} MB")
+        try:
+            parser.write(chunk)
+        except UploadRejectedError:
+            raise
+        except Exception as e:
+            raise UploadRejectedError(400, f"Malformed multipart body: {str(e)}")
+        while finished:
+            yield finished.pop(0)
+    parser.finalize()
+    while finished:
+        yield finished.pop(0)
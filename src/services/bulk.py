@@ -0,0 +1,435 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from src.utils.config import get_bulk_config
+from src.services.ingestion import UploadRejectedError, decode_images, get_limits, probe_image
+from src.services.archive_stream import iter_multipart_entries, iter_zip_entries
+
+logger = logging.getLogger(__name__)
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed", "application/octet-stream")
+# First entry of the archive: manifest.json in a ZIP, a "manifest" field in a multipart body
+MANIFEST_NAMES = ("manifest.json", "manifest")
+# Manifest keys (the /analyze form fields) -> patient_data keys
+PATIENT_FIELDS = {
+    "patient_name": "name",
+    "patient_age": "age",
+    "patient_gender": "gender",
+    "exam_type": "exam_type",
+    "language": "language",
+    "prompt_template": "prompt_template",
+    "clinical_context": "clinical_context"
+}
+
+Entries = AsyncIterator[Tuple[str, bytes]]
+
+
+class BulkStudy:
+    """One study of a bulk upload as it moves through the pipeline stages"""
+
+    def __init__(self, study_id: str, index: int, image_names: List[str], patient_data: Dict[str, str]):
+        self.study_id = study_id
+        self.index = index
+        self.image_names = image_names
+        self.patient_data = patient_data
+        self.contents: Dict[str, bytes] = {}
+        # Set once every image has arrived (contents are dropped after decoding)
+        self.received = False
+        self.images: Optional[list] = None
+        self.vision_context: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    def result(self, **fields: Any) -> Dict[str, Any]:
+        """NDJSON line describing the study"""
+        return {"type": "result", "study_id": self.study_id, "index": self.index, **fields}
+
+
+def entry_name(name: str) -> str:
+    """Archive path as referenced by the manifest (no leading ./ or /)"""
+    name = name.replace("\\", "/")
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+def parse_manifest(data: bytes, max_studies: int) -> List[BulkStudy]:
+    """
+    Parse the manifest of a bulk upload
+
+    The manifest is a JSON object with optional "defaults" (form fields shared
+    by every study) and a "studies" list; each study has an "id", the archive
+    paths of its "images" and any /analyze form field (patient_name,
+    patient_age, patient_gender, exam_type, language, prompt_template,
+    clinical_context) overriding the defaults.
+
+    Args:
+        data: Manifest contents
+        max_studies: Maximum number of studies
+
+    Returns:
+        Studies in manifest order
+    """
+    try:
+        manifest = json.loads(data)
+    except ValueError as e:
+        raise UploadRejectedError(400, f"Manifest is not valid JSON: {str(e)}")
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("studies"), list):
+        raise UploadRejectedError(400, "Manifest must be an object with a \"studies\" list")
+    if len(manifest["studies"]) > max_studies:
+        raise UploadRejectedError(413, f"At most {max_studies} studies per upload")
+
+    defaults = manifest.get("defaults") or {}
+    max_files = get_limits()["max_files"]
+    studies, study_ids, image_names = [], set(), set()
+    for index, entry in enumerate(manifest["studies"]):
+        if not isinstance(entry, dict):
+            raise UploadRejectedError(400, f"Manifest study {index} is not an object")
+        study_id = str(entry.get("id", ""))
+        names = [entry_name(str(name)) for name in entry.get("images") or []]
+        if not study_id or study_id in study_ids:
+            raise UploadRejectedError(400, f"Manifest study {index}: missing or duplicate id")
+        if not names or len(names) > max_files:
+            raise UploadRejectedError(400, f"Study {study_id}: between 1 and {max_files} images expected")
+        if image_names.intersection(names) or len(set(names)) != len(names):
+            raise UploadRejectedError(400, f"Study {study_id}: an image is listed more than once")
+
+        fields = {**defaults, **entry}
+        patient_data = {key: str(fields.get(field, "")) for field, key in PATIENT_FIELDS.items()}
+        if not patient_data["language"] or not patient_data["prompt_template"]:
+            raise UploadRejectedError(400, f"Study {study_id}: language and prompt_template are required")
+
+        study_ids.add(study_id)
+        image_names.update(names)
+        studies.append(BulkStudy(study_id, index, names, patient_data))
+    return studies
+
+
+class StudyAssembler:
+    """
+    Groups archive entries into the studies of the manifest. A study is
+    released as soon as its last image has arrived, so archives listing each
+    study's images together only ever hold one study in memory.
+    """
+
+    def __init__(self, studies: List[BulkStudy], max_pending_bytes: int, max_study_bytes: int):
+        self.studies = studies
+        self.max_pending_bytes = max_pending_bytes
+        self.max_study_bytes = max_study_bytes
+        self._owners = {name: study for study in studies for name in study.image_names}
+        self._pending: Dict[str, BulkStudy] = {}
+        self._pending_bytes = 0
+        self.released = 0
+        self.ignored = 0
+
+    def add(self, name: str, data: bytes) -> Optional[BulkStudy]:
+        """
+        Add an archive entry
+
+        Args:
+            name: Path in the archive
+            data: File contents
+
+        Returns:
+            The study the entry completed, if any
+        """
+        name = entry_name(name)
+        study = self._owners.pop(name, None)
+        if study is None:
+            # Not in the manifest (or a second copy): skipped
+            self.ignored += 1
+            return None
+
+        study.contents[name] = data
+        study_bytes = sum(len(contents) for contents in study.contents.values())
+        if study_bytes > self.max_study_bytes:
+            raise UploadRejectedError(
+                413, f"Study {study.study_id} exceeds {self.max_study_bytes // (1024 * 1024)} MB of images"
+            )
+        if len(study.contents) < len(study.image_names):
+            self._pending[study.study_id] = study
+            self._pending_bytes += len(data)
+            if self._pending_bytes > self.max_pending_bytes:
+                raise UploadRejectedError(
+                    413, "Too many images waiting for the rest of their study: group each study's files together"
+                )
+            return None
+
+        if self._pending.pop(study.study_id, None) is not None:
+            self._pending_bytes -= study_bytes - len(data)
+        study.received = True
+        self.released += 1
+        return study
+
+    def unreleased(self) -> List[BulkStudy]:
+        """Studies that never received all their images"""
+        return [study for study in self.studies if not study.received]
+
+
+def decode_study(study: BulkStudy) -> list:
+    """Check the headers of a study's files and decode them (runs on the vision executor)"""
+    limits = get_limits()
+    contents = []
+    for name in study.image_names:
+        data = study.contents[name]
+        if probe_image(data, limits, name) is None:
+            raise UploadRejectedError(415, f"{name}: not a recognised image")
+        contents.append(data)
+    return decode_images(contents)
+
+
+async def run_bulk(entries: Entries) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Analyse the studies of a bulk upload while it is still being read
+
+    Reading, decoding, vision encoding and report generation run as separate
+    stages joined by bounded queues: a study is decoded while the next one is
+    read and the previous one encoded, and a full queue pauses the stage
+    before it (ultimately the upload itself). Results are yielded as soon as
+    each study finishes, in completion order.
+
+    Args:
+        entries: Archive entries, the manifest first
+
+    Yields:
+        NDJSON objects: one "manifest" line, a "result" line per study (done or
+        failed, with the failing stage), an "error" line if the upload itself
+        is rejected, and a final "summary" line
+    """
+    # Unbounded on purpose: lines are small, and a client reading slowly must not stall the upload
+    lines: asyncio.Queue = asyncio.Queue()
+    pipeline = asyncio.ensure_future(_run_pipeline(entries, lines))
+    try:
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+            yield line
+        await pipeline
+    finally:
+        if not pipeline.done():
+            pipeline.cancel()
+
+
+async def _run_pipeline(entries: Entries, lines: asyncio.Queue) -> None:
+    from src.services.analysis import run_in_vision_executor
+    from src.services.image_processing import process_images
+    from src.services.report_generation import generate_medical_report
+
+    config = get_bulk_config()
+    limits = get_limits()
+    queue_size = max(1, config.get("queue_size", 4))
+    workers = {
+        "decode": max(1, config.get("decode_workers", 1)),
+        "vision": max(1, config.get("vision_workers", 2)),
+        "report": max(1, config.get("report_workers", 4))
+    }
+    started = time.perf_counter()
+    counts = {"done": 0, "failed": 0}
+
+    def fail(study: BulkStudy, stage: str, error: str) -> None:
+        counts["failed"] += 1
+        lines.put_nowait(study.result(status="failed", stage=stage, error=error))
+
+    async def decode(study: BulkStudy) -> None:
+        study.images = await run_in_vision_executor(decode_study, study)
+        study.contents = {}
+
+    async def encode(study: BulkStudy) -> None:
+        study.vision_context = await run_in_vision_executor(process_images, study.images)
+        study.images = None
+
+    async def report(study: BulkStudy) -> None:
+        patient_data = study.patient_data
+        report_html = await generate_medical_report(
+            image_context=study.vision_context,
+            patient_data=patient_data,
+            language=patient_data["language"],
+            prompt_template_name=patient_data["prompt_template"]
+        )
+        # generate_medical_report returns its failures as text
+        if report_html.startswith("Error"):
+            raise RuntimeError(report_html)
+        counts["done"] += 1
+        lines.put_nowait(study.result(status="done", report=report_html, timings_ms=study.timings))
+
+    async def stage(
+        name: str,
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        handle: Callable[[BulkStudy], Any],
+        downstream_workers: int = 0
+    ) -> None:
+        async def worker():
+            while True:
+                study = await inbox.get()
+                if study is None:
+                    return
+                stage_started = time.perf_counter()
+                try:
+                    await handle(study)
+                except Exception as e:
+                    logger.error(f"Bulk study {study.study_id} failed at {name}: {str(e)}")
+                    fail(study, name, str(e))
+                    continue
+                study.timings[name] = round((time.perf_counter() - stage_started) * 1000, 1)
+                if outbox is not None:
+                    await outbox.put(study)
+
+        await asyncio.gather(*(worker() for _ in range(workers[name])))
+        for _ in range(downstream_workers):
+            await outbox.put(None)
+
+    to_decode: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_vision: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    to_report: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    assembler: Optional[StudyAssembler] = None
+
+    async def read() -> None:
+        nonlocal assembler
+        try:
+            async for name, data in entries:
+                if assembler is None:
+                    if entry_name(name) not in MANIFEST_NAMES:
+                        raise UploadRejectedError(
+                            400, "The manifest must come first (manifest.json, or a \"manifest\" field)"
+                        )
+                    assembler = StudyAssembler(
+                        parse_manifest(data, config.get("max_studies", 1000)),
+                        int(config.get("max_pending_mb", 256) * 1024 * 1024),
+                        limits["max_request_bytes"]
+                    )
+                    lines.put_nowait({"type": "manifest", "studies": len(assembler.studies)})
+                    continue
+                study = assembler.add(name, data)
+                if study is not None:
+                    # Waits while the decode stage is behind: the upload stops being read meanwhile
+                    await to_decode.put(study)
+            if assembler is None:
+                raise UploadRejectedError(400, "Empty upload: no manifest")
+            for study in assembler.unreleased():
+                missing = [name for name in study.image_names if name not in study.contents]
+                fail(study, "upload", f"missing from the upload: {', '.join(missing)}")
+        except Exception as e:
+            status = e.status_code if isinstance(e, UploadRejectedError) else 400
+            logger.warning(f"Bulk upload rejected: {str(e)}")
+            lines.put_nowait({"type": "error", "status": status, "error": str(e)})
+            for study in assembler.unreleased() if assembler is not None else []:
+                fail(study, "upload", "not received: the upload was rejected")
+        # Studies already read are still analysed
+        for _ in range(workers["decode"]):
+            await to_decode.put(None)
+
+    try:
+        await asyncio.gather(
+            read(),
+            stage("decode", to_decode, to_vision, decode, workers["vision"]),
+            stage("vision", to_vision, to_report, encode, workers["report"]),
+            stage("report", to_report, None, report)
+        )
+        summary = {
+            "type": "summary",
+            "studies": len(assembler.studies) if assembler is not None else 0,
+            **counts,
+            "ignored_files": assembler.ignored if assembler is not None else 0,
+            "elapsed_s": round(time.perf_counter() - started, 3)
+        }
+        logger.info(f"Bulk upload finished: {summary}")
+        lines.put_nowait(summary)
+    finally:
+        lines.put_nowait(None)
+
+
+def bulk_entries(content_type: str) -> Callable[[AsyncIterator[bytes]], Entries]:
+    """
+    Pick the archive reader for a bulk request
+
+    Args:
+        content_type: Content-Type header of the request
+
+    Returns:
+        Function turning the body chunks into archive entries
+    """
+    try:
+        from python_multipart.multipart import parse_options_header
+    except ImportError:
+        # python-multipart < 0.0.13
+        from multipart.multipart import parse_options_header
+
+    config = get_bulk_config()
+    max_archive_bytes = int(config.get("max_archive_mb", 4096) * 1024 * 1024)
+    max_entry_bytes = get_limits()["max_file_bytes"]
+    media_type, options = parse_options_header(content_type)
+    media_type = media_type.decode("latin-1") if isinstance(media_type, bytes) else media_type
+
+    if media_type in ZIP_CONTENT_TYPES:
+        return lambda chunks: iter_zip_entries(chunks, max_archive_bytes, max_entry_bytes)
+    if media_type == "multipart/form-data" and options.get(b"boundary"):
+        boundary = options[b"boundary"]
+        return lambda chunks: iter_multipart_entries(chunks, boundary, max_archive_bytes, max_entry_bytes)
+    raise UploadRejectedError(415, "Send a ZIP archive (application/zip) or a multipart/form-data body")
+
+
+class BulkResponse(StreamingResponse):
+    """
+    NDJSON response produced from the request body while it is still arriving.
+    StreamingResponse watches for disconnects by reading the request, which
+    would swallow the body; here the body is read by the pipeline and the
+    disconnect watch only starts once it has been received.
+    """
+
+    def __init__(self, read_entries: Callable[[AsyncIterator[bytes]], Entries]):
+        super().__init__(
+            content=iter(()),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        self.read_entries = read_entries
+
+    async def __call__(self, scope, receive, send) -> None:
+        body_received = asyncio.Event()
+        disconnected = False
+
+        async def body() -> AsyncIterator[bytes]:
+            nonlocal disconnected
+            try:
+                while True:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        disconnected = True
+                        return
+                    if message.get("body"):
+                        yield message["body"]
+                    if not message.get("more_body", False):
+                        return
+            finally:
+                body_received.set()
+
+        async def stream() -> None:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            async for line in run_bulk(self.read_entries(body())):
+                data = json.dumps(line, ensure_ascii=False) + "\n"
+                await send({"type": "http.response.body", "body": data.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        async def watch_disconnect() -> None:
+            await body_received.wait()
+            while not disconnected:
+                if (await receive())["type"] == "http.disconnect":
+                    return
+
+        streaming = asyncio.ensure_future(stream())
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (streaming, watcher):
+                task.cancel()
+        if streaming.done() and not streaming.cancelled():
+            streaming.result()
+        else:
+            logger.warning("Bulk upload client disconnected, remaining studies cancelled")
@@ -0,0 +1,185 @@
+import io
+import logging
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# DICOM Part 10 files carry "DICM" after a 128 byte preamble
+DICOM_MAGIC_OFFSET = 128
+DICOM_MAGIC = b"DICM"
+
+
+class DicomSupportError(Exception):
+    """pydicom is not installed or cannot decode the file"""
+
+
+def is_dicom(data: bytes) -> bool:
+    """Check the DICOM Part 10 magic bytes"""
+    return data[DICOM_MAGIC_OFFSET:DICOM_MAGIC_OFFSET + 4] == DICOM_MAGIC
+
+
+def _pydicom():
+    try:
+        import pydicom
+    except ImportError:
+        raise DicomSupportError("DICOM uploads require the pydicom package")
+    return pydicom
+
+
+def read_header(data: bytes):
+    """
+    Parse the DICOM header without touching the pixel data
+
+    Args:
+        data: DICOM file contents (the pixel data may still be missing)
+
+    Returns:
+        pydicom Dataset without PixelData
+    """
+    return _pydicom().dcmread(io.BytesIO(data), stop_before_pixels=True)
+
+
+def frame_count(ds) -> int:
+    """Number of frames declared by the header"""
+    return int(getattr(ds, "NumberOfFrames", 1) or 1)
+
+
+def header_dimensions(ds) -> Tuple[int, int, int]:
+    """Get (columns, rows, frames) from the header"""
+    return int(ds.Columns), int(ds.Rows), frame_count(ds)
+
+
+def select_frames(total: int, max_frames: int) -> List[int]:
+    """
+    Pick up to max_frames frame indices spread evenly over the series
+
+    Args:
+        total: Number of frames in the series
+        max_frames: Maximum number of frames to keep
+
+    Returns:
+        Sorted frame indices
+    """
+    if total <= max_frames:
+        return list(range(total))
+    return sorted({int(round(i)) for i in np.linspace(0, total - 1, max_frames)})
+
+
+def _first(value: Any) -> Optional[float]:
+    """Window attributes may be multi-valued: use the first (default) window"""
+    if value is None:
+        return None
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+
+def apply_windowing(frame: np.ndarray, ds) -> np.ndarray:
+    """
+    Map stored pixel values to display uint8 values
+
+    Applies the modality LUT (rescale slope/intercept), then the VOI LUT or the
+    linear window (center/width) from the header, falling back to the frame's
+    min/max, and inverts MONOCHROME1. All operations are vectorised over the frame.
+
+    Args:
+        frame: Stored pixel values of one frame
+        ds: pydicom Dataset holding the header
+
+    Returns:
+        uint8 array of the same shape
+    """
+    if frame.ndim == 3:
+        # Colour frames (RGB / converted YBR) are already display values
+        if frame.dtype == np.uint8:
+            return frame
+        return (frame.astype(np.float32) / max(float(frame.max()), 1.0) * 255).astype(np.uint8)
+
+    slope = float(getattr(ds, "RescaleSlope", 1) or 1)
+    intercept = float(getattr(ds, "RescaleIntercept", 0) or 0)
+    values = frame.astype(np.float32)
+    if slope != 1 or intercept != 0:
+        values = values * slope + intercept
+
+    center = _first(getattr(ds, "WindowCenter", None))
+    width = _first(getattr(ds, "WindowWidth", None))
+
+    if "VOILUTSequence" in ds and center is None:
+        # Non-linear VOI LUT tables: let pydicom index them
+        from pydicom.pixels import apply_voi_lut
+        values = apply_voi_lut(values, ds).astype(np.float32)
+        low, high = float(values.min()), float(values.max())
+        scaled = (values - low) / max(high - low, 1e-6)
+    elif center is not None and width is not None and width >= 1:
+        # DICOM PS3.3 C.11.2.1.2 linear window
+        scaled = (values - (center - 0.5)) / max(width - 1, 1) + 0.5
+    else:
+        low, high = float(values.min()), float(values.max())
+        scaled = (values - low) / max(high - low, 1e-6)
+
+    np.clip(scaled, 0.0, 1.0, out=scaled)
+    if getattr(ds, "PhotometricInterpretation", "") == "MONOCHROME1":
+        scaled = 1.0 - scaled
+    return (scaled * 255.0 + 0.5).astype(np.uint8)
+
+
+def iter_frames(data: bytes, indices: Sequence[int]) -> Iterator[np.ndarray]:
+    """
+    Decode only the requested frames of a (multi-frame) DICOM file
+
+    Args:
+        data: DICOM file contents
+        indices: Frame indices to decode
+
+    Yields:
+        Stored pixel values of each requested frame, in index order
+    """
+    pydicom = _pydicom()
+    try:
+        from pydicom.pixels import iter_pixels
+    except ImportError:
+        # pydicom < 3 has no per-frame decoder: the whole series is decoded once
+        logger.warning("pydicom < 3.0 decodes every frame, upgrade for lazy frame access")
+        pixels = pydicom.dcmread(io.BytesIO(data)).pixel_array
+        if pixels.ndim == 2 or (pixels.ndim == 3 and pixels.shape[-1] in (3, 4) and len(indices) == 1):
+            pixels = pixels[np.newaxis]
+        for index in indices:
+            yield pixels[index]
+        return
+
+    # Reads frames straight from the encoded buffer, one at a time
+    yield from iter_pixels(io.BytesIO(data), indices=list(indices))
+
+
+def dicom_to_images(data: bytes, max_frames: int = 8) -> List[Image.Image]:
+    """
+    Convert a DICOM file into display-ready PIL images, one per selected frame
+
+    Args:
+        data: DICOM file contents
+        max_frames: Maximum number of frames kept from a multi-frame series
+
+    Returns:
+        List of PIL Images ("L" or "RGB")
+    """
+    try:
+        ds = read_header(data)
+        indices = select_frames(frame_count(ds), max_frames)
+
+        images = []
+        for frame in iter_frames(data, indices):
+            img = Image.fromarray(apply_windowing(frame, ds))
+            img.info["original_size"] = img.size
+            images.append(img)
+
+        logger.info(f"Decoded {len(images)} of {frame_count(ds)} DICOM frames")
+        return images
+    except DicomSupportError:
+        raise
+    except Exception as e:
+        logger.error(f"Error decoding DICOM file: {str(e)}")
+        raise DicomSupportError(f"Cannot decode DICOM file: {str(e)}")
@@ -0,0 +1,331 @@
+import json
+import asyncio
+import random
+import logging
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional
+
+from src.utils.config import get_gemini_config
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiAPIError(Exception):
+    """Error returned by the Gemini API after retries are exhausted"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Gemini API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class GeminiClient:
+    """
+    Asynchronous Gemini API client.
+    Holds one keep-alive connection pool for the whole process, applies
+    connect/read timeouts to every call, retries 429/5xx responses with
+    jittered exponential backoff and limits in-flight calls to the API quota.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str],
+        model_id: str,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 4,
+        pool_size: int = 20,
+        keepalive_timeout: float = 60.0
+    ):
+        """
+        Initialize the client
+
+        Args:
+            base_url: Base URL of the Gemini models endpoint
+            api_key: Gemini API key
+            model_id: Default model identifier
+            connect_timeout: Seconds allowed to establish a connection
+            read_timeout: Seconds allowed between reads of the response
+            max_retries: Retries after the first attempt on 429/5xx or connection errors
+            backoff_base: Base delay in seconds of the exponential backoff
+            backoff_max: Maximum delay in seconds between retries
+            max_concurrency: Maximum number of calls in flight
+            pool_size: Maximum number of pooled connections
+            keepalive_timeout: Seconds an idle pooled connection is kept open
+        """
+        # aiohttp is imported with the first client, not at API start-up
+        import aiohttp
+
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model_id = model_id
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max(1, max_concurrency)
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+
+        self._connection_errors = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_session(self) -> "aiohttp.ClientSession":
+        """
+        Create the pooled session on first use in the running event loop
+        """
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # aiohttp speaks HTTP/1.1 only; keep-alive pooling avoids repeated TCP+TLS setup
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"}
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    def model_url(self, method: str, model_id: Optional[str] = None) -> str:
+        """
+        Build the URL of a model method such as generateContent
+        """
+        return f"{self.base_url}/{model_id or self.model_id}:{method}"
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Compute the delay before the next retry using full jitter
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def api_url(self, resource: str) -> str:
+        """
+        Build the URL of an API resource outside the models collection, such as cachedContents
+        """
+        root = self.base_url[:-len("/models")] if self.base_url.endswith("/models") else self.base_url
+        return f"{root}/{resource}"
+
+    async def post_json(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST a JSON payload with retries, timeouts and the concurrency limit
+
+        Args:
+            url: Full request URL
+            payload: JSON request body
+
+        Returns:
+            Decoded JSON response
+        """
+        return await self.request_json("POST", url, payload)
+
+    async def request_json(self, method: str, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a JSON payload with retries, timeouts and the concurrency limit
+
+        Args:
+            method: HTTP method
+            url: Full request URL
+            payload: JSON request body
+
+        Returns:
+            Decoded JSON response
+        """
+        session = self._ensure_session()
+        headers = {"x-goog-api-key": self.api_key} if self.api_key else {}
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    async with session.request(method, url, json=payload, headers=headers) as response:
+                        if response.status < 400:
+                            return await response.json()
+
+                        body = await response.text()
+                        if response.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                            raise GeminiAPIError(response.status, body[:500])
+                        retry_after = response.headers.get("Retry-After")
+                        logger.warning(f"Gemini API returned {response.status}, retrying")
+            except self._connection_errors as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Gemini API connection error: {str(e) or type(e).__name__}, retrying")
+
+            await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+
+        # Unreachable: the last attempt either returns or raises
+        raise GeminiAPIError(0, "retries exhausted")
+
+    async def generate_content(
+        self,
+        payload: Dict[str, Any],
+        model_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Call the generateContent method
+
+        Args:
+            payload: generateContent request body
+            model_id: Model identifier (defaults to the client model)
+
+        Returns:
+            Decoded generateContent response
+        """
+        return await self.post_json(self.model_url("generateContent", model_id), payload)
+
+    async def create_cached_content(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Create a cachedContents resource (a prompt prefix stored by the API)
+
+        Args:
+            body: CachedContent with model, contents or systemInstruction and ttl
+
+        Returns:
+            Created CachedContent, its handle in "name"
+        """
+        return await self.post_json(self.api_url("cachedContents"), body)
+
+    async def update_cached_content_ttl(self, name: str, ttl_seconds: float) -> Dict[str, Any]:
+        """
+        Extend the lifetime of a cachedContents resource
+
+        Args:
+            name: Handle returned on creation ("cachedContents/...")
+            ttl_seconds: New lifetime counted from now
+
+        Returns:
+            Updated CachedContent
+        """
+        url = self.api_url(name) + "?updateMask=ttl"
+        return await self.request_json("PATCH", url, {"ttl": f"{int(ttl_seconds)}s"})
+
+    async def stream_json(self, url: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST a JSON payload and yield the JSON events of a Server-Sent Events response.
+        Retries only happen before the first event, a stream is never replayed.
+
+        Args:
+            url: Full request URL (with alt=sse)
+            payload: JSON request body
+
+        Yields:
+            Decoded JSON object of each data event
+        """
+        session = self._ensure_session()
+        headers = {"x-goog-api-key": self.api_key} if self.api_key else {}
+
+        streamed = False
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    async with session.post(url, json=payload, headers=headers) as response:
+                        if response.status < 400:
+                            async for line in response.content:
+                                line = line.strip()
+                                if line.startswith(b"data:"):
+                                    streamed = True
+                                    yield json.loads(line[5:])
+                            return
+
+                        body = await response.text()
+                        if response.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                            raise GeminiAPIError(response.status, body[:500])
+                        retry_after = response.headers.get("Retry-After")
+                        logger.warning(f"Gemini API returned {response.status}, retrying")
+            except self._connection_errors as e:
+                if streamed or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Gemini API connection error: {str(e) or type(e).__name__}, retrying")
+
+            await asyncio.sleep(self._backoff_delay(attempt, retry_after))
+
+    async def stream_generate_content(
+        self,
+        payload: Dict[str, Any],
+        model_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Call the streamGenerateContent method and yield text as it is generated
+
+        Args:
+            payload: generateContent request body
+            model_id: Model identifier (defaults to the client model)
+
+        Yields:
+            Text parts of each streamed candidate
+        """
+        url = self.model_url("streamGenerateContent", model_id) + "?alt=sse"
+        async for event in self.stream_json(url, payload):
+            for candidate in event.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+
+    async def close(self) -> None:
+        """
+        Close the pooled connections
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    """Get the process-wide Gemini client built from config.yaml"""
+    global _client
+    if _client is None:
+        config = get_gemini_config()
+        timeouts = config.get("timeouts", {})
+        retry = config.get("retry", {})
+        _client = GeminiClient(
+            base_url=config["base_url"],
+            api_key=config["api_key"],
+            model_id=config["model_id"],
+            connect_timeout=timeouts.get("connect", 10),
+            read_timeout=timeouts.get("read", 120),
+            max_retries=retry.get("max_retries", 3),
+            backoff_base=retry.get("backoff_base", 0.5),
+            backoff_max=retry.get("backoff_max", 8),
+            max_concurrency=config.get("max_concurrency", 4),
+            pool_size=config.get("pool_size", 20)
+        )
+    return _client
+
+
+async def close_gemini_client() -> None:
+    """Close the process-wide Gemini client if it was created"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -1,37 +1,35 @@
-from typing import Dict, Tuple, List, Optional
-from PIL import Image
-from src.models.minigpt_med import MiniGPTMedModel
-from src.utils.config import get_minigpt_checkpoint
+from typing import TYPE_CHECKING, List, Optional
+from src.models.registry import get_model_registry
 import logging
 
+if TYPE_CHECKING:
+    from PIL import Image
+
 logger = logging.getLogger(__name__)
 
-def process_images(images: List[Image.Image]) -> Tuple[List[Image.Image], str]:
-    """Process images using MiniGPT-Med model"""
-    processed_images = []
+def process_images(images: List["Image.Image"], session_id: Optional[str] = None) -> str:
+    """
+    Process images using MiniGPT-Med model and return the vision context for the report prompt
+
+    When session_id is given the study is also added to the similar-study index
+    """
     vision_context = ""
     
     try:
-        checkpoint_path = get_minigpt_checkpoint()
-        minigpt_med = MiniGPTMedModel(checkpoint_path=checkpoint_path)
+        minigpt_med = get_model_registry().get()
         
-        for i, img in enumerate(images):
-            vision_output = minigpt_med.process_image(img)
-            processed_img = vision_output.get("processed_image")
+        vision_outputs = minigpt_med.process_images_batch(images)
+        
+        if session_id is not None:
+            from src.services.similarity import index_study
             
-            if processed_img:
-                processed_images.append(processed_img)
-                
-            if vision_output.get("embeddings") is not None:
-                embedding_summary = f"Embedding dims: {vision_output['embeddings'].shape}"
-            else:
-                embedding_summary = "No embeddings generated"
-                
-            vision_context += (
-                f"[Image {i+1} processed. Dimensions: "
-                f"{vision_output.get('width', 'N/A')}x{vision_output.get('height', 'N/A')}. "
-                f"{embedding_summary}]\n"
-            )
+            index_study(session_id, vision_outputs, minigpt_med.identity)
+        
+        for i, vision_output in enumerate(vision_outputs):
+            # Built from the result's metadata: the embeddings are never projected here
+            vision_context += f"[Image {i+1} processed. {vision_output.describe()}]\n"
+            # Nothing downstream reads the features, drop them with the request
+            vision_output.release()
             
         logger.info("Image processing completed successfully")
         
@@ -39,4 +37,4 @@ def process_images(images: List[Image.Image]) -> Tuple[List[Image.Image], str]:
         logger.error(f"Image processing error: {str(e)}")
         vision_context = f"[Vision model processing failed: {str(e)}]\n"
     
-    return processed_images, vision_context
\ No newline at end of file
+    return vision_context
\ No newline at end of file
@@ -0,0 +1,272 @@
+import io
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+from fastapi import UploadFile
+
+from src.utils.config import get_ingestion_config
+from src.utils.metrics import stage_timer
+from src.services import dicom
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMATS = ["JPEG", "PNG", "BMP", "GIF", "TIFF", "WEBP", "DICOM"]
+
+REDUCE_CONVERSIONS = {"P": "RGBA", "PA": "RGBA", "1": "L", "I;16": "I", "I;16B": "I", "I;16L": "I"}
+
+# Headers are looked for in the first bytes only; anything else is checked once fully read
+PROBE_BYTES = 1024 * 1024
+
+
+class UploadRejectedError(Exception):
+    """Upload refused before or during decoding"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_limits() -> Dict[str, Any]:
+    """Get ingestion limits from config.yaml with defaults"""
+    config = get_ingestion_config()
+    return {
+        "chunk_size": int(config.get("chunk_size_kb", 256) * 1024),
+        "max_file_bytes": int(config.get("max_file_mb", 50) * 1024 * 1024),
+        "max_request_bytes": int(config.get("max_request_mb", 200) * 1024 * 1024),
+        "max_files": config.get("max_files", 32),
+        "max_pixels": config.get("max_pixels", 50_000_000),
+        "allowed_formats": set(config.get("allowed_formats", DEFAULT_FORMATS)),
+        "target_size": config.get("target_size", 448),
+        "dicom_max_frames": config.get("dicom_max_frames", 8)
+    }
+
+
+def probe_dicom(data: bytes, limits: Dict[str, Any], name: str = "image") -> Optional[Tuple[str, int, int]]:
+    """
+    Read dimensions from the DICOM header without decoding pixel data
+
+    Args:
+        data: Leading bytes (or all bytes) of the file
+        limits: Limits from get_limits
+        name: File name used in error messages
+
+    Returns:
+        Tuple of ("DICOM", width, height), or None if the header is not complete yet
+    """
+    if "DICOM" not in limits["allowed_formats"]:
+        raise UploadRejectedError(415, f"{name}: unsupported image format DICOM")
+    try:
+        ds = dicom.read_header(data)
+        width, height, frames = dicom.header_dimensions(ds)
+    except dicom.DicomSupportError as e:
+        raise UploadRejectedError(415, f"{name}: {str(e)}")
+    except Exception:
+        return None
+
+    # Only the selected frames are ever decoded
+    frames = min(frames, limits["dicom_max_frames"])
+    if width * height * frames > limits["max_pixels"]:
+        raise UploadRejectedError(
+            413, f"{name}: {frames} frames of {width}x{height} exceed the {limits['max_pixels']} pixel limit"
+        )
+    return "DICOM", width, height
+
+
+def probe_image(data: bytes, limits: Dict[str, Any], name: str = "image") -> Optional[Tuple[str, int, int]]:
+    """
+    Read format and dimensions from the image header without decoding pixels
+
+    Args:
+        data: Leading bytes (or all bytes) of the file
+        limits: Limits from get_limits
+        name: File name used in error messages
+
+    Returns:
+        Tuple of (format, width, height), or None if the header is not complete yet
+    """
+    if dicom.is_dicom(data):
+        return probe_dicom(data, limits, name)
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            image_format, (width, height) = img.format, img.size
+    except Image.DecompressionBombError as e:
+        raise UploadRejectedError(413, f"{name}: {str(e)}")
+    except Exception:
+        # Header incomplete or not an image (yet)
+        return None
+
+    if image_format == "MPO":
+        # Multi-picture JPEG from phones and cameras: decoded as its primary JPEG image
+        image_format = "JPEG"
+    if image_format not in limits["allowed_formats"]:
+        raise UploadRejectedError(415, f"{name}: unsupported image format {image_format}")
+    if width * height > limits["max_pixels"]:
+        # Rejected from the header alone, before any pixel is decoded
+        raise UploadRejectedError(
+            413, f"{name}: {width}x{height} exceeds the {limits['max_pixels']} pixel limit"
+        )
+    return image_format, width, height
+
+
+async def read_upload(
+    upload: UploadFile,
+    limits: Dict[str, Any],
+    request_bytes: int = 0
+) -> bytes:
+    """
+    Read an upload in chunks, enforcing the per-file and per-request byte caps
+    and validating the image header as soon as it has arrived
+
+    Args:
+        upload: Uploaded file
+        limits: Limits from get_limits
+        request_bytes: Bytes already read for the current request
+
+    Returns:
+        File contents
+    """
+    name = upload.filename or "image"
+    buffer = bytearray()
+    probed = False
+
+    while True:
+        chunk = await upload.read(limits["chunk_size"])
+        if not chunk:
+            break
+        buffer += chunk
+
+        if len(buffer) > limits["max_file_bytes"]:
+            raise UploadRejectedError(
+                413, f"{name}: file exceeds {limits['max_file_bytes'] // (1024 * 1024)} MB"
+            )
+        if request_bytes + len(buffer) > limits["max_request_bytes"]:
+            raise UploadRejectedError(
+                413, f"Request exceeds {limits['max_request_bytes'] // (1024 * 1024)} MB of images"
+            )
+        if not probed and len(buffer) - len(chunk) < PROBE_BYTES:
+            probed = probe_image(bytes(buffer), limits, name) is not None
+
+    if not buffer:
+        raise UploadRejectedError(400, f"{name}: empty file")
+    if not probed and probe_image(bytes(buffer), limits, name) is None:
+        raise UploadRejectedError(415, f"{name}: not a recognised image")
+
+    return bytes(buffer)
+
+
+async def read_uploads(uploads: List[UploadFile]) -> List[bytes]:
+    """
+    Read every upload of a request under the ingestion limits
+
+    Args:
+        uploads: Uploaded files
+
+    Returns:
+        File contents, in upload order
+    """
+    limits = get_limits()
+    if len(uploads) > limits["max_files"]:
+        raise UploadRejectedError(413, f"At most {limits['max_files']} images per request")
+
+    contents = []
+    request_bytes = 0
+    with stage_timer("upload_read"):
+        for upload in uploads:
+            data = await read_upload(upload, limits, request_bytes)
+            request_bytes += len(data)
+            contents.append(data)
+    return contents
+
+
+def decode_image(data: bytes, limits: Optional[Dict[str, Any]] = None) -> Image.Image:
+    """
+    Decode an image straight to the encoder's working resolution
+
+    JPEG files are decoded with DCT scaling (draft mode) so large scans never
+    materialise at full resolution; other formats are reduced right after
+    decoding. The original size is kept in img.info["original_size"].
+
+    Args:
+        data: File contents
+        limits: Limits from get_limits
+
+    Returns:
+        Decoded PIL Image
+    """
+    limits = limits or get_limits()
+    img = Image.open(io.BytesIO(data))
+    original_size = img.size
+    target = limits["target_size"]
+
+    if img.format in ("JPEG", "MPO"):
+        # Scales by 1/2, 1/4 or 1/8 while keeping both sides >= the requested size
+        img.draft(None, (target, target))
+    img.load()
+
+    img = reduce_to_target(img, target)
+    img.info["original_size"] = original_size
+    return img
+
+
+def reduce_to_target(img: Image.Image, target: int) -> Image.Image:
+    """
+    Downscale by an integer factor while keeping the shortest side >= target
+
+    Args:
+        img: Decoded PIL Image
+        target: Minimum shortest side
+
+    Returns:
+        Reduced PIL Image (the same object if no reduction applies)
+    """
+    factor = min(img.size) // target
+    if factor < 2:
+        return img
+    # Image.reduce does not handle palette, bilevel or 16-bit modes
+    if img.mode in REDUCE_CONVERSIONS:
+        img = img.convert(REDUCE_CONVERSIONS[img.mode])
+    return img.reduce(factor)
+
+
+def decode_dicom(data: bytes, limits: Optional[Dict[str, Any]] = None) -> List[Image.Image]:
+    """
+    Decode the selected frames of a DICOM file to the encoder's working resolution
+
+    Args:
+        data: File contents
+        limits: Limits from get_limits
+
+    Returns:
+        One windowed PIL Image per selected frame
+    """
+    limits = limits or get_limits()
+    frames = []
+    for img in dicom.dicom_to_images(data, limits["dicom_max_frames"]):
+        original_size = img.info["original_size"]
+        img = reduce_to_target(img, limits["target_size"])
+        img.info["original_size"] = original_size
+        frames.append(img)
+    return frames
+
+
+def decode_images(contents: List[bytes]) -> List[Image.Image]:
+    """
+    Decode every image of a request; DICOM series expand to one image per frame
+
+    Args:
+        contents: File contents from read_uploads
+
+    Returns:
+        Decoded PIL Images
+    """
+    limits = get_limits()
+    images = []
+    with stage_timer("decode"):
+        for data in contents:
+            if dicom.is_dicom(data):
+                images.extend(decode_dicom(data, limits))
+            else:
+                images.append(decode_image(data, limits))
+    return images
@@ -0,0 +1,388 @@
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.utils.config import get_jobs_config
+from src.utils.logging import trace_id_var
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+# (file contents, patient data, session id or None when not persisted) -> result dict
+JobRunner = Callable[[List[bytes], Dict[str, str], Optional[str]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+    def __init__(self, max_queued: int):
+        super().__init__(f"Job queue is full ({max_queued} jobs waiting), retry later")
+
+
+class Job:
+    """
+    An analysis job: the uploaded files, its status and, once finished, its result.
+    Waiters are woken on every status change.
+    """
+
+    def __init__(self, job_id: str, key: str, priority: int, contents: List[bytes], patient_data: Dict[str, str]):
+        self.job_id = job_id
+        self.key = key
+        self.priority = priority
+        self.contents: Optional[List[bytes]] = contents
+        self.patient_data = patient_data
+        self.status = JOB_QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Logs of the job carry the trace id of the request that submitted it
+        self.trace_id = trace_id_var.get()
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def update(self, status: str, **fields: Any) -> None:
+        """Change the status and wake every waiter"""
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, timeout: Optional[float]) -> bool:
+        """
+        Wait for the next status change
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the status changed, False on timeout
+        """
+        if self.finished:
+            return False
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process priority queue of analysis jobs, drained by worker tasks.
+    Identical submissions (same files and form fields) share one job while it is
+    queued, running or retained; a full queue rejects new work instead of
+    growing. Requests and results are persisted through the SessionManager,
+    under the job id, so finished jobs can still be looked up after they are
+    evicted from memory or after a restart.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        workers: int = 2,
+        max_queued: int = 64,
+        result_ttl: float = 3600,
+        persist: bool = True
+    ):
+        """
+        Initialize the queue (call start() from the event loop)
+
+        Args:
+            runner: Coroutine function running the pipeline for one job
+            workers: Number of jobs processed concurrently
+            max_queued: Maximum number of jobs waiting to run
+            result_ttl: Seconds a finished job stays in memory (and deduplicates)
+            persist: Save requests and results through the SessionManager
+        """
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.result_ttl = result_ttl
+        self.persist = persist
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._sequence = 0
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running event loop
+        """
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queued)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started job queue (workers={self.workers}, max_queued={self.max_queued})")
+
+    async def stop(self) -> None:
+        """
+        Cancel the worker tasks; queued jobs are dropped
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped job queue")
+
+    @staticmethod
+    def job_key(contents: List[bytes], patient_data: Dict[str, str]) -> str:
+        """
+        Identify a submission by its files and form fields
+
+        Args:
+            contents: Uploaded file contents
+            patient_data: Form fields
+
+        Returns:
+            Hex digest shared by identical submissions
+        """
+        digest = hashlib.sha256(json.dumps(patient_data, sort_keys=True).encode())
+        for data in contents:
+            digest.update(hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    def submit(self, contents: List[bytes], patient_data: Dict[str, str], priority: int = 0) -> Tuple[Job, bool]:
+        """
+        Queue a job, or return the existing job for an identical submission
+
+        Args:
+            contents: Uploaded file contents
+            patient_data: Form fields
+            priority: Higher runs first; equal priorities run in submission order
+
+        Returns:
+            Tuple of (job, deduplicated)
+
+        Raises:
+            QueueFullError: When max_queued jobs are already waiting
+        """
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+        self._evict()
+
+        key = self.job_key(contents, patient_data)
+        existing = self._jobs.get(self._by_key.get(key, ""))
+        if existing is not None and existing.status != JOB_FAILED:
+            self.deduplicated += 1
+            return existing, True
+
+        if self._queue.full():
+            self.rejected += 1
+            raise QueueFullError(self.max_queued)
+
+        job = Job(uuid.uuid4().hex, key, priority, contents, patient_data)
+        self._sequence += 1
+        self._queue.put_nowait((-priority, self._sequence, job.job_id))
+        self._jobs[job.job_id] = job
+        self._by_key[key] = job.job_id
+        self.submitted += 1
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job still held in memory
+
+        Args:
+            job_id: Job identifier
+
+        Returns:
+            Job or None
+        """
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Describe a job, falling back to the persisted session once it left memory
+
+        Args:
+            job_id: Job identifier
+
+        Returns:
+            Job description or None if unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not self.persist:
+            return None
+
+        from src.utils.session_manager import get_session_manager
+        session = await asyncio.to_thread(get_session_manager().get_session, job_id)
+        if session is None or not session.get("results"):
+            return None
+        record = session["results"][0]
+        return {
+            "job_id": job_id,
+            "status": record.get("status", JOB_DONE),
+            "result": record.get("result"),
+            "error": record.get("error")
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        trace_id_var.set(job.trace_id)
+        job.update(JOB_RUNNING, started_at=time.time())
+        await self._persist_request(job)
+        try:
+            # Persisted jobs are sessions, which makes their study searchable
+            session_id = job.job_id if self.persist else None
+            result = await self.runner(job.contents, job.patient_data, session_id)
+            job.update(JOB_DONE, result=result, finished_at=time.time())
+            self.completed += 1
+        except asyncio.CancelledError:
+            job.update(JOB_FAILED, error="Job queue stopped", finished_at=time.time())
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {str(e)}")
+            job.update(JOB_FAILED, error=str(e), finished_at=time.time())
+            self.failed += 1
+            # A resubmission runs again instead of sharing the failure
+            if self._by_key.get(job.key) == job.job_id:
+                del self._by_key[job.key]
+        finally:
+            # The uploads are no longer needed once the pipeline has run
+            job.contents = None
+        await self._persist_result(job)
+
+    async def _persist_request(self, job: Job) -> None:
+        if not self.persist:
+            return
+        from src.utils.session_manager import get_session_manager
+
+        patient = job.patient_data
+        request_data = {
+            "timestamp": datetime.fromtimestamp(job.created_at).isoformat(),
+            "patient_info": {
+                "name": patient.get("name", ""),
+                "age": patient.get("age", ""),
+                "gender": patient.get("gender", "")
+            },
+            "exam_type": patient.get("exam_type", ""),
+            "language": patient.get("language", ""),
+            "prompt_template": patient.get("prompt_template", ""),
+            "clinical_context": patient.get("clinical_context", ""),
+            "priority": job.priority
+        }
+
+        def save():
+            manager = get_session_manager()
+            manager.save_request(job.job_id, request_data)
+            for data in job.contents or []:
+                manager.save_image(job.job_id, data)
+
+        try:
+            await asyncio.to_thread(save)
+        except Exception as e:
+            logger.error(f"Error persisting job {job.job_id}: {str(e)}")
+
+    async def _persist_result(self, job: Job) -> None:
+        if not self.persist:
+            return
+        from src.utils.session_manager import get_session_manager
+
+        record = {"status": job.status, "result": job.result, "error": job.error}
+        try:
+            await asyncio.to_thread(get_session_manager().save_results, job.job_id, [record])
+        except Exception as e:
+            logger.error(f"Error persisting result of job {job.job_id}: {str(e)}")
+
+    def _evict(self) -> None:
+        # Finished jobs leave memory (and stop deduplicating) after result_ttl
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue metrics
+
+        Returns:
+            Dict with queue depth and job counters
+        """
+        running = sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING)
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": running,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue configured in config.yaml"""
+    global _queue
+    if _queue is None:
+        from src.services.analysis import run_analysis_job
+
+        config = get_jobs_config()
+        _queue = JobQueue(
+            run_analysis_job,
+            workers=config.get("workers", 2),
+            max_queued=config.get("max_queued", 64),
+            result_ttl=config.get("result_ttl_s", 3600),
+            persist=config.get("persist", True)
+        )
+    return _queue
@@ -0,0 +1,326 @@
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+from src.utils.config import get_prompt_cache_config, get_system_prompt, get_system_prompts
+from src.services.gemini_client import RETRYABLE_STATUSES, GeminiAPIError, GeminiClient, get_gemini_client
+
+logger = logging.getLogger(__name__)
+
+# A handle this close to its expiry is not referenced any more: the request could outlive it
+EXPIRY_GUARD_SECONDS = 30
+# Pause before trying again after a transient creation failure (429/5xx, connection)
+TRANSIENT_RETRY_SECONDS = 60
+# Statuses meaning the handle itself is gone (expired, deleted, not visible to this key);
+# other 4xx responses are caused by the request and are not retried with the full prompt
+HANDLE_GONE_STATUSES = {403, 404}
+# Report languages offered by the frontend
+DEFAULT_LANGUAGES = ("en", "fr", "ar")
+
+# (template, language, model id, digest of the rendered prompt)
+PrefixKey = Tuple[str, str, str, str]
+
+
+class CachedPrefix:
+    """A system prompt prefix stored with the cachedContents API"""
+
+    def __init__(self, name: str, expires_at: float):
+        self.name = name
+        self.expires_at = expires_at
+
+
+class PromptCache:
+    """
+    Gemini cachedContents handles of the rendered system prompts.
+    Each (template, language, model id) prefix is uploaded once and requests
+    reference it by handle, sending only the patient and image context. Handles
+    in use are extended in the background before their TTL runs out; idle ones
+    are left to expire. When the model does not support caching (or rejects the
+    prefix, e.g. below its minimum size) requests carry the full prompt, as
+    they do when caching is disabled.
+    Template and language come from the request form and every prefix is a
+    billed upstream resource, so only configured templates and languages are
+    cached; anything else is sent with the full prompt.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        refresh_margin_seconds: float = 600,
+        retry_seconds: float = 3600,
+        languages: Iterable[str] = DEFAULT_LANGUAGES
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            ttl_seconds: Lifetime requested for a cached prefix
+            refresh_margin_seconds: Extend a prefix in use once it expires within this many seconds
+            retry_seconds: Time full prompts are sent after the API rejected a prefix
+            languages: Report languages whose prompts are cached
+        """
+        self.ttl_seconds = max(EXPIRY_GUARD_SECONDS * 4, ttl_seconds)
+        self.refresh_margin_seconds = min(refresh_margin_seconds, self.ttl_seconds / 2)
+        self.retry_seconds = retry_seconds
+        self.languages = frozenset(languages)
+
+        self._entries: Dict[PrefixKey, CachedPrefix] = {}
+        self._unavailable: Dict[PrefixKey, float] = {}
+        self._creating: Dict[PrefixKey, asyncio.Future] = {}
+        self._refreshing: Set[PrefixKey] = set()
+
+        self.hits = 0
+        self.created = 0
+        self.refreshed = 0
+        self.fallbacks = 0
+        self.rejected = 0
+
+        logger.info(f"Prompt cache initialized (ttl={self.ttl_seconds}s, refresh_margin={self.refresh_margin_seconds}s)")
+
+    async def cached_payload(
+        self,
+        client: GeminiClient,
+        payload: Dict[str, Any],
+        template_name: str,
+        language: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Rewrite a report request to reference its cached system prompt
+
+        Args:
+            client: Gemini client
+            payload: generateContent body whose text starts with the rendered system prompt
+            template_name: Prompt template of the request
+            language: Report language
+
+        Returns:
+            Payload with cachedContent and only the text after the prefix, or None
+            when the prefix is not cached (the full payload must be sent)
+        """
+        if language not in self.languages or template_name not in get_system_prompts():
+            self.fallbacks += 1
+            return None
+        contents = payload.get("contents", [])
+        if len(contents) != 1 or len(contents[0].get("parts", [])) != 1:
+            return None
+        text = contents[0]["parts"][0].get("text", "")
+        prefix = f"{get_system_prompt(template_name, language)}\n\n"
+        if not text.startswith(prefix):
+            return None
+
+        name = await self.handle(client, template_name, language, prefix)
+        if name is None:
+            self.fallbacks += 1
+            return None
+        return {
+            **payload,
+            "cachedContent": name,
+            "contents": [{"role": "user", "parts": [{"text": text[len(prefix):]}]}]
+        }
+
+    async def handle(self, client: GeminiClient, template_name: str, language: str, prefix: str) -> Optional[str]:
+        """
+        Get the handle of a cached prefix, creating or extending it as needed
+
+        Args:
+            client: Gemini client
+            template_name: Prompt template
+            language: Report language
+            prefix: Rendered system prompt (followed by the separator)
+
+        Returns:
+            cachedContents name, or None when caching is unavailable for this prefix
+        """
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        key = (template_name, language, client.model_id, digest)
+        now = time.monotonic()
+        if self._unavailable.get(key, 0) > now:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - now > EXPIRY_GUARD_SECONDS:
+            if entry.expires_at - now < self.refresh_margin_seconds and key not in self._refreshing:
+                self._refreshing.add(key)
+                asyncio.ensure_future(self._refresh(client, key, entry))
+            self.hits += 1
+            return entry.name
+
+        # Expired or never created; concurrent requests share one creation call
+        task = self._creating.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._create(client, key, prefix))
+            self._creating[key] = task
+            task.add_done_callback(lambda t: self._creating.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _create(self, client: GeminiClient, key: PrefixKey, prefix: str) -> Optional[str]:
+        template_name, language, model_id, _ = key
+        started = time.monotonic()
+        body = {
+            "model": f"models/{model_id}",
+            "displayName": f"medvision {template_name} {language}"[:128],
+            # Kept in the user turn, as in the full request, so both paths prompt the model identically
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{int(self.ttl_seconds)}s"
+        }
+        try:
+            created = await client.create_cached_content(body)
+        except GeminiAPIError as e:
+            transient = e.status in RETRYABLE_STATUSES
+            self._unavailable[key] = started + (TRANSIENT_RETRY_SECONDS if transient else self.retry_seconds)
+            if not transient:
+                self.rejected += 1
+            logger.warning(
+                f"Prompt prefix {template_name}/{language} not cached for {model_id}, "
+                f"sending full prompts: {str(e)}"
+            )
+            return None
+        except Exception as e:
+            self._unavailable[key] = started + TRANSIENT_RETRY_SECONDS
+            logger.warning(f"Error caching prompt prefix {template_name}/{language}: {str(e) or type(e).__name__}")
+            return None
+
+        self._entries[key] = CachedPrefix(created["name"], started + self.ttl_seconds)
+        self.created += 1
+        logger.info(f"Cached prompt prefix {template_name}/{language} for {model_id} as {created['name']}")
+        return created["name"]
+
+    async def _refresh(self, client: GeminiClient, key: PrefixKey, entry: CachedPrefix) -> None:
+        started = time.monotonic()
+        try:
+            await client.update_cached_content_ttl(entry.name, self.ttl_seconds)
+            entry.expires_at = started + self.ttl_seconds
+            self.refreshed += 1
+        except GeminiAPIError as e:
+            if e.status in HANDLE_GONE_STATUSES:
+                # Deleted upstream: the next request creates it again
+                self.invalidate(entry.name)
+            logger.warning(f"Error refreshing cached prompt prefix {entry.name}: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Error refreshing cached prompt prefix {entry.name}: {str(e) or type(e).__name__}")
+        finally:
+            self._refreshing.discard(key)
+
+    def invalidate(self, name: str) -> None:
+        """
+        Forget a handle the API no longer accepts
+
+        Args:
+            name: cachedContents name
+        """
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Dict with counters and the cached prefixes
+        """
+        now = time.monotonic()
+        return {
+            "hits": self.hits,
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+            "prefixes": [
+                {
+                    "template": key[0],
+                    "language": key[1],
+                    "model_id": key[2],
+                    "name": entry.name,
+                    "expires_in": round(entry.expires_at - now, 1)
+                }
+                for key, entry in self._entries.items()
+            ],
+            "unavailable": len([until for until in self._unavailable.values() if until > now]),
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+async def generate_content(payload: Dict[str, Any], template_name: str, language: str) -> Dict[str, Any]:
+    """
+    Call generateContent, referencing the cached system prompt when possible
+
+    A request whose handle is gone (expired or deleted upstream: 403/404) is
+    sent again with the full prompt; other errors are raised as they are.
+
+    Args:
+        payload: Full generateContent body (system prompt inline)
+        template_name: Prompt template of the request
+        language: Report language
+
+    Returns:
+        Decoded generateContent response
+    """
+    client = get_gemini_client()
+    cache = get_prompt_cache()
+    cached = await cache.cached_payload(client, payload, template_name, language) if cache is not None else None
+    if cached is not None:
+        try:
+            return await client.generate_content(cached)
+        except GeminiAPIError as e:
+            if e.status not in HANDLE_GONE_STATUSES:
+                raise
+            cache.invalidate(cached["cachedContent"])
+            cache.fallbacks += 1
+            logger.warning(f"Cached prompt prefix rejected ({e.status}), sending the full prompt")
+    return await client.generate_content(payload)
+
+
+async def stream_generate_content(payload: Dict[str, Any], template_name: str, language: str) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of generate_content
+
+    Args:
+        payload: Full generateContent body (system prompt inline)
+        template_name: Prompt template of the request
+        language: Report language
+
+    Yields:
+        Text parts of the streamed report
+    """
+    client = get_gemini_client()
+    cache = get_prompt_cache()
+    cached = await cache.cached_payload(client, payload, template_name, language) if cache is not None else None
+    if cached is not None:
+        streamed = False
+        try:
+            async for text in client.stream_generate_content(cached):
+                streamed = True
+                yield text
+            return
+        except GeminiAPIError as e:
+            # A stream is never replayed once text was sent
+            if streamed or e.status not in HANDLE_GONE_STATUSES:
+                raise
+            cache.invalidate(cached["cachedContent"])
+            cache.fallbacks += 1
+            logger.warning(f"Cached prompt prefix rejected ({e.status}), sending the full prompt")
+    async for text in client.stream_generate_content(payload):
+        yield text
+
+
+_cache: Optional[PromptCache] = None
+_cache_loaded = False
+
+
+def get_prompt_cache() -> Optional[PromptCache]:
+    """Get the process-wide prompt prefix cache, or None when disabled in config.yaml"""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        config = get_prompt_cache_config()
+        if config.get("enabled", False):
+            _cache = PromptCache(
+                ttl_seconds=config.get("ttl_seconds", 3600),
+                refresh_margin_seconds=config.get("refresh_margin_seconds", 600),
+                retry_seconds=config.get("retry_seconds", 3600),
+                languages=config.get("languages", DEFAULT_LANGUAGES)
+            )
+        _cache_loaded = True
+    return _cache
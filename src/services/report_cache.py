@@ -0,0 +1,233 @@
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.utils.config import get_report_cache_config, get_project_root
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCache:
+    """
+    Cache of generated reports keyed by the canonical hash of the Gemini request.
+    Reports are deterministic (temperature 0.0), so identical requests reuse the
+    stored report until it expires. Entries live in a size-bounded in-memory LRU
+    with a TTL and, optionally, in a SQLite database that survives restarts.
+    Concurrent identical requests share a single upstream call.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 86400,
+        max_entries: int = 1000,
+        sqlite_path: Optional[str] = None
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            ttl_seconds: Lifetime of a cached report
+            max_entries: Maximum number of reports kept in each tier
+            sqlite_path: Path of the SQLite database, or None to keep reports in memory only
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.sqlite_path = sqlite_path
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                "key TEXT PRIMARY KEY, report TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS reports_accessed ON reports (accessed_at)")
+            self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        logger.info(f"Report cache initialized (ttl={ttl_seconds}s, max_entries={max_entries}, sqlite={sqlite_path})")
+
+    @staticmethod
+    def request_key(model_id: str, payload: Dict[str, Any]) -> str:
+        """
+        Compute the canonical hash of a Gemini request
+
+        Args:
+            model_id: Model identifier
+            payload: generateContent request body
+
+        Returns:
+            Hex digest of the canonical JSON encoding of the request
+        """
+        canonical = json.dumps(
+            {"model_id": model_id, "payload": payload},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached report
+
+        Args:
+            key: Request key from request_key
+
+        Returns:
+            Report HTML, or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT report, expires_at FROM reports WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute("UPDATE reports SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, report: str) -> None:
+        """
+        Store a report
+
+        Args:
+            key: Request key from request_key
+            report: Report HTML
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, report, expires_at)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO reports (key, report, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, report, expires_at, now)
+                )
+                # Drop expired rows, then the least recently used ones beyond the size bound
+                self._db.execute("DELETE FROM reports WHERE expires_at <= ?", (now,))
+                self._db.execute(
+                    "DELETE FROM reports WHERE key IN ("
+                    "SELECT key FROM reports ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, report: str, expires_at: float) -> None:
+        self._entries[key] = (report, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return the cached report or generate it, coalescing concurrent identical requests
+
+        Args:
+            key: Request key from request_key
+            generate: Coroutine function producing the report; failures are not cached
+
+        Returns:
+            Report HTML
+        """
+        report = await asyncio.to_thread(self.get, key) if self._db is not None else self.get(key)
+        if report is not None:
+            return report
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._generate_and_store(key, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+
+        # Shield so one cancelled caller does not cancel the shared upstream call
+        return await asyncio.shield(task)
+
+    async def _generate_and_store(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        report = await generate()
+        if self._db is not None:
+            await asyncio.to_thread(self.put, key, report)
+        else:
+            self.put(key, report)
+        return report
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache metrics
+
+        Returns:
+            Dict with hit/miss counters and sizes
+        """
+        with self._lock:
+            stored = None
+            if self._db is not None:
+                stored = self._db.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+                "memory_entries": len(self._entries),
+                "sqlite_entries": stored,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+_cache: Optional[ReportCache] = None
+_cache_loaded = False
+
+
+def get_report_cache() -> Optional[ReportCache]:
+    """Get the process-wide report cache, or None when disabled in config.yaml"""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        config = get_report_cache_config()
+        if config.get("enabled", False):
+            sqlite_path = config.get("sqlite_path")
+            if sqlite_path:
+                sqlite_path = get_project_root() / sqlite_path
+                sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+            _cache = ReportCache(
+                ttl_seconds=config.get("ttl_seconds", 86400),
+                max_entries=config.get("max_entries", 1000),
+                sqlite_path=str(sqlite_path) if sqlite_path else None
+            )
+        _cache_loaded = True
+    return _cache
@@ -1,11 +1,143 @@
-import requests
+import asyncio
 import logging
-from typing import Dict, Optional
-from src.utils.config import get_gemini_config, get_system_prompts
+from typing import Any, AsyncIterator, Dict, Optional
+from src.utils.config import get_system_prompt
+from src.services.gemini_client import get_gemini_client
+from src.services.prompt_cache import generate_content, stream_generate_content
+from src.services.report_cache import get_report_cache
+from src.utils.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
-def generate_medical_report(
+def build_report_request(
+    image_context: str,
+    patient_data: Dict[str, str],
+    language: str,
+    prompt_template_name: str
+) -> Dict[str, Any]:
+    """Build the Gemini generateContent payload for a medical report"""
+    with stage_timer("prompt_build"):
+        return _build_report_request(image_context, patient_data, language, prompt_template_name)
+
+def _build_report_request(
+    image_context: str,
+    patient_data: Dict[str, str],
+    language: str,
+    prompt_template_name: str
+) -> Dict[str, Any]:
+    # Select appropriate prompt template (rendered once per template and language)
+    system_prompt = get_system_prompt(prompt_template_name, language)
+    
+    # Build user prompt
+    user_prompt = f"Patient: {patient_data.get('name', 'N/A')}, Age: {patient_data.get('age', 'N/A')}, "
+    user_prompt += f"Gender: {patient_data.get('gender', 'N/A')}. Exam Type: {patient_data.get('exam_type', 'N/A')}. "
+    user_prompt += f"Clinical Context: {patient_data.get('clinical_context', 'N/A')}.\n"
+    user_prompt += f"Image Context: {image_context.strip()}\n"
+    user_prompt += f"Task: Analyze the medical context and generate a report in {language}."
+    
+    # Prepare API request
+    full_prompt = f"{system_prompt}\n\n{user_prompt}"
+    payload = {
+        "contents": [{
+            "role": "user",
+            "parts": [{"text": full_prompt}]
+        }],
+        "generationConfig": {
+            "temperature": 0.0,
+            "maxOutputTokens": 2000,
+            "topP": 0.95,
+            "responseMimeType": "text/plain"
+        }
+    }
+    return payload
+
+def clean_report_text(report_text: str) -> str:
+    """Strip the markdown code fence Gemini wraps around the HTML report"""
+    if report_text.startswith("```html"):
+        report_text = report_text[7:].strip()
+    elif report_text.startswith("```"):
+        report_text = report_text[3:].strip()
+    
+    if report_text.endswith("```"):
+        report_text = report_text[:-3].strip()
+    
+    return report_text
+
+class ReportFenceStripper:
+    """
+    Incremental version of clean_report_text for streamed reports.
+    The opening fence is held back until it can be recognised, and trailing
+    whitespace/backticks are held back until more text proves they are not
+    the closing fence.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._head_done = False
+        self._strip_leading = False
+    
+    def _strip_head(self, final: bool) -> None:
+        if self._head_done:
+            return
+        if not final and len(self._buffer) < 7 and "```html".startswith(self._buffer):
+            # Could still become an opening fence
+            return
+        if self._buffer.startswith("```html"):
+            self._buffer = self._buffer[7:]
+            self._strip_leading = True
+        elif self._buffer.startswith("```"):
+            self._buffer = self._buffer[3:]
+            self._strip_leading = True
+        self._head_done = True
+    
+    def feed(self, chunk: str) -> str:
+        """Add streamed text and return the part that is safe to emit"""
+        self._buffer += chunk
+        self._strip_head(final=False)
+        if not self._head_done:
+            return ""
+        
+        if self._strip_leading:
+            self._buffer = self._buffer.lstrip()
+            if not self._buffer:
+                return ""
+            self._strip_leading = False
+        
+        emit = self._buffer.rstrip(" \t\r\n`")
+        self._buffer = self._buffer[len(emit):]
+        return emit
+    
+    def finish(self) -> str:
+        """Return whatever is left once the stream has ended"""
+        self._strip_head(final=True)
+        tail = self._buffer.strip() if self._strip_leading else self._buffer.rstrip()
+        self._buffer = ""
+        if tail.endswith("```"):
+            tail = tail[:-3].rstrip()
+        return tail
+
+class NoReportContentError(Exception):
+    """Gemini answered without any candidate"""
+
+async def request_report(payload: Dict[str, Any], prompt_template_name: str, language: str) -> str:
+    """Send a report request to Gemini and return the cleaned report"""
+    # Send request to Gemini API through the pooled client (system prompt cached when possible)
+    logger.info("Sending request to Gemini API...")
+    with stage_timer("gemini"):
+        response_data = await generate_content(payload, prompt_template_name, language)
+    
+    # Extract and clean response
+    if "candidates" in response_data and response_data["candidates"]:
+        report_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
+        with stage_timer("response_cleanup"):
+            report_text = clean_report_text(report_text)
+        
+        logger.info("Report generated successfully")
+        return report_text
+    
+    raise NoReportContentError()
+
+async def generate_medical_report(
     image_context: str,
     patient_data: Dict[str, str],
     language: str,
@@ -13,61 +145,61 @@ def generate_medical_report(
 ) -> str:
     """Generate medical report using Gemini API"""
     try:
-        config = get_gemini_config()
-        system_prompts = get_system_prompts()
+        payload = build_report_request(
+            image_context, patient_data, language, prompt_template_name
+        )
         
-        # Select appropriate prompt template
-        template = system_prompts.get(prompt_template_name, system_prompts["General Medical Analysis"])
-        system_prompt = template.format(language=language)
-        
-        # Build user prompt
-        user_prompt = f"Patient: {patient_data.get('name', 'N/A')}, Age: {patient_data.get('age', 'N/A')}, "
-        user_prompt += f"Gender: {patient_data.get('gender', 'N/A')}. Exam Type: {patient_data.get('exam_type', 'N/A')}. "
-        user_prompt += f"Clinical Context: {patient_data.get('clinical_context', 'N/A')}.\n"
-        user_prompt += f"Image Context: {image_context.strip()}\n"
-        user_prompt += f"Task: Analyze the medical context and generate a report in {language}."
-        
-        # Prepare API request
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
-        api_url = f"{config['base_url']}/{config['model_id']}:generateContent?key={config['api_key']}"
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "contents": [{
-                "role": "user",
-                "parts": [{"text": full_prompt}]
-            }],
-            "generationConfig": {
-                "temperature": 0.0,
-                "maxOutputTokens": 2000,
-                "topP": 0.95,
-                "responseMimeType": "text/plain"
-            }
-        }
+        cache = get_report_cache()
+        if cache is None:
+            return await request_report(payload, prompt_template_name, language)
         
-        # Send request to Gemini API
-        logger.info("Sending request to Gemini API...")
-        response = requests.post(api_url, headers=headers, json=payload)
-        response.raise_for_status()
+        # Identical requests are deterministic: reuse or share the upstream call
+        key = cache.request_key(get_gemini_client().model_id, payload)
+        return await cache.get_or_generate(key, lambda: request_report(payload, prompt_template_name, language))
         
-        # Extract and clean response
-        response_data = response.json()
-        if "candidates" in response_data and response_data["candidates"]:
-            report_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            
-            # Clean markdown markers
-            if report_text.startswith("```html"):
-                report_text = report_text[7:].strip()
-            elif report_text.startswith("```"):
-                report_text = report_text[3:].strip()
-            
-            if report_text.endswith("```"):
-                report_text = report_text[:-3].strip()
-                
-            logger.info("Report generated successfully")
-            return report_text
-            
+    except NoReportContentError:
         return "Error: No content returned from Gemini API"
-        
     except Exception as e:
         logger.error(f"Report generation error: {str(e)}")
-        return f"Error during report generation: {str(e)}"
\ No newline at end of file
+        return f"Error during report generation: {str(e)}"
+
+async def generate_medical_report_stream(
+    image_context: str,
+    patient_data: Dict[str, str],
+    language: str,
+    prompt_template_name: str
+) -> AsyncIterator[str]:
+    """Generate medical report using the Gemini streaming API, yielding cleaned HTML chunks"""
+    payload = build_report_request(
+        image_context, patient_data, language, prompt_template_name
+    )
+    client = get_gemini_client()
+    
+    cache = get_report_cache()
+    key = cache.request_key(client.model_id, payload) if cache is not None else None
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            yield cached
+            return
+    
+    stripper = ReportFenceStripper()
+    chunks = []
+    
+    logger.info("Streaming request to Gemini API...")
+    # The whole stream counts as the Gemini round-trip; cleanup is incremental
+    with stage_timer("gemini"):
+        async for text in stream_generate_content(payload, prompt_template_name, language):
+            chunk = stripper.feed(text)
+            if chunk:
+                chunks.append(chunk)
+                yield chunk
+    
+    tail = stripper.finish()
+    if tail:
+        chunks.append(tail)
+        yield tail
+    logger.info("Report streamed successfully")
+    
+    if cache is not None and chunks:
+        await asyncio.to_thread(cache.put, key, "".join(chunks))
@@ -0,0 +1,268 @@
+"""
+Similar prior studies: pooled study vectors of persisted sessions.
+
+Sessions analysed through the job queue are added to the index as they are
+saved. Sessions stored before the index existed (or imported with
+src.utils.session_migration) are indexed from their image blobs with:
+
+Usage:
+    python -m src.services.similarity --backfill
+"""
+import os
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import get_project_root, get_similarity_config
+from src.models.vector_index import VectorIndex, normalize
+
+if TYPE_CHECKING:
+    from PIL import Image
+    from src.models.vision_result import VisionResult
+
+logger = logging.getLogger(__name__)
+
+_indexes: Dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def study_vector(results: List["VisionResult"]) -> np.ndarray:
+    """
+    Summarise a study as one unit vector
+
+    Args:
+        results: Vision results of the study's images (not yet released)
+
+    Returns:
+        Normalised mean of the normalised pooled features of every image
+    """
+    return normalize(np.mean([normalize(result.pooled) for result in results], axis=0))
+
+
+def get_similarity_index(identity: str, dim: int, create: bool = True) -> Optional[VectorIndex]:
+    """
+    Get the index of study vectors produced by a model
+
+    Vectors of different models (weights, precision, preprocessing, backend)
+    are not comparable, so every model identity and vector dimension has its
+    own index directory.
+
+    Args:
+        identity: Model identity (model.identity)
+        dim: Dimension of the study vectors (model.feature_dim)
+        create: Create the index when it does not exist yet
+
+    Returns:
+        VectorIndex, or None when disabled in config.yaml (or, without create, not created yet)
+    """
+    config = get_similarity_config()
+    if not config.get("enabled", False):
+        return None
+
+    key = f"{identity}|{dim}"
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            root = get_project_root() / config.get("index_dir", "data/similarity")
+            directory = root / hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+            if not create and not (directory / "index.json").exists():
+                return None
+            index = VectorIndex(
+                str(directory),
+                dim,
+                ivf_threshold=config.get("ivf_threshold", 50000),
+                nlist=config.get("nlist"),
+                nprobe=config.get("nprobe", 16),
+                rerank=config.get("rerank", 100)
+            )
+            with open(directory / "model.txt", "w", encoding="utf-8") as f:
+                f.write(key)
+            _indexes[key] = index
+        return index
+
+
+def index_study(session_id: str, results: List["VisionResult"], identity: str) -> None:
+    """
+    Add a session's study vector to the index (failures are logged, never raised)
+
+    Args:
+        session_id: Session identifier the study is saved under
+        results: Vision results of the study's images (not yet released)
+        identity: Identity of the model that produced them
+    """
+    try:
+        vector = study_vector(results)
+        index = get_similarity_index(identity, len(vector))
+        if index is not None:
+            index.add(session_id, vector)
+    except Exception as e:
+        logger.error(f"Error indexing session {session_id}: {str(e)}")
+
+
+def encode_study(images: List["Image.Image"]) -> Tuple[np.ndarray, str]:
+    """
+    Compute the study vector of images with the default model
+
+    Args:
+        images: Decoded PIL images
+
+    Returns:
+        Tuple of (study vector, model identity)
+    """
+    from src.models.registry import get_model_registry
+
+    model = get_model_registry().get()
+    results = model.process_images_batch(images)
+    try:
+        return study_vector(results), model.identity
+    finally:
+        for result in results:
+            result.release()
+
+
+def current_identity() -> Tuple[str, int]:
+    """Identity and study vector dimension of the default model (loading it if needed)"""
+    from src.models.registry import get_model_registry
+
+    model = get_model_registry().get()
+    return model.identity, model.feature_dim
+
+
+def find_similar(
+    vector: np.ndarray,
+    identity: str,
+    k: int = 10,
+    exclude: Tuple[str, ...] = ()
+) -> Dict[str, Any]:
+    """
+    Find the stored studies most similar to a study vector
+
+    Args:
+        vector: Study vector (see study_vector)
+        identity: Identity of the model that produced it
+        k: Number of studies
+        exclude: Session ids left out of the results
+
+    Returns:
+        Dict with the matching session summaries (most similar first, with
+        their cosine "score"), the search time and the index size and mode
+    """
+    index = get_similarity_index(identity, len(vector))
+    if index is None:
+        raise RuntimeError("Similar-study search is disabled")
+
+    start = time.perf_counter()
+    hits = index.search(vector, k, exclude)
+    search_ms = (time.perf_counter() - start) * 1000
+
+    from src.utils.session_manager import get_session_manager
+
+    # Deleted sessions are dropped here rather than removed from the index
+    summaries = get_session_manager().get_summaries([session_id for session_id, _ in hits])
+    return {
+        "results": [
+            {**summaries[session_id], "score": score}
+            for session_id, score in hits
+            if session_id in summaries
+        ],
+        "search_ms": search_ms,
+        "index": {"vectors": len(index), "mode": index.mode}
+    }
+
+
+def find_similar_to_session(session_id: str, k: int = 10) -> Optional[Dict[str, Any]]:
+    """
+    Find the studies most similar to an indexed session
+
+    Args:
+        session_id: Session identifier
+        k: Number of studies (the session itself is excluded)
+
+    Returns:
+        find_similar result, or None when the session is not indexed
+    """
+    identity, dim = current_identity()
+    index = get_similarity_index(identity, dim, create=False)
+    vector = index.get(session_id) if index is not None else None
+    if vector is None:
+        return None
+    return find_similar(vector, identity, k, exclude=(session_id,))
+
+
+def backfill(limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Index stored sessions that have images but no study vector yet
+
+    Args:
+        limit: Maximum number of sessions to index
+
+    Returns:
+        Counts of indexed, skipped and failed sessions
+    """
+    from src.services.ingestion import decode_images
+    from src.utils.session_manager import get_session_manager
+
+    manager = get_session_manager()
+    counts = {"indexed": 0, "skipped": 0, "failed": 0}
+    index = None
+    cursor = None
+    while True:
+        page = manager.query_sessions(limit=200, cursor=cursor)
+        for summary in page["sessions"]:
+            session_id = summary["session_id"]
+            if summary["image_count"] == 0 or (index is not None and session_id in index):
+                counts["skipped"] += 1
+                continue
+            try:
+                contents = []
+                for image_hash in manager.get_session(session_id)["images"]:
+                    with open(manager.blob_path(image_hash), "rb") as f:
+                        contents.append(f.read())
+                if not contents:
+                    counts["skipped"] += 1
+                    continue
+                vector, identity = encode_study(decode_images(contents))
+                index = get_similarity_index(identity, len(vector))
+                if index is None:
+                    raise RuntimeError("Similar-study search is disabled")
+                if session_id in index:
+                    counts["skipped"] += 1
+                    continue
+                index.add(session_id, vector)
+                counts["indexed"] += 1
+            except Exception as e:
+                logger.error(f"Error indexing session {session_id}: {str(e)}")
+                counts["failed"] += 1
+            if limit is not None and counts["indexed"] >= limit:
+                return counts
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    if index is not None:
+        index.flush()
+    logger.info(f"Similar-study backfill finished: {counts}")
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="index stored sessions missing from the index")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of sessions to index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.backfill:
+        parser.print_help()
+        return
+    counts = backfill(args.limit)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
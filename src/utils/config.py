@@ -1,11 +1,24 @@
 import os
+import time
+import signal
+import logging
+import threading
 import yaml
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def get_config_path() -> Path:
+    """Get the configuration file: $MEDVISION_CONFIG when set, otherwise config.yaml in the project root"""
+    override = os.getenv("MEDVISION_CONFIG")
+    if override:
+        return Path(override)
+    return Path(__file__).parent.parent.parent / "config.yaml"
 
 def load_config() -> Dict[str, Any]:
     """Load application configuration from YAML file"""
-    config_path = Path(__file__).parent.parent.parent / "config.yaml"
+    config_path = get_config_path()
     if not config_path.exists():
         raise FileNotFoundError(f"Configuration file not found at {config_path}")
     
@@ -17,34 +30,181 @@ def get_project_root() -> Path:
     """Get the project root directory"""
     return Path(__file__).parent.parent.parent
 
+class AppConfig:
+    """
+    Parsed-once view of config.yaml.
+    The file is parsed on first use and again only when its modification time
+    changes (checked at most once per check_interval seconds), after
+    mark_stale() (the SIGHUP handler) or when reload() is called. Rendered
+    system prompts are memoized per (template, language) until the next reload.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        """
+        Initialize the config holder
+
+        Args:
+            check_interval: Minimum seconds between two modification time checks
+        """
+        self.path = get_config_path()
+        self.check_interval = check_interval
+        self.data: Dict[str, Any] = {}
+        self.version = 0
+        self._mtime_ns: Optional[int] = None
+        self._next_check = 0.0
+        self._prompts: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def reload(self) -> None:
+        """Parse config.yaml again and drop memoized prompts"""
+        with self._lock:
+            self._mtime_ns = os.stat(self.path).st_mtime_ns if self.path.exists() else None
+            self.data = load_config()
+            self._prompts = {}
+            self.version += 1
+            self._next_check = time.monotonic() + self.check_interval
+        if self.version > 1:
+            logger.info(f"Reloaded configuration from {self.path}")
+
+    def mark_stale(self) -> None:
+        """Make the next get() parse config.yaml again (safe in a signal handler: takes no lock)"""
+        self._mtime_ns = None
+        self._next_check = 0.0
+
+    def get(self) -> Dict[str, Any]:
+        """Get the parsed configuration, reloading it if the file changed"""
+        now = time.monotonic()
+        if self.version == 0:
+            self.reload()
+        elif now >= self._next_check:
+            self._next_check = now + self.check_interval
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns != self._mtime_ns:
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Keep serving the last good configuration
+                    logger.error(f"Configuration reload failed: {str(e)}")
+        return self.data
+
+    def system_prompt(self, template_name: str, language: str, default: str) -> str:
+        """Render a system prompt template, memoized per (template, language)"""
+        data = self.get()
+        key = (template_name, language)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            templates = data['system_prompts']
+            template = templates.get(template_name, templates[default])
+            prompt = template.format(language=language)
+            # language comes from the request form: keep the memo bounded
+            if len(self._prompts) >= 256:
+                self._prompts = {}
+            self._prompts[key] = prompt
+        return prompt
+
+_app_config = AppConfig()
+
+def get_config() -> Dict[str, Any]:
+    """Get the memoized application configuration"""
+    return _app_config.get()
+
+def reload_config() -> None:
+    """Force config.yaml to be parsed again"""
+    _app_config.reload()
+
+def install_reload_signal_handler() -> bool:
+    """Reload config.yaml on SIGHUP (main thread only, POSIX only)"""
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return False
+    # The handler runs on the main (event loop) thread, possibly inside reload() holding
+    # its lock: it only flags the config, the next get() parses the file
+    signal.signal(signal.SIGHUP, lambda signum, frame: _app_config.mark_stale())
+    return True
+
 def get_checkpoints_dir() -> Path:
     """Get checkpoints directory path"""
-    config = load_config()
+    config = get_config()
     return get_project_root() / config['project']['checkpoints_dir']
 
 def get_minigpt_checkpoint() -> Path:
     """Get MiniGPT checkpoint path"""
-    config = load_config()
+    config = get_config()
     return get_checkpoints_dir() / config['project']['minigpt_checkpoint']
 
-def get_gemini_config() -> Dict[str, str]:
+def get_model_config() -> Dict[str, Any]:
+    """Get vision model runtime configuration"""
+    config = get_config()
+    return config.get('model', {})
+
+def get_server_config() -> Dict[str, Any]:
+    """Get API server configuration"""
+    config = get_config()
+    return config.get('server', {})
+
+def get_ingestion_config() -> Dict[str, Any]:
+    """Get upload ingestion limits"""
+    config = get_config()
+    return config.get('ingestion', {})
+
+def get_gemini_config() -> Dict[str, Any]:
     """Get Gemini API configuration"""
-    config = load_config()
+    config = get_config()
     gemini_config = config['api']['gemini'].copy()
     gemini_config['api_key'] = os.getenv("GEMINI_API_KEY")
     return gemini_config
 
+def get_report_cache_config() -> Dict[str, Any]:
+    """Get report cache configuration"""
+    config = get_config()
+    return config.get('report_cache', {})
+
+def get_prompt_cache_config() -> Dict[str, Any]:
+    """Get Gemini prompt prefix cache configuration"""
+    config = get_config()
+    return config.get('prompt_cache', {})
+
+def get_session_config() -> Dict[str, Any]:
+    """Get session store configuration"""
+    config = get_config()
+    return config.get('sessions', {})
+
+def get_jobs_config() -> Dict[str, Any]:
+    """Get analysis job queue configuration"""
+    config = get_config()
+    return config.get('jobs', {})
+
+def get_bulk_config() -> Dict[str, Any]:
+    """Get bulk upload configuration"""
+    config = get_config()
+    return config.get('bulk', {})
+
+def get_similarity_config() -> Dict[str, Any]:
+    """Get similar-study index configuration"""
+    config = get_config()
+    return config.get('similarity', {})
+
 def get_system_prompts() -> Dict[str, str]:
     """Get system prompt templates"""
-    config = load_config()
+    config = get_config()
     return config['system_prompts']
 
+def get_system_prompt(
+    template_name: str,
+    language: str,
+    default: str = "General Medical Analysis"
+) -> str:
+    """Get a rendered system prompt, falling back to the default template"""
+    return _app_config.system_prompt(template_name, language, default)
+
 def get_ui_config() -> Dict[str, Any]:
     """Get UI configuration"""
-    config = load_config()
+    config = get_config()
     return config['ui']
 
 def get_logging_config() -> Dict[str, Any]:
     """Get logging configuration"""
-    config = load_config()
-    return config['logging']
\ No newline at end of file
+    config = get_config()
+    return config['logging']
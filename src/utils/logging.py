@@ -1,6 +1,18 @@
+import uuid
 import logging
+from contextvars import ContextVar
 from .config import get_logging_config
 
+# Trace id of the request being handled ("-" outside requests), added to every log record
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
+class TraceIdFilter(logging.Filter):
+    """Attach the current trace id to log records as %(trace_id)s"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
 def setup_logging():
     """Configure logging based on application config"""
     config = get_logging_config()
@@ -8,4 +20,38 @@ def setup_logging():
         level=config['level'],
         format=config['format']
     )
-    return logging.getLogger(__name__)
\ No newline at end of file
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+    return logging.getLogger(__name__)
+
+class TraceIdMiddleware:
+    """
+    Per-request trace id: taken from the client's header when present, echoed
+    back, added to every log line. Plain ASGI (not @app.middleware("http")) so
+    the request body can still be read while a streamed response is sent.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        logging_config = get_logging_config()
+        if scope["type"] != "http" or not logging_config.get("trace_ids", False):
+            await self.app(scope, receive, send)
+            return
+        
+        header = logging_config.get("trace_header", "X-Request-ID").lower().encode("latin-1")
+        received = dict(scope["headers"]).get(header, b"").decode("latin-1")
+        trace_id = received[:64] or uuid.uuid4().hex[:16]
+        
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                headers = [(name, value) for name, value in message.get("headers", []) if name.lower() != header]
+                message = {**message, "headers": headers + [(header, trace_id.encode("latin-1"))]}
+            await send(message)
+        
+        token = trace_id_var.set(trace_id)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            trace_id_var.reset(token)
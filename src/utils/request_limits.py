@@ -0,0 +1,66 @@
+import logging
+from typing import Iterable
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from .config import get_ingestion_config
+
+logger = logging.getLogger(__name__)
+
+# Room for the form fields and part headers on top of the image bytes
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Caps multipart/form-data bodies at ingestion.max_request_mb before they are
+    parsed. Starlette spools File(...) uploads to temporary files before the
+    endpoint runs, so the per-file caps of read_uploads only apply afterwards.
+    A larger declared Content-Length gets a 413 before anything is read;
+    bodies without one (chunked) are cut off with a 413 once they pass the cap.
+    """
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ()):
+        """
+        Args:
+            app: ASGI application
+            exclude_paths: Paths that stream their own bodies under their own caps
+        """
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        max_request_mb = get_ingestion_config().get("max_request_mb", 200)
+        max_bytes = int(max_request_mb * 1024 * 1024) + FORM_OVERHEAD_BYTES
+        detail = f"Request exceeds {int(max_request_mb)} MB of images"
+
+        declared = headers.get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > max_bytes:
+            logger.warning(f"Upload rejected: {detail} (Content-Length {int(declared)})")
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    logger.warning(f"Upload rejected: {detail}")
+                    # Raised inside form parsing, answered as a 413 by FastAPI
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -1,162 +1,448 @@
 import os
 import json
+import base64
+import sqlite3
+import hashlib
 import logging
-import shutil
+import threading
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+from src.utils.config import get_project_root, get_session_config
 
 logger = logging.getLogger(__name__)
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    exam_type TEXT NOT NULL DEFAULT '',
+    patient TEXT NOT NULL DEFAULT '',
+    patient_info TEXT NOT NULL DEFAULT '{}',
+    image_count INTEGER NOT NULL DEFAULT 0,
+    request TEXT,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (timestamp, session_id);
+CREATE INDEX IF NOT EXISTS sessions_exam_type ON sessions (exam_type, timestamp, session_id);
+CREATE INDEX IF NOT EXISTS sessions_patient ON sessions (patient, timestamp, session_id);
+CREATE TABLE IF NOT EXISTS session_images (
+    session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (session_id, position)
+);
+CREATE INDEX IF NOT EXISTS session_images_hash ON session_images (hash);
+"""
+
+# Columns returned by list_sessions (no request/results JSON is parsed for listings)
+SUMMARY_COLUMNS = "session_id, timestamp, exam_type, patient_info, image_count"
+
+
+def encode_cursor(timestamp: str, session_id: str) -> str:
+    """Encode the position after a listed session as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, session_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        timestamp, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), str(session_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def summary_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Session summary from a row of SUMMARY_COLUMNS"""
+    return {
+        "session_id": row["session_id"],
+        "timestamp": row["timestamp"],
+        "patient_info": json.loads(row["patient_info"]),
+        "exam_type": row["exam_type"],
+        "image_count": row["image_count"]
+    }
+
+
+def patient_key(patient_info: Dict[str, Any]) -> str:
+    """Indexed patient column: the patient id when present, otherwise the name"""
+    return str(patient_info.get("id") or patient_info.get("name") or "")
+
+
 class SessionManager:
     """
     Manages session data for MedVisionAI, including saving and retrieving
     session information, requests, and results.
+    Sessions are rows of a SQLite database in WAL mode, indexed by timestamp,
+    exam type and patient, so listings are paginated index scans. Image blobs
+    are stored once on disk under their SHA-256 and referenced by hash.
     """
-    
-    def __init__(self, data_dir: str = "data/sessions"):
+
+    def __init__(self, db_path: str = "data/sessions.sqlite3", blob_dir: str = "data/blobs"):
         """
         Initialize the session manager
-        
+
         Args:
-            data_dir: Directory to store session data
+            db_path: Path of the SQLite database
+            blob_dir: Directory of content-addressed image blobs
         """
-        self.data_dir = data_dir
-        os.makedirs(data_dir, exist_ok=True)
-        logger.info(f"Session manager initialized with data directory: {data_dir}")
-    
-    def create_session(self, session_id: str) -> str:
+        self.db_path = db_path
+        self.blob_dir = blob_dir
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(blob_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # WAL lets readers (listings) proceed while a session is being written
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        logger.info(f"Session manager initialized with database {db_path} and blob directory {blob_dir}")
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._db.close()
+
+    def create_session(self, session_id: str, timestamp: Optional[str] = None) -> str:
         """
-        Create a new session directory
-        
+        Create a new, empty session
+
         Args:
             session_id: Unique session identifier
-            
+            timestamp: ISO timestamp of the session (defaults to now)
+
         Returns:
-            Path to the session directory
+            The session identifier
         """
-        session_dir = os.path.join(self.data_dir, session_id)
-        os.makedirs(session_dir, exist_ok=True)
-        logger.info(f"Created session directory: {session_dir}")
-        return session_dir
-    
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, timestamp) VALUES (?, ?)",
+                (session_id, timestamp or datetime.now().isoformat())
+            )
+        logger.info(f"Created session {session_id}")
+        return session_id
+
     def save_request(self, session_id: str, request_data: Dict[str, Any]) -> None:
         """
-        Save request data for a session
-        
+        Save request data for a session, creating the session if needed
+
         Args:
             session_id: Session identifier
-            request_data: Request data to save
-        """
-        session_dir = os.path.join(self.data_dir, session_id)
-        request_file = os.path.join(session_dir, "request.json")
-        
-        with open(request_file, "w") as f:
-            json.dump(request_data, f, indent=2)
-        
+            request_data: Request data to save (timestamp, patient_info, exam_type, ...)
+        """
+        patient_info = request_data.get("patient_info", {}) or {}
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (session_id, timestamp, exam_type, patient, patient_info, image_count, request) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET timestamp = excluded.timestamp, "
+                "exam_type = excluded.exam_type, patient = excluded.patient, "
+                "patient_info = excluded.patient_info, request = excluded.request, "
+                "image_count = MAX(sessions.image_count, excluded.image_count)",
+                (
+                    session_id,
+                    request_data.get("timestamp") or datetime.now().isoformat(),
+                    request_data.get("exam_type", "") or "",
+                    patient_key(patient_info),
+                    json.dumps(patient_info),
+                    len(request_data.get("image_paths", [])),
+                    json.dumps(request_data)
+                )
+            )
+
         logger.info(f"Saved request data for session {session_id}")
-    
+
     def save_results(self, session_id: str, results: List[Dict[str, Any]]) -> None:
         """
         Save analysis results for a session
-        
+
         Args:
             session_id: Session identifier
             results: Analysis results to save
         """
-        session_dir = os.path.join(self.data_dir, session_id)
-        results_file = os.path.join(session_dir, "results.json")
-        
-        with open(results_file, "w") as f:
-            json.dump(results, f, indent=2)
-        
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (session_id, timestamp, results) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET results = excluded.results",
+                (session_id, datetime.now().isoformat(), json.dumps(results))
+            )
+
         logger.info(f"Saved results for session {session_id}")
-    
+
+    def blob_path(self, image_hash: str) -> str:
+        """
+        Get the on-disk path of an image blob
+
+        Args:
+            image_hash: SHA-256 hex digest of the image bytes
+
+        Returns:
+            Path of the blob file
+        """
+        return os.path.join(self.blob_dir, image_hash[:2], image_hash)
+
+    def _write_blob(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def save_image(self, session_id: str, data: bytes) -> str:
+        """
+        Store an image blob and attach it to a session
+
+        Args:
+            session_id: Session identifier
+            data: Encoded image bytes as uploaded
+
+        Returns:
+            SHA-256 hex digest referencing the blob
+        """
+        image_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(image_hash)
+        if not os.path.exists(path):
+            self._write_blob(path, data)
+
+        with self._lock, self._db:
+            # delete_session removes orphaned blobs under the lock: one may have gone
+            # since the check above, and is written again before it is referenced
+            if not os.path.exists(path):
+                self._write_blob(path, data)
+            self._db.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, timestamp) VALUES (?, ?)",
+                (session_id, datetime.now().isoformat())
+            )
+            position = self._db.execute(
+                "SELECT COUNT(*) FROM session_images WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO session_images (session_id, position, hash) VALUES (?, ?, ?)",
+                (session_id, position, image_hash)
+            )
+            self._db.execute(
+                "UPDATE sessions SET image_count = MAX(image_count, ?) WHERE session_id = ?",
+                (position + 1, session_id)
+            )
+        return image_hash
+
+    def has_session(self, session_id: str) -> bool:
+        """
+        Check whether a session exists
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            True if the session is stored
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """
         Get all data for a session
-        
+
         Args:
             session_id: Session identifier
-            
+
         Returns:
             Session data or None if not found
         """
-        session_dir = os.path.join(self.data_dir, session_id)
-        if not os.path.exists(session_dir):
-            logger.warning(f"Session directory not found: {session_dir}")
+        with self._lock:
+            row = self._db.execute(
+                "SELECT timestamp, request, results FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            images = [
+                r["hash"] for r in self._db.execute(
+                    "SELECT hash FROM session_images WHERE session_id = ? ORDER BY position", (session_id,)
+                )
+            ]
+        if row is None:
+            logger.warning(f"Session not found: {session_id}")
             return None
-        
-        request_file = os.path.join(session_dir, "request.json")
-        results_file = os.path.join(session_dir, "results.json")
-        
+
         session_data = {
             "session_id": session_id,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": row["timestamp"],
+            "images": images
         }
-        
-        if os.path.exists(request_file):
-            with open(request_file, "r") as f:
-                session_data["request"] = json.load(f)
-        
-        if os.path.exists(results_file):
-            with open(results_file, "r") as f:
-                session_data["results"] = json.load(f)
-        
+        if row["request"] is not None:
+            session_data["request"] = json.loads(row["request"])
+        if row["results"] is not None:
+            session_data["results"] = json.loads(row["results"])
+
         return session_data
-    
-    def list_sessions(self) -> List[Dict[str, Any]]:
+
+    def get_summaries(self, session_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the listing summary of several sessions in one query
+
+        Args:
+            session_ids: Session identifiers
+
+        Returns:
+            Dict of session id to summary; unknown ids are left out
+        """
+        if not session_ids:
+            return {}
+        placeholders = ",".join("?" * len(session_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM sessions WHERE session_id IN ({placeholders})", list(session_ids)
+            ).fetchall()
+        return {row["session_id"]: summary_from_row(row) for row in rows}
+
+    def query_sessions(
+        self,
+        limit: Optional[int] = 50,
+        cursor: Optional[str] = None,
+        exam_type: Optional[str] = None,
+        patient: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        List sessions newest first, one page at a time
+
+        Args:
+            limit: Maximum sessions per page (None for all remaining sessions)
+            cursor: next_cursor of the previous page
+            exam_type: Only sessions of this exam type
+            patient: Only sessions of this patient (id, or name when no id was given)
+            since: Only sessions with a timestamp >= this ISO timestamp
+            until: Only sessions with a timestamp < this ISO timestamp
+
+        Returns:
+            Dict with the page of sessions and the cursor of the next page (None on the last page)
         """
-        List all sessions with basic information
-        
+        clauses, params = [], []
+        if exam_type is not None:
+            clauses.append("exam_type = ?")
+            params.append(exam_type)
+        if patient is not None:
+            clauses.append("patient = ?")
+            params.append(patient)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if cursor is not None:
+            # Keyset pagination: stable under concurrent inserts and O(page) per call
+            clauses.append("(timestamp, session_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC, session_id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(1, limit) + 1)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > max(1, limit):
+            rows = rows[:max(1, limit)]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["session_id"])
+
+        return {
+            "sessions": [summary_from_row(row) for row in rows],
+            "next_cursor": next_cursor
+        }
+
+    def list_sessions(
+        self,
+        exam_type: Optional[str] = None,
+        patient: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        List all sessions with basic information, newest first
+
+        Args:
+            exam_type: Only sessions of this exam type
+            patient: Only sessions of this patient
+            since: Only sessions with a timestamp >= this ISO timestamp
+            until: Only sessions with a timestamp < this ISO timestamp
+
         Returns:
             List of session data
         """
-        sessions = []
-        
-        if not os.path.exists(self.data_dir):
-            logger.warning(f"Data directory not found: {self.data_dir}")
-            return sessions
-        
-        for session_id in os.listdir(self.data_dir):
-            session_dir = os.path.join(self.data_dir, session_id)
-            if os.path.isdir(session_dir):
-                request_file = os.path.join(session_dir, "request.json")
-                if os.path.exists(request_file):
-                    with open(request_file, "r") as f:
-                        request_data = json.load(f)
-                    
-                    sessions.append({
-                        "session_id": session_id,
-                        "timestamp": request_data.get("timestamp", ""),
-                        "patient_info": request_data.get("patient_info", {}),
-                        "exam_type": request_data.get("exam_type", ""),
-                        "image_count": len(request_data.get("image_paths", []))
-                    })
-        
-        # Sort by timestamp (newest first)
-        sessions.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        
-        return sessions
-    
+        return self.query_sessions(
+            limit=None, exam_type=exam_type, patient=patient, since=since, until=until
+        )["sessions"]
+
     def delete_session(self, session_id: str) -> bool:
         """
-        Delete a session and all its data
-        
+        Delete a session and the image blobs no other session references
+
         Args:
             session_id: Session identifier
-            
+
         Returns:
             True if successful, False otherwise
         """
-        session_dir = os.path.join(self.data_dir, session_id)
-        if not os.path.exists(session_dir):
-            logger.warning(f"Session directory not found: {session_dir}")
-            return False
-        
         try:
-            shutil.rmtree(session_dir)
+            with self._lock:
+                with self._db:
+                    hashes = [
+                        r["hash"] for r in self._db.execute(
+                            "SELECT DISTINCT hash FROM session_images WHERE session_id = ?", (session_id,)
+                        )
+                    ]
+                    deleted = self._db.execute(
+                        "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+                    ).rowcount
+                    orphans = [
+                        h for h in hashes
+                        if self._db.execute(
+                            "SELECT 1 FROM session_images WHERE hash = ? LIMIT 1", (h,)
+                        ).fetchone() is None
+                    ]
+                # Removed (once committed) before the lock is released, so a concurrent
+                # save_image of the same bytes cannot reference a blob about to go
+                for image_hash in orphans:
+                    try:
+                        os.remove(self.blob_path(image_hash))
+                    except FileNotFoundError:
+                        pass
+
+            if not deleted:
+                logger.warning(f"Session not found: {session_id}")
+                return False
+
             logger.info(f"Deleted session {session_id}")
             return True
         except Exception as e:
             logger.error(f"Error deleting session {session_id}: {str(e)}")
             return False
+
+
+_manager: Optional[SessionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """Get the process-wide session manager configured in config.yaml"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            config = get_session_config()
+            root = get_project_root()
+            _manager = SessionManager(
+                db_path=str(root / config.get("db_path", "data/sessions.sqlite3")),
+                blob_dir=str(root / config.get("blob_dir", "data/blobs"))
+            )
+        return _manager
@@ -0,0 +1,110 @@
+"""
+Import directory-based sessions into the SQLite session store.
+
+Each data/sessions/<session_id>/ directory holds a request.json and an
+optional results.json. Images listed in request.json "image_paths" that
+still exist (absolute, relative to the session directory or to the project
+root) are copied into the content-addressed blob store. Sessions already in
+the database are skipped unless --overwrite is given; the directories are
+left untouched.
+
+Usage:
+    python -m src.utils.session_migration --source data/sessions
+"""
+import os
+import json
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.utils.config import get_project_root, get_session_config
+from src.utils.session_manager import SessionManager, get_session_manager
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_image_path(image_path: str, session_dir: str) -> Optional[str]:
+    """Find a legacy image on disk, or None when it no longer exists"""
+    for candidate in (image_path, os.path.join(session_dir, image_path), str(get_project_root() / image_path)):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def migrate_sessions(source_dir: str, manager: SessionManager, overwrite: bool = False) -> Dict[str, int]:
+    """
+    Import every session directory under source_dir
+
+    Args:
+        source_dir: Directory of legacy session directories
+        manager: Destination session manager
+        overwrite: Import sessions that already exist in the database again
+
+    Returns:
+        Counts of imported, skipped and failed sessions and of imported images
+    """
+    counts = {"imported": 0, "skipped": 0, "failed": 0, "images": 0, "missing_images": 0}
+    if not os.path.isdir(source_dir):
+        logger.warning(f"Legacy session directory not found: {source_dir}")
+        return counts
+
+    for session_id in sorted(os.listdir(source_dir)):
+        session_dir = os.path.join(source_dir, session_id)
+        if not os.path.isdir(session_dir):
+            continue
+        if not overwrite and manager.has_session(session_id):
+            counts["skipped"] += 1
+            continue
+
+        try:
+            request_file = os.path.join(session_dir, "request.json")
+            results_file = os.path.join(session_dir, "results.json")
+            if overwrite and manager.has_session(session_id):
+                manager.delete_session(session_id)
+
+            request_data = {}
+            if os.path.exists(request_file):
+                with open(request_file, "r") as f:
+                    request_data = json.load(f)
+            if not request_data.get("timestamp"):
+                # Directory mtime is the best remaining guess for old sessions
+                request_data["timestamp"] = datetime.fromtimestamp(os.path.getmtime(session_dir)).isoformat()
+            manager.save_request(session_id, request_data)
+
+            if os.path.exists(results_file):
+                with open(results_file, "r") as f:
+                    manager.save_results(session_id, json.load(f))
+
+            for image_path in request_data.get("image_paths", []):
+                resolved = resolve_image_path(image_path, session_dir)
+                if resolved is None:
+                    counts["missing_images"] += 1
+                    continue
+                with open(resolved, "rb") as f:
+                    manager.save_image(session_id, f.read())
+                counts["images"] += 1
+
+            counts["imported"] += 1
+        except Exception as e:
+            logger.error(f"Error migrating session {session_id}: {str(e)}")
+            counts["failed"] += 1
+
+    logger.info(f"Session migration from {source_dir} finished: {counts}")
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=None, help="legacy session directory (defaults to sessions.legacy_dir)")
+    parser.add_argument("--overwrite", action="store_true", help="re-import sessions already in the database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = args.source or str(get_project_root() / get_session_config().get("legacy_dir", "data/sessions"))
+    counts = migrate_sessions(source, get_session_manager(), overwrite=args.overwrite)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
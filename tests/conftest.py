@@ -0,0 +1,160 @@
+"""
+Shared fixtures.
+
+gemini_stub starts benchmarks/gemini_stub.py on a free port in a background
+thread. app_config points the parsed config.yaml at a tiny randomly
+initialised CLIP vision tower, an empty checkpoint and temporary data
+directories, with the report and prompt caches off so every request reaches
+the stub. analysis_app serves src.main.app against a stub with TestClient
+(startup and shutdown events included).
+"""
+import json
+import asyncio
+import threading
+import contextlib
+import urllib.request
+from typing import Any, Dict
+
+import pytest
+from aiohttp import web
+
+from benchmarks.gemini_stub import build_app
+
+
+class StubServer:
+    """Gemini stub served by aiohttp on its own event loop thread"""
+
+    def __init__(self, **options: Any):
+        self.options = options
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gemini-stub", daemon=True)
+        self.runner = None
+        self.port = None
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+        return self
+
+    async def _start(self) -> None:
+        self.runner = web.AppRunner(build_app(**self.options), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0, shutdown_timeout=1.0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    @property
+    def base_url(self) -> str:
+        """Value for api.gemini.base_url"""
+        return f"http://127.0.0.1:{self.port}/v1beta/models"
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters from the stub's GET /stats"""
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+    async def _stop(self) -> None:
+        await self.runner.cleanup()
+        # Handlers of requests the client gave up on (timeouts) may still be sleeping
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+        self.loop.close()
+
+
+@pytest.fixture
+def gemini_stub():
+    """Start Gemini stubs with build_app options; they are stopped after the test"""
+    servers = []
+
+    def start(**options: Any) -> StubServer:
+        server = StubServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture(scope="session")
+def tiny_vision_model(tmp_path_factory):
+    """Directory of a one-layer CLIP vision tower and an empty MiniGPT-Med checkpoint"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    directory = tmp_path_factory.mktemp("vision")
+    config = transformers.CLIPVisionConfig(
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=1,
+        num_attention_heads=4,
+        image_size=224,
+        patch_size=32
+    )
+    transformers.CLIPVisionModel(config).save_pretrained(directory / "clip")
+    transformers.CLIPImageProcessor(
+        size={"shortest_edge": 224},
+        crop_size={"height": 224, "width": 224}
+    ).save_pretrained(directory / "clip")
+    # No vision weights: the model keeps the tower's initial weights
+    torch.save({}, directory / "minigpt-med.pth")
+    return directory
+
+
+@pytest.fixture(scope="session")
+def app_config(tiny_vision_model, tmp_path_factory):
+    """Parsed config.yaml adjusted for tests, restored at the end of the session"""
+    from src.utils.config import get_config
+
+    config = get_config()
+    data_dir = tmp_path_factory.mktemp("data")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setitem(config["project"], "checkpoints_dir", str(tiny_vision_model))
+        patch.setitem(config["project"], "minigpt_checkpoint", "minigpt-med.pth")
+        patch.setitem(config["model"], "backend", "torch")
+        patch.setitem(config["model"], "device", "cpu")
+        patch.setitem(config["model"], "clip_model", str(tiny_vision_model / "clip"))
+        patch.setitem(config["model"], "worker_pool", {"enabled": False})
+        patch.setitem(config["model"], "embedding_cache", {"enabled": False})
+        patch.setitem(config, "report_cache", {"enabled": False})
+        patch.setitem(config, "prompt_cache", {"enabled": False})
+        patch.setitem(config["sessions"], "db_path", str(data_dir / "sessions.sqlite3"))
+        patch.setitem(config["sessions"], "blob_dir", str(data_dir / "blobs"))
+        patch.setitem(config["sessions"], "legacy_dir", str(data_dir / "sessions"))
+        patch.setitem(config["similarity"], "index_dir", str(data_dir / "similarity"))
+        yield config
+
+
+@pytest.fixture
+def analysis_app(app_config, monkeypatch):
+    """Serve the app against a Gemini stub: `with analysis_app(stub, max_concurrency=2) as client`"""
+    from fastapi.testclient import TestClient
+
+    from src.services import gemini_client, jobs, prompt_cache, report_cache
+
+    # Process-wide singletons are built from the config of the test using them
+    monkeypatch.setattr(gemini_client, "_client", None)
+    monkeypatch.setattr(jobs, "_queue", None)
+    monkeypatch.setattr(report_cache, "_cache_loaded", False)
+    monkeypatch.setattr(prompt_cache, "_cache_loaded", False)
+
+    @contextlib.contextmanager
+    def serve(stub: StubServer, **gemini: Any):
+        gemini_config = app_config["api"]["gemini"]
+        monkeypatch.setitem(gemini_config, "base_url", stub.base_url)
+        for key, value in gemini.items():
+            monkeypatch.setitem(gemini_config, key, value)
+
+        from src.main import app
+
+        with TestClient(app) as client:
+            yield client
+
+    return serve
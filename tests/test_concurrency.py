@@ -0,0 +1,73 @@
+"""
+/analyze keeps the event loop free: vision inference runs on the bounded
+executor and the Gemini calls of concurrent requests overlap on the shared,
+pooled client, up to api.gemini.max_concurrency at a time.
+"""
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from src.services import gemini_client
+
+REQUESTS = 6
+LATENCY_S = 0.5
+
+
+def analyze(client, index: int):
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (index * 40 % 256, 90, 30)).save(buffer, "PNG")
+    return client.post(
+        "/analyze",
+        files=[("images", (f"study-{index}.png", buffer.getvalue(), "image/png"))],
+        data={
+            "patient_name": f"Patient {index}",
+            "patient_age": "54",
+            "patient_gender": "F",
+            "exam_type": "X-ray",
+            "language": "en",
+            "prompt_template": "General Medical Analysis",
+            "clinical_context": "Concurrency test"
+        }
+    )
+
+
+def analyze_in_parallel(client, count: int):
+    # The first request loads the model; only the parallel ones are timed
+    assert analyze(client, 0).status_code == 200
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        responses = list(pool.map(lambda index: analyze(client, index), range(1, count + 1)))
+    elapsed = time.perf_counter() - start
+
+    for response in responses:
+        assert response.status_code == 200
+        assert "Findings" in response.json()["report"]
+    return elapsed
+
+
+def test_parallel_requests_take_about_one_gemini_latency(gemini_stub, analysis_app):
+    stub = gemini_stub(latency_ms=LATENCY_S * 1000)
+    with analysis_app(stub, max_concurrency=REQUESTS) as client:
+        elapsed = analyze_in_parallel(client, REQUESTS)
+
+    # Serialised calls would take REQUESTS * LATENCY_S (3 s)
+    assert LATENCY_S <= elapsed < REQUESTS * LATENCY_S / 2
+    assert stub.stats()["max_in_flight"] == REQUESTS
+
+
+def test_gemini_calls_share_one_pooled_client_under_the_cap(gemini_stub, analysis_app):
+    stub = gemini_stub(latency_ms=LATENCY_S * 1000)
+    with analysis_app(stub, max_concurrency=2) as client:
+        elapsed = analyze_in_parallel(client, REQUESTS)
+        shared = gemini_client.get_gemini_client()
+        assert shared.max_concurrency == 2
+
+    stats = stub.stats()
+    assert stats["requests"] == REQUESTS + 1
+    assert stats["max_in_flight"] == 2
+    # Keep-alive connections of the one client are reused instead of one per request
+    assert stats["connections"] <= 2
+    # Three rounds of two calls
+    assert elapsed >= REQUESTS / 2 * LATENCY_S
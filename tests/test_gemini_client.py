@@ -0,0 +1,122 @@
+"""GeminiClient retries, timeouts, concurrency limit and streaming against the local stub"""
+import time
+import asyncio
+
+import pytest
+
+from benchmarks.gemini_stub import REPORT_HTML
+from src.services.gemini_client import GeminiAPIError, GeminiClient
+
+PAYLOAD = {"contents": [{"role": "user", "parts": [{"text": "Describe the study"}]}]}
+
+
+def make_client(stub, **options) -> GeminiClient:
+    # Long random backoff: a test only stays fast when Retry-After is honoured
+    settings = {"max_retries": 3, "backoff_base": 5.0, "backoff_max": 5.0, **options}
+    return GeminiClient(stub.base_url, api_key="test-key", model_id="stub-model", **settings)
+
+
+async def call(client: GeminiClient, coroutine):
+    try:
+        return await coroutine
+    finally:
+        await client.close()
+
+
+async def stream_text(client: GeminiClient, received: list) -> None:
+    async for text in client.stream_generate_content(PAYLOAD):
+        received.append(text)
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_429_and_5xx_after_retry_after(gemini_stub, status):
+    stub = gemini_stub(latency_ms=0, fail_first=2, error_status=status, retry_after=0.2)
+    client = make_client(stub)
+
+    start = time.perf_counter()
+    response = asyncio.run(call(client, client.generate_content(PAYLOAD)))
+    elapsed = time.perf_counter() - start
+
+    assert REPORT_HTML in response["candidates"][0]["content"]["parts"][0]["text"]
+    assert stub.stats()["requests"] == 3
+    # Two waits of Retry-After (0.2 s), not the up-to-5 s jittered backoff
+    assert 0.4 <= elapsed < 2.0
+
+
+def test_raises_once_retries_are_exhausted(gemini_stub):
+    stub = gemini_stub(latency_ms=0, fail_first=10, error_status=503, retry_after=0)
+    client = make_client(stub, max_retries=2)
+
+    with pytest.raises(GeminiAPIError) as error:
+        asyncio.run(call(client, client.generate_content(PAYLOAD)))
+
+    assert error.value.status == 503
+    assert stub.stats()["requests"] == 3
+
+
+@pytest.mark.parametrize("status", [400, 403, 404])
+def test_does_not_retry_4xx(gemini_stub, status):
+    stub = gemini_stub(latency_ms=0, fail_first=10, error_status=status, retry_after=0)
+    client = make_client(stub)
+
+    with pytest.raises(GeminiAPIError) as error:
+        asyncio.run(call(client, client.generate_content(PAYLOAD)))
+
+    assert error.value.status == status
+    assert stub.stats()["requests"] == 1
+
+
+def test_read_timeout(gemini_stub):
+    stub = gemini_stub(latency_ms=3000)
+    client = make_client(stub, read_timeout=0.3, max_retries=0)
+
+    start = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call(client, client.generate_content(PAYLOAD)))
+
+    assert time.perf_counter() - start < 2.0
+
+
+def test_concurrency_is_capped_at_max_concurrency(gemini_stub):
+    stub = gemini_stub(latency_ms=200)
+    client = make_client(stub, max_concurrency=3)
+
+    async def burst():
+        return await asyncio.gather(*[client.generate_content(PAYLOAD) for _ in range(9)])
+
+    start = time.perf_counter()
+    responses = asyncio.run(call(client, burst()))
+    elapsed = time.perf_counter() - start
+
+    stats = stub.stats()
+    assert len(responses) == 9
+    assert stats["max_in_flight"] == 3
+    assert stats["connections"] <= 3
+    # Three rounds of three calls
+    assert elapsed >= 0.6
+
+
+def test_stream_is_retried_before_the_first_event(gemini_stub):
+    stub = gemini_stub(latency_ms=0, fail_first=1, error_status=503, retry_after=0)
+    client = make_client(stub)
+
+    received = []
+    asyncio.run(call(client, stream_text(client, received)))
+
+    assert "".join(received) == f"```html\n{REPORT_HTML}\n```"
+    assert stub.stats()["requests"] == 2
+
+
+def test_stream_is_not_replayed_once_started(gemini_stub):
+    # Two events, then silence past the read timeout
+    stub = gemini_stub(latency_ms=0, stream_chunks=8, stall_after_chunks=2, stall_ms=2000)
+    client = make_client(stub, read_timeout=0.3)
+
+    received = []
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call(client, stream_text(client, received)))
+
+    stats = stub.stats()
+    assert len(received) == 2
+    assert stats["requests"] == 1
+    assert stats["streams"] == 1
@@ -0,0 +1,59 @@
+"""Queued analysis jobs against the Gemini stub"""
+import io
+
+from PIL import Image
+
+from src.services import jobs
+
+FORM = {
+    "patient_name": "Patient",
+    "patient_age": "61",
+    "patient_gender": "M",
+    "exam_type": "CT",
+    "language": "en",
+    "prompt_template": "General Medical Analysis",
+    "clinical_context": "Job test"
+}
+
+
+def submit(client):
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (120, 60, 200)).save(buffer, "PNG")
+    response = client.post(
+        "/jobs",
+        files=[("images", ("study.png", buffer.getvalue(), "image/png"))],
+        data=FORM
+    )
+    assert response.status_code == 202
+    return response.json()
+
+
+def wait_for(client, job_id: str):
+    response = client.get(f"/jobs/{job_id}", params={"wait": 20})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_report_failure_fails_the_job_and_allows_a_retry(gemini_stub, analysis_app):
+    # 400 is not retried by the client: the first report request fails for good
+    stub = gemini_stub(latency_ms=0, fail_first=1, error_status=400)
+    with analysis_app(stub) as client:
+        first = submit(client)
+        failed = wait_for(client, first["job_id"])
+        assert failed["status"] == jobs.JOB_FAILED
+        assert failed["result"] is None
+        assert "400" in failed["error"]
+
+        queue = jobs.get_job_queue()
+        assert first["job_id"] not in queue._by_key.values()
+        assert queue.stats()["failed"] == 1
+
+        # The identical submission runs again instead of reusing the failure
+        second = submit(client)
+        assert not second["deduplicated"]
+        assert second["job_id"] != first["job_id"]
+        done = wait_for(client, second["job_id"])
+        assert done["status"] == jobs.JOB_DONE
+        assert "Findings" in done["result"]["report"]
+
+    assert stub.stats()["requests"] == 2
@@ -0,0 +1,71 @@
+"""The exported ONNX graph served by onnx_backend matches the torch path"""
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+TOLERANCE = 1e-4
+
+
+@pytest.fixture(scope="module")
+def models(tiny_vision_model, tmp_path_factory):
+    """The fp32 eager torch model and the OnnxMiniGPTMedModel exported from it"""
+    from src.models.minigpt_med import MiniGPTMedModel
+    from src.models.onnx_backend import OnnxMiniGPTMedModel
+    from src.models.onnx_export import export_onnx
+
+    torch_model = MiniGPTMedModel(
+        str(tiny_vision_model / "minigpt-med.pth"),
+        device="cpu",
+        precision="fp32",
+        graph_mode="eager",
+        clip_model=str(tiny_vision_model / "clip")
+    )
+    onnx_path = tmp_path_factory.mktemp("onnx") / "minigpt-med.onnx"
+    export_onnx(torch_model, str(onnx_path))
+    return torch_model, OnnxMiniGPTMedModel(str(onnx_path), max_batch_size=4)
+
+
+def make_images(count: int):
+    rng = np.random.default_rng(0)
+    sizes = [(320, 240), (224, 224), (180, 400), (512, 512), (640, 360)]
+    return [
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+        for width, height in (sizes[i % len(sizes)] for i in range(count))
+    ]
+
+
+def test_graph_matches_torch_projection(models):
+    import torch
+
+    torch_model, onnx_model = models
+    # A batch size different from the export example exercises the dynamic axis
+    pixel_values = onnx_model.preprocess_images(make_images(3))
+    with torch.no_grad():
+        reference = torch_model.projection.project(
+            torch_model.vision_encoder.encode_pixel_values(torch.from_numpy(pixel_values))
+        ).numpy()
+    candidate = onnx_model.encode_pixel_values(pixel_values)
+
+    assert candidate.shape == reference.shape
+    np.testing.assert_allclose(candidate, reference, rtol=0, atol=TOLERANCE)
+
+
+def test_backend_results_match_torch_results(models):
+    torch_model, onnx_model = models
+    images = make_images(6)
+
+    reference = torch_model.process_images_batch(images, use_cache=False)
+    candidate = onnx_model.process_images_batch(images, use_cache=False)
+
+    assert len(candidate) == len(reference)
+    assert onnx_model.feature_dim == reference[0].embedding_shape[-1]
+    for expected, result in zip(reference, candidate):
+        assert (result.width, result.height) == (expected.width, expected.height)
+        assert result.embedding_shape == expected.embedding_shape
+        expected_embeddings = expected.embeddings.float().numpy()
+        # Both backends keep fp16 results (before and after the projection respectively)
+        scale = np.abs(expected_embeddings).max()
+        np.testing.assert_allclose(result.embeddings, expected_embeddings, rtol=0, atol=2e-3 * scale)
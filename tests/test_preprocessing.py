@@ -0,0 +1,57 @@
+"""BatchPreprocessor matches CLIPImageProcessor on mixed sizes and modes"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.models.preprocessing import BatchPreprocessor
+
+# Landscape, portrait, square, larger than the crop and smaller than it
+SIZES = [(448, 448), (512, 384), (300, 600), (1024, 768), (200, 150), (160, 240)]
+MODES = ["RGB", "L", "RGBA"]
+TOLERANCE = 1e-4
+
+
+def make_images():
+    rng = np.random.default_rng(0)
+    images = []
+    for i, (width, height) in enumerate(SIZES * len(MODES)):
+        # Smooth gradients plus noise, closer to scans than pure noise
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 25, (height, width, 4)).astype(np.float32)
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        mode = MODES[i // len(SIZES)]
+        image = Image.fromarray(pixels, "RGBA")
+        images.append(image if mode == "RGBA" else image.convert(mode))
+    return images
+
+
+@pytest.fixture(scope="module")
+def processor(tiny_vision_model):
+    transformers = pytest.importorskip("transformers")
+    return transformers.CLIPImageProcessor.from_pretrained(tiny_vision_model / "clip")
+
+
+@pytest.mark.parametrize("batch_size", [1, 5, 18])
+def test_matches_clip_image_processor(processor, batch_size):
+    preprocessor = BatchPreprocessor.from_hf_processor(processor)
+    images = make_images()
+
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        reference = processor(images=batch, return_tensors="np").pixel_values
+        candidate = preprocessor(batch)
+
+        assert candidate.shape == reference.shape
+        assert candidate.dtype == np.float32
+        np.testing.assert_allclose(candidate, reference, rtol=0, atol=TOLERANCE)
+
+
+def test_output_is_not_reused_across_calls(processor):
+    preprocessor = BatchPreprocessor.from_hf_processor(processor)
+    images = make_images()
+
+    first = preprocessor(images[:4])
+    kept = first.copy()
+    preprocessor(images[4:8])
+
+    np.testing.assert_array_equal(first, kept)